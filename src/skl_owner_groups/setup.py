@@ -40,11 +40,17 @@ setup(
     zip_safe=False,
     extras_require={
         'testing': tests_require,
+        'redis': ['redis'],
+        'xlsx': ['openpyxl'],
     },
     install_requires=requires,
     entry_points={
         'fanstatic.libraries': [
             'skl_owner_groups = skl_owner_groups.fanstatic_lib:library',
         ],
+        'console_scripts': [
+            'skl_benchmark = skl_owner_groups.benchmark:main',
+            'skl_reconcile_vote_counters = skl_owner_groups.counters:main',
+        ],
     },
 )
@@ -2,7 +2,11 @@
 
 def includeme(config):
     config.include('.resources')
+    config.include('.counters')
     config.include('.models')
+    config.include('.analyzers')
+    config.include('.results')
+    config.include('.participants')
     config.include('.portlet')
     config.include('.schemas')
     config.include('.fanstatic_lib')
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+""" Category analyzers count the categorized votes for each proposal in a poll.
+    Ranked methods are summarised with pairwise preferences instead.
+    They're named adapters for polls, where the name is the poll plugin they understand.
+"""
+from __future__ import unicode_literals
+
+from abc import ABCMeta
+from abc import abstractmethod
+from collections import Counter
+
+from pyramid.threadlocal import get_current_registry
+from six import add_metaclass
+from voteit.core.models.interfaces import IPoll
+from zope.component import adapter
+from zope.interface import implementer
+
+from skl_owner_groups.interfaces import ICategoryAnalyzer
+from skl_owner_groups.interfaces import IPairwiseAnalyzer
+
+
+def ballot_weights(categorized):
+    """ Turn category -> checksum -> count into checksum -> Counter with category -> count.
+        The Counter will also contain 'total'.
+    """
+    weights = {}
+    for (cat, votemap) in categorized.items():
+        for (checksum, count) in votemap.items():
+            counter = weights.setdefault(checksum, Counter())
+            counter[cat] += count
+            counter['total'] += count
+    return weights
+
+
+def count_supported(hashed, categorized, supported):
+    """ Count the categorized votes for each proposal in one pass over the distinct ballots.
+
+        hashed and categorized are the same as analyze_vote_distribution returns,
+        supported is a function that returns the proposal uids a ballot supports.
+
+        Returns a dict with proposal uid -> Counter with category -> votes and 'total'.
+    """
+    results = {}
+    for (checksum, weights) in ballot_weights(categorized).items():
+        for uid in supported(hashed[checksum]):
+            counter = results.get(uid, None)
+            if counter is None:
+                counter = results[uid] = Counter()
+            counter.update(weights)
+    return results
+
+
+def get_category_analyzer(poll, registry=None):
+    """ Returns the analyzer for this polls method or None. """
+    if registry is None:
+        registry = get_current_registry()
+    return registry.queryAdapter(poll, ICategoryAnalyzer, name=poll.poll_plugin)
+
+
+def get_pairwise_analyzer(poll, registry=None):
+    """ Returns the pairwise analyzer for this polls method or None. """
+    if registry is None:
+        registry = get_current_registry()
+    return registry.queryAdapter(poll, IPairwiseAnalyzer, name=poll.poll_plugin)
+
+
+def can_analyze(poll, registry=None):
+    """ Is there any kind of analyzer for this polls method? """
+    return get_category_analyzer(poll, registry) is not None or get_pairwise_analyzer(poll, registry) is not None
+
+
+@implementer(ICategoryAnalyzer)
+@adapter(IPoll)
+@add_metaclass(ABCMeta)
+class CategoryAnalyzer(object):
+    """ Base class for analyzers. Subclasses must implement supported. """
+    name = ''
+    title = ''
+
+    def __init__(self, context):
+        self.context = context
+
+    @abstractmethod
+    def supported(self, vote_data):
+        """ Returns the proposal uids the ballot supports. """
+
+    def __call__(self, hashed, categorized):
+        return count_supported(hashed, categorized, self.supported)
+
+
+class CombinedSimpleAnalyzer(CategoryAnalyzer):
+    name = 'combined_simple'
+    title = "Godkända förslag"
+
+    def supported(self, vote_data):
+        return [uid for (uid, value) in vote_data.items() if value == 'approve']
+
+
+class MajorityPollAnalyzer(CategoryAnalyzer):
+    name = 'majority_poll'
+    title = "Förslaget rösten gäller"
+
+    def supported(self, vote_data):
+        uid = vote_data.get('proposal', None)
+        return uid and [uid] or []
+
+
+class DuttAnalyzer(CategoryAnalyzer):
+    """ Dutt ballots contain the proposals the voter picked. """
+    name = 'dutt'
+    title = "Valda förslag"
+
+    def supported(self, vote_data):
+        return list(vote_data.get('proposals', ()))
+
+
+@implementer(IPairwiseAnalyzer)
+@adapter(IPoll)
+class RankedAnalyzer(object):
+    """ Base for ranked methods. Counting votes per proposal would only show first preferences,
+        so these compute the categorized pairwise preferences instead.
+
+        Ballots may contain an ordered list of uids, where the first one is preferred,
+        or a dict with uid -> grade. higher_is_better decides how the grades are sorted.
+    """
+    name = ''
+    title = "Parvisa preferenser"
+    higher_is_better = True
+
+    def __init__(self, context):
+        self.context = context
+
+    def ranking(self, vote_data):
+        """ Returns a list of sets of uids, the most preferred first. Uids in the same set are tied. """
+        proposals = vote_data.get('proposals', vote_data)
+        if isinstance(proposals, dict):
+            grades = {}
+            for (uid, grade) in proposals.items():
+                grades.setdefault(grade, set()).add(uid)
+            return [grades[x] for x in sorted(grades, reverse=self.higher_is_better)]
+        return [{uid} for uid in proposals]
+
+    def __call__(self, hashed, categorized):
+        """ Proposals that aren't ranked on a ballot are considered worse than all ranked ones.
+            Tied proposals aren't preferred over each other.
+        """
+        all_uids = set(self.context.proposals)
+        results = {}
+        for (checksum, weights) in ballot_weights(categorized).items():
+            ranking = self.ranking(hashed[checksum])
+            below = set(all_uids)
+            for tier in ranking:
+                below -= tier
+                for a in tier:
+                    for b in below:
+                        counter = results.get((a, b), None)
+                        if counter is None:
+                            counter = results[(a, b)] = Counter()
+                        counter.update(weights)
+        return results
+
+
+class SchulzeAnalyzer(RankedAnalyzer):
+    name = 'schulze'
+
+
+class STVAnalyzer(RankedAnalyzer):
+    name = 'stv'
+
+
+def includeme(config):
+    for analyzer in (CombinedSimpleAnalyzer, MajorityPollAnalyzer, DuttAnalyzer, SchulzeAnalyzer, STVAnalyzer):
+        config.registry.registerAdapter(analyzer, name=analyzer.name)
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks for the voting hot path.
+
+    Builds an in-memory meeting the size of an SKR congress, with all kommuner and regioner
+    from the data folder, some delegations, a closed presence check and a poll where everyone votes.
+    Reports operations per second, ZODB object loads and the peak memory allocated by each step.
+
+    bin/skl_benchmark
+    bin/skl_benchmark --save-baseline benchmark.json
+    bin/skl_benchmark --baseline benchmark.json
+
+    When a baseline is given, the exit code will be 1 if something got slower or loads
+    more objects than the tolerance allows.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import resource
+import sys
+import time
+
+import transaction
+from pyramid import testing
+from pyramid.request import apply_request_extensions
+from voteit.core.models.agenda_item import AgendaItem
+from voteit.core.models.meeting import Meeting
+from voteit.core.models.poll import Poll
+from voteit.core.models.proposal import Proposal
+from voteit.core.testing_helpers import bootstrap_and_fixture
+from voteit.irl.models.interfaces import IMeetingPresence
+from ZODB import DB
+from ZODB.MappingStorage import MappingStorage
+
+from skl_owner_groups.interfaces import GROUPS_NAME
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    # Python 2, the growth of the max RSS is used instead
+    tracemalloc = None
+
+
+DEFAULT_VOTERS = 300
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.2
+# Every n:th kommun delegates its vote to a region
+_DELEGATE_EVERY = 30
+
+
+class VotingBenchmark(object):
+
+    def __init__(self, voters=DEFAULT_VOTERS, repeat=DEFAULT_REPEAT):
+        self.voters = voters
+        self.repeat = repeat
+        self.results = {}
+
+    def setup(self):
+        self.config = testing.setUp()
+        self.config.include('arche.testing')
+        self.config.include('arche.testing.catalog')
+        self.config.include('arche.models.reference_guard')
+        self.config.include('voteit.core.helpers')
+        self.config.include('voteit.core.plugins.majority_poll')
+        self.config.include('voteit.irl.models.meeting_presence')
+        self.config.include('skl_owner_groups.resources')
+        self.config.include('skl_owner_groups.models')
+        self.config.include('skl_owner_groups.analyzers')
+        self.db = DB(MappingStorage())
+        self.conn = self.db.open()
+        root = bootstrap_and_fixture(self.config)
+        self.conn.root()['app_root'] = root
+        self.request = self._mk_request(root)
+        root['m'] = meeting = Meeting()
+        meeting['ai'] = ai = AgendaItem()
+        ai['p1'] = Proposal(text="Ett")
+        ai['p2'] = Proposal(text="Två")
+        ai['poll'] = poll = Poll(poll_plugin='majority_poll')
+        poll.proposals = (ai['p1'].uid, ai['p2'].uid)
+        transaction.commit()
+        self.root = root
+        self.meeting = meeting
+        self.poll = poll
+
+    def teardown(self):
+        transaction.abort()
+        self.conn.close()
+        self.db.close()
+        testing.tearDown()
+
+    def _mk_request(self, context, userid=None):
+        self.config.testing_securitypolicy(userid=userid, permissive=True)
+        request = testing.DummyRequest()
+        request.context = context
+        apply_request_extensions(request)
+        self.config.begin(request)
+        return request
+
+    def create_groups(self):
+        from skl_owner_groups.models import create_groups
+        self.meeting[GROUPS_NAME] = groups = self.request.content_factories['VGroups']()
+        create_groups(groups, self.request)
+        return groups
+
+    def populate(self):
+        """ Owners for all groups, some delegations and a closed presence check. """
+        from skl_owner_groups.models import update_skl_vote_power
+        groups = self.create_groups()
+        for group in groups.values():
+            group.owner = 'owner_%s' % group.__name__
+        regions = sorted(x.__name__ for x in groups.values() if x.category == 'region')
+        kommuner = sorted(x.__name__ for x in groups.values() if x.category == 'kommun')
+        for (i, name) in enumerate(kommuner[::_DELEGATE_EVERY]):
+            groups.delegate_vote_to(name, regions[i % len(regions)])
+        voters = [x.owner for x in groups.values() if not groups.has_delegated_to(x.__name__)]
+        self.voter_ids = sorted(voters)[:self.voters]
+        presence = IMeetingPresence(self.meeting)
+        presence.start_check()
+        for userid in self.voter_ids:
+            presence.add(userid)
+        presence.end_check()
+        update_skl_vote_power(groups)
+        transaction.commit()
+        self.groups = groups
+
+    def measure(self, name, func, ops=1, repeat=None):
+        """ Runs func once with a cold cache to count object loads and memory, and then
+            'repeat' times with a warm cache to measure speed.
+            func may return a number of seconds to use instead of the total time.
+        """
+        if repeat is None:
+            repeat = self.repeat
+        transaction.commit()
+        self.conn.cacheMinimize()
+        self.conn.getTransferCounts(True)
+        memory = _start_memory_trace()
+        timings = [self._timed(func)]
+        peak_memory_kb = _stop_memory_trace(memory)
+        transaction.commit()
+        loads, stores = self.conn.getTransferCounts(True)
+        for i in range(repeat - 1):
+            timings.append(self._timed(func))
+        best = min(timings)
+        self.results[name] = {
+            'ops_per_sec': ops / best if best else 0,
+            'loads': loads,
+            'stores': stores,
+            'peak_memory_kb': peak_memory_kb,
+        }
+
+    def _timed(self, func):
+        start = time.time()
+        elapsed = func()
+        if elapsed is None:
+            elapsed = time.time() - start
+        return elapsed
+
+    def bench_add_votes(self):
+        """ Everyone votes, multiply_and_categorize_votes will create the extra votes. """
+        poll = self.poll
+        vote_cls = poll.get_poll_plugin().get_vote_class()
+        proposals = poll.proposals
+
+        def _add_votes():
+            elapsed = 0
+            for (i, userid) in enumerate(self.voter_ids):
+                self._mk_request(self.meeting, userid)
+                vote = vote_cls(creators=[userid])
+                vote.set_vote_data({'proposal': proposals[i % 2]}, notify=False)
+                start = time.time()
+                poll[userid] = vote
+                elapsed += time.time() - start
+            return elapsed
+
+        # Votes can only be added once
+        self.measure('multiply_and_categorize_votes (add)', _add_votes, ops=len(self.voter_ids), repeat=1)
+
+    def bench_change_votes(self):
+        poll = self.poll
+        proposals = poll.proposals
+        state = {'round': 0}
+
+        def _change_votes():
+            state['round'] += 1
+            elapsed = 0
+            for (i, userid) in enumerate(self.voter_ids):
+                self._mk_request(self.meeting, userid)
+                start = time.time()
+                poll[userid].set_vote_data({'proposal': proposals[(i + state['round']) % 2]})
+                elapsed += time.time() - start
+            return elapsed
+
+        self.measure('multiply_and_categorize_votes (change)', _change_votes,
+                     ops=len(self.voter_ids), repeat=2)
+
+    def bench_total_vote_power(self):
+        from skl_owner_groups.models import get_total_categorized_vote_power
+        self.measure('get_total_categorized_vote_power',
+                     lambda: get_total_categorized_vote_power(self.groups))
+
+    def bench_analyze_vote_distribution(self):
+        from skl_owner_groups.models import analyze_vote_distribution
+        self.measure('analyze_vote_distribution', lambda: analyze_vote_distribution(self.poll))
+
+    def bench_category_vote_count(self):
+        from skl_owner_groups.views.category_votes import CategoryVotes
+        request = self._mk_request(self.poll, 'owner_skl')
+
+        def _vote_count():
+            view = CategoryVotes(self.poll, request)
+            view()
+            for uid in self.poll.proposals:
+                view.vote_count(uid)
+
+        self.measure('CategoryVotes.vote_count', _vote_count, ops=len(self.poll.proposals))
+
+    def bench_get_voters(self):
+        from skl_owner_groups.models import RepresentativesAsVoters
+        self.measure('RepresentativesAsVoters.get_voters',
+                     lambda: list(RepresentativesAsVoters(self.meeting).get_voters()))
+
+    def bench_create_groups(self):
+        """ Creating all groups one by one with an added event each, compared to Groups.add_groups. """
+        from skl_owner_groups.refdata import get_reference_data
+        factory = self.request.content_factories['VGroup']
+        items = [('skl', 'SKR', 'skl')] + list(get_reference_data().iter_groups())
+        state = {'count': 0}
+
+        def _new_groups():
+            state['count'] += 1
+            self.root['bench_%s' % state['count']] = meeting = Meeting()
+            meeting[GROUPS_NAME] = groups = self.request.content_factories['VGroups']()
+            return groups
+
+        def _one_by_one():
+            groups = _new_groups()
+            start = time.time()
+            for (key, title, category) in items:
+                groups[key] = factory(title=title, category=category)
+            return time.time() - start
+
+        def _bulk():
+            groups = _new_groups()
+            start = time.time()
+            groups.add_groups([(key, factory(title=title, category=category))
+                               for (key, title, category) in items])
+            return time.time() - start
+
+        self.measure('create groups (one by one)', _one_by_one, ops=len(items))
+        self.measure('create groups (add_groups)', _bulk, ops=len(items))
+
+    def run(self):
+        self.setup()
+        try:
+            self.populate()
+            self.bench_get_voters()
+            self.bench_total_vote_power()
+            self.bench_add_votes()
+            self.bench_change_votes()
+            self.bench_analyze_vote_distribution()
+            self.bench_category_vote_count()
+            # Adds meetings to the root, so it's run last
+            self.bench_create_groups()
+        finally:
+            self.teardown()
+        return self.results
+
+
+def _start_memory_trace():
+    if tracemalloc is not None:
+        tracemalloc.start()
+        return
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _stop_memory_trace(started):
+    """ Returns the peak memory allocated since _start_memory_trace in kB.
+        Without tracemalloc it's how much the max RSS of the process grew, which is 0 if
+        the step stayed below the peak of an earlier step.
+    """
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak // 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - started, 0)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """ Returns a list of messages about everything that got worse than the baseline allows. """
+    regressions = []
+    for (name, current) in sorted(results.items()):
+        base = baseline.get(name, None)
+        if base is None:
+            continue
+        if current['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append("%s: %.1f ops/sec, baseline %.1f" % (name, current['ops_per_sec'], base['ops_per_sec']))
+        if current['loads'] > base['loads'] * (1 + tolerance):
+            regressions.append("%s: %s object loads, baseline %s" % (name, current['loads'], base['loads']))
+    return regressions
+
+
+def print_results(results, out=sys.stdout):
+    print("%-45s %12s %8s %8s %12s" % ('', 'ops/sec', 'loads', 'stores', 'peak kB'), file=out)
+    for (name, result) in sorted(results.items()):
+        print("%-45s %12.1f %8d %8d %12d" % (name, result['ops_per_sec'], result['loads'],
+                                             result['stores'], result['peak_memory_kb']), file=out)
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description="Benchmark the voting hot path with an SKR sized meeting.")
+    parser.add_argument('--voters', type=int, default=DEFAULT_VOTERS)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--baseline', help="Compare with results stored in this file")
+    parser.add_argument('--save-baseline', help="Store the results in this file")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed difference from the baseline, default %s" % DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    results = VotingBenchmark(voters=args.voters, repeat=args.repeat).run()
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        for msg in regressions:
+            print("REGRESSION: %s" % msg)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+""" Live vote counters in Redis, so the progress bar of ongoing polls can be read
+    without touching the database.
+
+    The counters are set when a poll starts and updated after each successful commit
+    that adds or removes votes. If Redis restarts or a key expires, the counters
+    are missing until they're synced again. To sync all ongoing polls, run:
+
+    bin/skl_reconcile_vote_counters etc/production.ini
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import logging
+import sys
+from collections import Counter
+
+import transaction
+from pyramid.threadlocal import get_current_registry
+from voteit.core.models.interfaces import IAgendaItem
+from voteit.core.models.interfaces import IMeeting
+from voteit.core.models.interfaces import IPoll
+from voteit.core.models.interfaces import IVote
+from zope.interface import implementer
+
+from skl_owner_groups.interfaces import IVoteCounters
+from skl_owner_groups.tally import VoteTally
+from skl_owner_groups.tally import distribution_from_votes
+from skl_owner_groups.tally import get_vote_weights
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+    _REDIS_ERRORS = ()
+else:
+    _REDIS_ERRORS = (redis.RedisError,)
+
+
+logger = logging.getLogger(__name__)
+REDIS_URL_SETTING = 'voteit.redis_url'
+# Marks counters that were synced from the database
+_SYNCED = '_synced'
+
+
+@implementer(IVoteCounters)
+class RedisVoteCounters(object):
+    """ One hash per poll with category -> votes and 'total', and a set with
+        the names of the counted votes.
+
+        Votes added or removed before the counters are synced are kept in a pending list.
+        A sync applies them on top of the votes it read, so votes committed after the snapshot
+        was taken aren't lost. This matters when a poll starts: the snapshot is taken before
+        the commit, but it's written to Redis after it.
+
+        Updates and syncs are done in transactions that watch all keys. If a vote is counted
+        while a sync reads the database, the sync is retried with a new snapshot.
+    """
+    key_prefix = 'skl_owner_groups:votes:'
+    # Counters for polls nobody looks at will disappear after a week
+    ttl = 7 * 24 * 60 * 60
+
+    def __init__(self, client):
+        self.client = client
+
+    def _key(self, poll_uid):
+        return self.key_prefix + poll_uid
+
+    def _names_key(self, poll_uid):
+        return self.key_prefix + poll_uid + ':names'
+
+    def _pending_key(self, poll_uid):
+        return self.key_prefix + poll_uid + ':pending'
+
+    def add(self, poll_uid, votes):
+        self._update(poll_uid, votes, 1)
+
+    def remove(self, poll_uid, votes):
+        self._update(poll_uid, votes, -1)
+
+    def _update(self, poll_uid, votes, sign):
+        key = self._key(poll_uid)
+        names_key = self._names_key(poll_uid)
+        pending_key = self._pending_key(poll_uid)
+
+        def _change(pipe):
+            if not pipe.hexists(key, _SYNCED):
+                pipe.multi()
+                pipe.rpush(pending_key, json.dumps([sign, votes]))
+                pipe.expire(pending_key, self.ttl)
+                return
+            # Only votes that weren't counted can be added, and only counted votes removed
+            changed = [name for name in votes if bool(pipe.sismember(names_key, name)) == (sign < 0)]
+            pipe.multi()
+            for name in changed:
+                if sign > 0:
+                    pipe.sadd(names_key, name)
+                else:
+                    pipe.srem(names_key, name)
+                for (category, count) in votes[name].items():
+                    pipe.hincrby(key, category, sign * count)
+                pipe.hincrby(key, 'total', sign * sum(votes[name].values()))
+            pipe.expire(key, self.ttl)
+            pipe.expire(names_key, self.ttl)
+
+        self.client.transaction(_change, key, names_key, pending_key)
+
+    def get(self, poll_uid):
+        data = self.client.hgetall(self._key(poll_uid))
+        results = {}
+        for (k, v) in data.items():
+            if isinstance(k, bytes):
+                k = k.decode('utf-8')
+            results[k] = int(v)
+        if results.pop(_SYNCED, None) is None:
+            return
+        return results
+
+    def set(self, poll_uid, read_votes):
+        """ Sync the counters with the votes (name -> category -> votes) returned by read_votes,
+            and the pending votes that were added or removed before the counters were synced.
+        """
+        key = self._key(poll_uid)
+        names_key = self._names_key(poll_uid)
+        pending_key = self._pending_key(poll_uid)
+
+        def _set(pipe):
+            votes = dict(read_votes())
+            for entry in pipe.lrange(pending_key, 0, -1):
+                if isinstance(entry, bytes):
+                    entry = entry.decode('utf-8')
+                (sign, pending) = json.loads(entry)
+                for (name, weights) in pending.items():
+                    if sign > 0 and name not in votes:
+                        votes[name] = weights
+                    elif sign < 0 and name in votes:
+                        del votes[name]
+            counts = Counter()
+            for weights in votes.values():
+                counts.update(weights)
+            mapping = dict(counts)
+            mapping['total'] = sum(counts.values())
+            mapping[_SYNCED] = 1
+            pipe.multi()
+            pipe.delete(key, names_key, pending_key)
+            pipe.hset(key, mapping=mapping)
+            if votes:
+                pipe.sadd(names_key, *votes)
+                pipe.expire(names_key, self.ttl)
+            pipe.expire(key, self.ttl)
+
+        self.client.transaction(_set, key, names_key, pending_key)
+
+    def clear(self, poll_uid):
+        self.client.delete(self._key(poll_uid), self._names_key(poll_uid), self._pending_key(poll_uid))
+
+
+def get_vote_counters(registry=None):
+    """ Returns the IVoteCounters utility or None if Redis isn't configured. """
+    if registry is None:
+        registry = get_current_registry()
+    return registry.queryUtility(IVoteCounters)
+
+
+def category_counts(poll):
+    """ Returns a Counter with category -> votes, read from the database. """
+    tally = VoteTally(poll)
+    if tally.exists:
+        categorized = tally.distribution()[1]
+    else:
+        categorized = distribution_from_votes(poll)[1]
+    counts = Counter()
+    for (category, votemap) in categorized.items():
+        counts[category] = sum(votemap.values())
+    return counts
+
+
+def read_vote_weights(poll):
+    """ Returns a dict with vote name -> category -> votes for all votes in the poll. """
+    tally = VoteTally(poll)
+    if tally.exists:
+        return tally.vote_weights()
+    return dict((x.__name__, get_vote_weights(x)) for x in poll.values() if IVote.providedBy(x))
+
+
+def count_votes(poll, votes, registry=None, remove=False):
+    """ Add votes (vote name -> category -> votes) to the live counters, or remove them,
+        if the current transaction commits.
+    """
+    counters = get_vote_counters(registry)
+    if counters is None or not votes:
+        return
+    votes = dict((name, dict(weights)) for (name, weights) in votes.items())
+    transaction.get().addAfterCommitHook(_count_votes_hook, args=(counters, poll.uid, votes, remove))
+
+
+def _count_votes_hook(status, counters, poll_uid, votes, remove):
+    if not status:
+        return
+    try:
+        if remove:
+            counters.remove(poll_uid, votes)
+        else:
+            counters.add(poll_uid, votes)
+    except _REDIS_ERRORS:
+        # The counters will be synced again during reconcile
+        logger.exception("Couldn't update vote counters for poll %s", poll_uid)
+
+
+def reconcile_poll(poll, counters):
+    """ Sync the counters for a poll with the database.
+        Each attempt starts a new transaction to read a fresh snapshot, so anything
+        that isn't committed will be lost. Only use this from scripts.
+    """
+    def _read():
+        transaction.begin()
+        return read_vote_weights(poll)
+    counters.set(poll.uid, _read)
+
+
+def get_live_counts(poll, registry=None):
+    """ Returns a dict with category -> votes and 'total', or None if there are no synced counters. """
+    counters = get_vote_counters(registry)
+    if counters is None:
+        return
+    try:
+        return counters.get(poll.uid)
+    except _REDIS_ERRORS:
+        logger.exception("Couldn't read vote counters for poll %s", poll.uid)
+
+
+def poll_started_subscriber(obj, event):
+    """ Start counting when a poll opens and remove the counters when it closes.
+        Votes can't be added before the poll is ongoing, so the votes read here are complete
+        when this transaction commits. Votes committed before the counters are set are
+        pending in Redis, and set applies them.
+    """
+    counters = get_vote_counters()
+    if counters is None:
+        return
+    if obj.get_workflow_state() == 'ongoing':
+        votes = read_vote_weights(obj)
+        transaction.get().addAfterCommitHook(_poll_started_hook, args=(counters, obj.uid, votes))
+    else:
+        transaction.get().addAfterCommitHook(_poll_ended_hook, args=(counters, obj.uid))
+
+
+def _poll_started_hook(status, counters, poll_uid, votes):
+    if not status:
+        return
+    try:
+        counters.set(poll_uid, lambda: votes)
+    except _REDIS_ERRORS:
+        logger.exception("Couldn't set vote counters for poll %s", poll_uid)
+
+
+def _poll_ended_hook(status, counters, poll_uid):
+    if not status:
+        return
+    try:
+        counters.clear(poll_uid)
+    except _REDIS_ERRORS:
+        logger.exception("Couldn't clear vote counters for poll %s", poll_uid)
+
+
+def iter_ongoing_polls(root):
+    for meeting in root.values():
+        if not IMeeting.providedBy(meeting):
+            continue
+        for ai in meeting.values():
+            if not IAgendaItem.providedBy(ai):
+                continue
+            for poll in ai.values():
+                if IPoll.providedBy(poll) and poll.get_workflow_state() == 'ongoing':
+                    yield poll
+
+
+def reconcile_vote_counters(root, counters):
+    """ Sync the counters of all ongoing polls. Returns the number of synced polls. """
+    i = 0
+    # reconcile_poll starts new transactions, so find the polls first
+    for poll in list(iter_ongoing_polls(root)):
+        reconcile_poll(poll, counters)
+        i += 1
+    return i
+
+
+def main(argv=sys.argv[1:]):
+    from pyramid.paster import bootstrap
+    parser = argparse.ArgumentParser(description="Sync the live vote counters in Redis with the database.")
+    parser.add_argument('config_uri', help="Paste config file, like etc/production.ini")
+    args = parser.parse_args(argv)
+    env = bootstrap(args.config_uri)
+    try:
+        counters = get_vote_counters(env['registry'])
+        if counters is None:
+            print("%s isn't configured" % REDIS_URL_SETTING)
+            return 1
+        print("Synced %s ongoing polls" % reconcile_vote_counters(env['root'], counters))
+    finally:
+        env['closer']()
+    return 0
+
+
+def includeme(config):
+    from arche.interfaces import IWorkflowAfterTransition
+    url = config.registry.settings.get(REDIS_URL_SETTING, None)
+    if not url:
+        return
+    if redis is None:  # pragma: no cover
+        logger.warning("%s is set but redis isn't installed, live vote counters are disabled", REDIS_URL_SETTING)
+        return
+    counters = RedisVoteCounters(redis.StrictRedis.from_url(url))
+    config.registry.registerUtility(counters, IVoteCounters)
+    config.add_subscriber(poll_started_subscriber, [IPoll, IWorkflowAfterTransition])
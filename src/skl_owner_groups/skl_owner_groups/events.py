@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from zope.interface import implementer
+
+from skl_owner_groups.interfaces import IExtraVotesUpdated
+from skl_owner_groups.interfaces import IGroupsAdded
+
+
+@implementer(IExtraVotesUpdated)
+class ExtraVotesUpdated(object):
+
+    def __init__(self, obj, names):
+        self.object = obj
+        self.names = tuple(names)
+
+
+@implementer(IGroupsAdded)
+class GroupsAdded(object):
+
+    def __init__(self, obj, names):
+        self.object = obj
+        self.names = tuple(names)
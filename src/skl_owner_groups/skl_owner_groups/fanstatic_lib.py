@@ -1,11 +1,26 @@
+from arche.interfaces import IBaseView
+from arche.interfaces import IViewInitializedEvent
 from fanstatic import Library
 from fanstatic import Resource
+from voteit.core.models.interfaces import IAgendaItem
+
+from skl_owner_groups.interfaces import GROUPS_NAME
 
 
 library = Library('skl_og_static', 'static')
 
 #main_css = Resource(library, 'main.css', depends = (bootstrap_css,))
+poll_progress_js = Resource(library, 'poll_progress.js')
+
+
+def need_subscriber(view, event):
+    # The polls portlet with the progress bars is only shown in agenda items
+    if not IAgendaItem.providedBy(getattr(view, 'context', None)):
+        return
+    meeting = getattr(view.request, 'meeting', None)
+    if meeting is not None and GROUPS_NAME in meeting and meeting[GROUPS_NAME].enabled:
+        poll_progress_js.need()
 
 
 def includeme(config):
-    pass
+    config.add_subscriber(need_subscriber, [IBaseView, IViewInitializedEvent])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+""" Import owners from files, like an export from the member registry.
+
+    Rows are read one at a time, validated and applied in the same pass by OwnerImporter.
+    The first column is the email, the second the group name - the kommunkod or regionkod,
+    optionally followed by the name. Other columns are ignored. XLSX files need openpyxl,
+    install skl_owner_groups[xlsx].
+"""
+from __future__ import unicode_literals
+
+import unicodecsv as csv
+
+from skl_owner_groups.models import OwnerImporter
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover
+    openpyxl = None
+
+
+# Headers that will be skipped if they're on the first row
+_HEADERS = ('epost', 'e-post', 'email', 'e-mail', 'mail')
+
+
+def iter_csv_rows(fp, encoding='utf-8-sig'):
+    """ Yields a list of values per row. The delimiter is detected from the first line. """
+    first = fp.readline()
+    fp.seek(0)
+    if isinstance(first, bytes):
+        first = first.decode(encoding, 'replace')
+    delimiter = max(('\t', ';', ','), key=first.count)
+    for row in csv.reader(fp, delimiter=str(delimiter), encoding=encoding):
+        yield row
+
+
+def iter_xlsx_rows(fp):
+    """ Yields a list of values per row in the first sheet. """
+    if openpyxl is None:  # pragma: no cover
+        raise ValueError("Stöd för xlsx-filer saknas på servern, spara filen som csv istället.")
+    workbook = openpyxl.load_workbook(fp, read_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows():
+            yield [cell.value for cell in row]
+    finally:
+        # Read only workbooks keep the file open until closed
+        workbook.close()
+
+
+def iter_owner_rows(rows):
+    """ Turn rows of values into (row number, email, group name).
+        Empty rows and a header row are skipped.
+    """
+    for (rownum, row) in enumerate(rows, 1):
+        values = [_cell_text(x) for x in row[:2]]
+        if not any(x.strip() for x in values):
+            continue
+        if rownum == 1 and values[0].strip().lower() in _HEADERS:
+            continue
+        values.extend([''] * (2 - len(values)))
+        email, group = values
+        group_name = group.split()[0] if group.strip() else ''
+        # Spreadsheets may turn kommunkoder into numbers, 0114 would become 114
+        if group_name.isdigit() and len(group_name) < 4:
+            group_name = group_name.zfill(4)
+        yield rownum, email, group_name
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '%s' % value
+
+
+def get_row_reader(filename):
+    """ Returns a function that reads rows from a file with this name. """
+    name = filename.lower()
+    if name.endswith('.xlsx'):
+        return iter_xlsx_rows
+    if name.endswith('.csv') or name.endswith('.txt'):
+        return iter_csv_rows
+    raise ValueError("Filtypen stöds inte, använd csv eller xlsx.")
+
+
+def import_owners_file(groups, fp, filename, clear_all_existing=False, overwrite_owner=False):
+    """ Validate and import owners from an open file. Returns the OwnerImporter and its results.
+        If importer.errors isn't empty, the transaction should be aborted.
+    """
+    reader = get_row_reader(filename)
+    importer = OwnerImporter(groups, clear_all_existing=clear_all_existing,
+                             overwrite_owner=overwrite_owner, validate=True)
+    results = importer(iter_owner_rows(reader(fp)))
+    return importer, results
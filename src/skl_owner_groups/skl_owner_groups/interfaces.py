@@ -4,6 +4,9 @@ from __future__ import unicode_literals
 from arche.interfaces import IBase
 from arche.interfaces import IContent
 from arche.interfaces import IIndexedContent
+from zope.component.interfaces import IObjectEvent
+from zope.interface import Attribute
+from zope.interface import Interface
 
 GROUPS_NAME = '_groups'
 GRUPPKATEGORIER = (
@@ -20,3 +23,74 @@ class IVGroup(IBase, IIndexedContent):
 
 class IVGroups(IContent):
     """ Container for the group objects. """
+
+
+class IExtraVotesUpdated(IObjectEvent):
+    """ The copies of a users vote were updated. Sent once instead of one update event per copy.
+        object is the users initial vote.
+    """
+    names = Attribute("Names of the updated votes")
+
+
+class IGroupsAdded(IObjectEvent):
+    """ Several groups were added with Groups.add_groups. Sent once instead of one
+        added event per group. object is the groups folder.
+    """
+    names = Attribute("Names of the added groups")
+
+
+class ICategoryAnalyzer(Interface):
+    """ Counts categorized votes per proposal for a poll method.
+        Registered as a named adapter for polls, with the poll plugin name as name.
+    """
+    name = Attribute("Name of the poll plugin")
+    title = Attribute("What the counted votes mean")
+
+    def __call__(hashed, categorized):
+        """ Accepts the result of analyze_vote_distribution and returns a dict with
+            proposal uid -> Counter with category -> votes and 'total'.
+        """
+
+
+class IPairwiseAnalyzer(Interface):
+    """ Summarises ranked poll methods, where votes per proposal don't mean anything,
+        as categorized pairwise preferences. The pass criteria don't apply to these.
+        Registered as a named adapter for polls, with the poll plugin name as name.
+    """
+    name = Attribute("Name of the poll plugin")
+    title = Attribute("What the counted votes mean")
+
+    def __call__(hashed, categorized):
+        """ Accepts the result of analyze_vote_distribution and returns a dict with
+            (proposal uid a, proposal uid b) -> Counter with the categorized votes
+            that prefer a over b, including 'total'.
+        """
+
+
+class IVoteCounters(Interface):
+    """ Live vote counters per poll, kept outside of the database.
+        Registered as a utility when voteit.redis_url is configured.
+
+        Votes are counted by name, so a vote is never counted twice and only
+        counted votes are subtracted.
+    """
+
+    def add(poll_uid, votes):
+        """ Count votes, a dict with vote name -> category -> votes.
+            Counters that haven't been synced with the database are left alone.
+        """
+
+    def remove(poll_uid, votes):
+        """ Subtract votes that were counted, same format as add. """
+
+    def get(poll_uid):
+        """ Returns a dict with category -> votes and 'total', or None if the counters aren't synced. """
+
+    def set(poll_uid, read_votes):
+        """ Replace the counters with the result of read_votes, a callable that returns
+            votes in the same format as add. It's called again if the counters changed
+            while it was running.
+        """
+
+    def clear(poll_uid):
+        """ Remove the counters for a poll. """
@@ -1,35 +1,50 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from hashlib import md5
+import logging
+import re
 from collections import Counter
-from json import dumps
+from time import time
 from uuid import uuid4
 
-import unicodecsv as csv
+import colander
+from BTrees.OOBTree import OOBTree
 from arche.interfaces import IEmailValidatedEvent
 from arche.interfaces import IObjectAddedEvent
 from arche.interfaces import IObjectUpdatedEvent
+from arche.interfaces import IObjectWillBeRemovedEvent
 from pyramid.httpexceptions import HTTPBadRequest
-from pyramid.path import AssetResolver
 from pyramid.threadlocal import get_current_request
 from pyramid.traversal import find_interface
+from pyramid.traversal import find_resource
 from pyramid.traversal import find_root
+from pyramid.traversal import resource_path
 from repoze.catalog.query import Eq
 from repoze.catalog.query import Any
-from six import string_types
 from voteit.core.models.interfaces import IMeeting
+from voteit.core.models.interfaces import IPoll
 from voteit.core.models.interfaces import IVote
+from voteit.core.security import ROLE_VOTER
 from voteit.irl.models.elegible_voters_method import ElegibleVotersMethod
 from voteit.irl.models.interfaces import IMeetingPresence
+from zope.component.event import objectEventNotify
 
+from skl_owner_groups.counters import count_votes
+from skl_owner_groups.refdata import get_reference_data
+from skl_owner_groups.events import ExtraVotesUpdated
 from skl_owner_groups.interfaces import IVGroup
 from skl_owner_groups.interfaces import IVGroups
 from skl_owner_groups.interfaces import GROUPS_NAME
+from skl_owner_groups.resources import get_potential_owner_index
+from skl_owner_groups.tally import VoteTally
+from skl_owner_groups.tally import distribution_from_votes
+from skl_owner_groups.tally import get_vote_weights
+from skl_owner_groups.tally import weighted_ballots
 
 
-_KOMMUNER_FILE = "skl_owner_groups:data/kommuner.csv"
-_REGIONER_FILE = "skl_owner_groups:data/regioner.csv"
+_EXTRA_VOTES_ATTR = '_skl_extra_votes'
+_EMAIL_RE = re.compile(colander.EMAIL_RE)
+logger = logging.getLogger(__name__)
 
 
 def groups_exist(context, request, *args, **kwargs):
@@ -57,13 +72,41 @@ class RepresentativesAsVoters(ElegibleVotersMethod):
         if presence.open:
             raise HTTPBadRequest("Stäng närvarokontrollen först")
         groups = self.context[GROUPS_NAME]
-        for group in groups.values():
-            userid = group.owner
-            if userid and userid in presence and groups.get_vote_power(group.__name__):
+        for userid in groups.get_eligible_voters():
+            if userid in presence:
                 yield userid
 
 
-def create_groups(groups, request):
+def diff_voters(meeting):
+    """ Dry run of RepresentativesAsVoters. Compares the voters it would set
+        with the users that have the voter role now.
+
+        Returns a dict with:
+        - added: sorted userids that will get the voter role
+        - removed: sorted userids that will lose it
+        - unchanged: number of voters that keep it
+        - vote_power: userid -> vote power for all voters after the change
+    """
+    voters = set(RepresentativesAsVoters(meeting).get_voters())
+    current = set(userid for (userid, roles) in meeting.local_roles.items() if ROLE_VOTER in roles)
+    table = meeting[GROUPS_NAME].get_vote_power_table()
+    return {
+        'added': sorted(voters - current),
+        'removed': sorted(current - voters),
+        'unchanged': len(voters & current),
+        'vote_power': dict((userid, sum(table.get(userid, {}).values())) for userid in voters),
+    }
+
+
+def apply_voters_diff(meeting, diff):
+    """ Write the changes from diff_voters. Users that keep their role aren't touched. """
+    for userid in diff['added']:
+        meeting.local_roles.add(userid, ROLE_VOTER)
+    for userid in diff['removed']:
+        meeting.local_roles.remove(userid, ROLE_VOTER)
+
+
+def create_groups(groups, request, year=None):
     """ Skapa group-objekt i ett groups-object..
 
         Specialregler:
@@ -73,8 +116,10 @@ def create_groups(groups, request):
 
         Hantera nycklar och kommunkoder som strängar
 
+        year väljer vilket års listor över kommuner och regioner som används, se refdata.
     """
     assert IVGroups.providedBy(groups)
+    refdata = get_reference_data(year)
 
     # Remove ordering in case it's set
     del groups.order
@@ -82,38 +127,14 @@ def create_groups(groups, request):
     factory = request.content_factories['VGroup']
 
     # SKL
-    groups['skl'] = factory(title='SKR', category='skl')
-
-    # Regionerna
-    for (key, title) in _get_kv_from_csv(_REGIONER_FILE):
-        groups[key] = factory(title=title, category='region')
-
-    # Kommunerna - minus Gotland!
-    for (key, title) in _get_kv_from_csv(_KOMMUNER_FILE):
-        if key == '0980':
-            continue
-        groups[key] = factory(title=title, category='kommun')
-
-
-def _get_kv_from_csv(asset_spec):
-    resolver = AssetResolver()
-    resolved = resolver.resolve(asset_spec)
-    with open(resolved.abspath(), 'rb') as csvfile:
-        reader = csv.reader(csvfile, delimiter=str(';'))
-        for row in reader:
-            # Första kolumnen är tom...
-            if row[1]:
-                yield row[1], row[2]
-
-
-if __name__ == '__main__':
-    print("=== Kommuner ===")
-    for (key, title) in _get_kv_from_csv(_KOMMUNER_FILE):
-        print (key.ljust(10) + title)
+    items = [('skl', factory(title='SKR', category='skl'))]
 
-    print("=== Regioner ===")
-    for (key, title) in _get_kv_from_csv(_REGIONER_FILE):
-        print (key.ljust(10) + title)
+    # Regionerna och kommunerna - minus Gotland!
+    for (key, title, category) in refdata.iter_groups():
+        items.append((key, factory(title=title, category=category)))
+    # Around 300 groups, add them in one go rather than sending events for each one
+    groups.add_groups(items)
+    groups.reference_year = refdata.year
 
 
 def guard_representatives(request, context):
@@ -126,18 +147,24 @@ def get_total_categorized_vote_power(groups):
 
         - This does care about meeting presence
         - It does NOT adjust SKL votes
-        - The result will be cached
+        - The result will be cached until the groups or the present users change
     """
     assert IVGroups.providedBy(groups)
     meeting = find_interface(groups, IMeeting)
     presence = IMeetingPresence(meeting)
     if presence.open:  #pragma: no coverage
         raise HTTPBadRequest("Närvarokontrollen är inte avslutad")
+    cache_key = (groups.cache_key(), frozenset(presence))
+    cached = getattr(groups, '_v_total_vote_power', None)
+    if cached is not None and cached[0] == cache_key:
+        return Counter(cached[1])
+    table = groups.get_vote_power_table()
     counter = Counter()
-    for userid in presence:
-        counter.update(groups.get_categorized_vote_power(userid))
+    for userid in cache_key[1]:
+        counter.update(table.get(userid, {}))
     counter['total'] = sum(counter.itervalues())
-    return counter
+    groups._v_total_vote_power = (cache_key, counter)
+    return Counter(counter)
 
 
 def update_skl_vote_power(groups):
@@ -146,6 +173,8 @@ def update_skl_vote_power(groups):
     skl = groups['skl']
     was_count = skl.base_votes
     skl.base_votes = counter['kommun'] + counter['region'] - 1
+    if was_count != skl.base_votes:
+        groups.invalidate_cache()
     return was_count, skl.base_votes
 
 
@@ -153,9 +182,14 @@ def multiply_and_categorize_votes(obj, event):
     """ This subscriber multiplies votes for users who have several votes.
         It also categorizes them according to the users membership.
         The attribute 'category' will be set on the vote object.
+
+        If the groups use weighted votes, no extra votes are created. Instead the initial vote
+        gets the attribute 'weights' with the categorized vote power of the user.
     """
     request = get_current_request()
     if not groups_active(obj, request):
+        # The tally won't be updated, so make sure it's rebuilt when it's needed
+        VoteTally(obj.__parent__).discard()
         return
     userid = request.authenticated_userid
 
@@ -165,10 +199,23 @@ def multiply_and_categorize_votes(obj, event):
     meeting = request.meeting
     groups = meeting[GROUPS_NAME]
     group = groups.get_users_group(userid)
+    tally = VoteTally(obj.__parent__)
+    tally.ensure()
 
     # There may be situations when users can vote and don't have a group.
     # Before the meeting starts or during demos for instance.
     if group is None:
+        tally.update(obj)
+        if IObjectAddedEvent.providedBy(event):
+            count_votes(obj.__parent__, {obj.__name__: get_vote_weights(obj)}, request.registry)
+        return
+
+    if groups.weighted_votes:
+        if IObjectAddedEvent.providedBy(event):
+            obj.category = group.category
+            obj.weights = dict(groups.get_categorized_vote_power(userid))
+            count_votes(obj.__parent__, {obj.__name__: obj.weights}, request.registry)
+        tally.update(obj)
         return
 
     vote_counter = groups.get_vote_power(group.__name__)
@@ -191,6 +238,7 @@ def multiply_and_categorize_votes(obj, event):
             vote.set_vote_data(vote_data, notify=False)
             poll[name] = vote
             votes.append(vote)
+        _set_extra_vote_names(poll, userid, [x.__name__ for x in votes[1:]])
 
         #Categorize the votes according to the counter obj
         counter = groups.get_categorized_vote_power(userid)
@@ -199,32 +247,115 @@ def multiply_and_categorize_votes(obj, event):
         for cat in counter.elements():
             setattr(votes[i], 'category', cat)
             i += 1
+        for vote in votes:
+            tally.update(vote)
+        count_votes(poll, dict((x.__name__, get_vote_weights(x)) for x in votes), request.registry)
 
     elif IObjectUpdatedEvent.providedBy(event):
-        for vote in poll.get_content(iface=IVote):
-            if vote.creators[0] != userid:
-                continue
-            if vote.__name__ == userid:
-                continue
-            vote.set_vote_data(vote_data)
+        # Votes aren't cataloged, so there's nothing to reindex. Send one event for all copies instead.
+        names = get_extra_vote_names(poll, userid)
+        for name in names:
+            vote = poll[name]
+            vote.set_vote_data(vote_data, notify=False)
+            tally.update(vote)
+        tally.update(obj)
+        if names:
+            objectEventNotify(ExtraVotesUpdated(obj, names))
+
+
+def get_extra_vote_names(poll, userid):
+    """ Returns the names of the votes that were created as copies of the users vote.
+        Polls created before the index existed will be searched once per user.
+    """
+    index = getattr(poll, _EXTRA_VOTES_ATTR, None)
+    if index is not None and userid in index:
+        return tuple(index[userid])
+    names = []
+    for vote in poll.get_content(iface=IVote):
+        if vote.creators and vote.creators[0] == userid and vote.__name__ != userid:
+            names.append(vote.__name__)
+    _set_extra_vote_names(poll, userid, names)
+    return tuple(names)
+
+
+def _set_extra_vote_names(poll, userid, names):
+    index = getattr(poll, _EXTRA_VOTES_ATTR, None)
+    if index is None:
+        index = OOBTree()
+        setattr(poll, _EXTRA_VOTES_ATTR, index)
+    index[userid] = tuple(names)
+
+
+def vote_removed_subscriber(obj, event):
+    """ Keep the tally, the live counters and the extra votes index in sync if votes are removed.
+        If the users initial vote is removed, the copies of it are removed too.
+    """
+    poll = obj.__parent__
+    tally = VoteTally(poll)
+    if tally.exists:
+        tally.remove(obj.__name__)
+    # Only votes that were counted are subtracted, votes added while the groups were inactive weren't
+    count_votes(poll, {obj.__name__: get_vote_weights(obj)}, remove=True)
+    index = getattr(poll, _EXTRA_VOTES_ATTR, None)
+    if index is None or not obj.creators:
+        return
+    userid = obj.creators[0]
+    if userid not in index:
+        return
+    if obj.__name__ == userid:
+        names = index.pop(userid)
+        for name in names:
+            if name in poll:
+                del poll[name]
+    else:
+        index[userid] = tuple(x for x in index[userid] if x != obj.__name__)
+
+
+def uses_weighted_votes(poll):
+    meeting = find_interface(poll, IMeeting)
+    if meeting is None or GROUPS_NAME not in meeting:
+        return False
+    groups = meeting[GROUPS_NAME]
+    return bool(groups.enabled and groups.weighted_votes)
+
+
+class WeightedPollPlugin(object):
+    """ Wraps a poll plugin. voteit.core counts each vote object as one ballot
+        before it asks the poll plugin to calculate the result. When the groups use
+        weighted votes, the ballots are replaced with weighted ones before the
+        wrapped plugin sees them. Everything else is passed on to the wrapped plugin.
+    """
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    def __getattr__(self, name):
+        return getattr(self.plugin, name)
+
+    def handle_close(self):
+        if uses_weighted_votes(self.plugin.context):
+            self.plugin.context.ballots = weighted_ballots(self.plugin.context)
+        return self.plugin.handle_close()
+
+
+def wrap_poll_plugins(registry):
+    """ Register a WeightedPollPlugin for every poll plugin. They're registered for the
+        Poll class, so they take precedence over the plugins registered for IPoll.
+    """
+    from voteit.core.models.interfaces import IPollPlugin
+    from voteit.core.models.poll import Poll
+    for (name, factory) in list(registry.adapters.lookupAll((IPoll,), IPollPlugin)):
+        def _wrapped(context, factory=factory):
+            return WeightedPollPlugin(factory(context))
+        registry.registerAdapter(_wrapped, (Poll,), IPollPlugin, name=name)
 
 
 def analyze_vote_distribution(poll):
-    """ Check vote distribution, cache result. """
-    hashed = {}
-    categorized = {}
-    for v in [x for x in poll.values() if IVote.providedBy(x)]:
-        vote_content = v.get_vote_data()
-        if isinstance(vote_content, string_types):
-            hashable_content = vote_content
-        else:
-            hashable_content = dumps(vote_content)
-        checksum = md5(hashable_content).hexdigest()
-        if checksum not in hashed:
-            hashed[checksum] = vote_content
-        counter = categorized.setdefault(getattr(v, 'category', ''), Counter())
-        counter[checksum] += 1
-    return hashed, categorized
+    """ Check vote distribution. Reads from the tally if the poll has one. """
+    tally = VoteTally(poll)
+    if tally.exists:
+        return tally.distribution()
+    return distribution_from_votes(poll)
 
 
 def percentages_pass(percentages):
@@ -237,93 +368,230 @@ def maybe_assign_user_to_group(event):
     """ A user has just validated their email address.
         Check groups to see if that user is an expected owner somewhere.
     """
-    # Find upcoming and ongoing meetings
     user = event.user
     root = find_root(user)
     email = user.email
-    for obj in root.values():
-        if IMeeting.providedBy(obj) and obj.get_workflow_state() in ('upcoming', 'ongoing') and GROUPS_NAME in obj:
-            groups = obj[GROUPS_NAME]
-            if email in groups.potential_owners:
-                group = groups.get(groups.potential_owners[email])
-                if group:
-                    if not group.owner:
-                        group.owner = user.userid
-                    del groups.potential_owners[email]
+    # Only upcoming and ongoing meetings
+    for (meeting_name, group_name) in tuple(get_potential_owner_index(root).get(email, ())):
+        meeting = root.get(meeting_name, None)
+        if not IMeeting.providedBy(meeting) or GROUPS_NAME not in meeting:
+            continue
+        if meeting.get_workflow_state() not in ('upcoming', 'ongoing'):
+            continue
+        groups = meeting[GROUPS_NAME]
+        if groups.potential_owners.get(email, None) != group_name:
+            continue
+        group = groups.get(group_name)
+        if group:
+            if not group.owner:
+                group.owner = user.userid
+            groups.remove_potential_owner(email)
 
 
-def extract_owner_data(text):
+class OwnerRows(tuple):
+    """ Rows of (row number, email, group name) parsed from text.
+        errors contains (row number, message) for the rows that couldn't be parsed.
+    """
+    errors = ()
+
+
+def parse_owner_rows(text):
     """
     Text probably looks something like:
     namn.namnsson@alvkarleby.se	0319 ÄLVKARLEBY (Where there's a tab after the email)
     :param text: csv tab separated text
-    :return: generator with email, group_name
+    :return: OwnerRows, with all problems in errors
     """
-    counter = 1
-    for row in text.splitlines():
+    rows = []
+    errors = []
+    for (rownum, row) in enumerate(text.splitlines(), 1):
         if not row:
-            counter += 1
             continue
         cols = row.split("\t")
         if len(cols) < 2:
-            raise ValueError("Rad %s verkar inte innehålla något tabtecken" % counter)
+            errors.append((rownum, "Rad %s verkar inte innehålla något tabtecken" % rownum))
+            continue
         if len(cols) > 2:
-            raise ValueError("Rad %s har för många tabtecken" % counter)
+            errors.append((rownum, "Rad %s har för många tabtecken" % rownum))
+            continue
         email = cols[0].strip()
         if not email:
-            raise ValueError("Rad %s saknar epost" % counter)
-        group_name = cols[1].split()[0]
-        if not group_name:
-            raise ValueError("Rad %s saknar information om gruppnamn" % counter)
-        counter += 1
+            errors.append((rownum, "Rad %s saknar epost" % rownum))
+            continue
+        group = cols[1].split()
+        if not group:
+            errors.append((rownum, "Rad %s saknar information om gruppnamn" % rownum))
+            continue
+        rows.append((rownum, email, group[0]))
+    result = OwnerRows(rows)
+    result.errors = tuple(errors)
+    return result
+
+
+def extract_owner_data(text):
+    """ Generator with email, group_name. Raises ValueError on the first problem. """
+    rows = parse_owner_rows(text)
+    if rows.errors:
+        raise ValueError(rows.errors[0][1])
+    for (rownum, email, group_name) in rows:
         yield email, group_name
 
 
-def assign_potential_from_csv(groups, text, clear_all_existing=False, overwrite_owner=False):
-    # Note validation must be done before using this
-    if clear_all_existing:
-        groups.potential_owners.clear()
-    root = find_root(groups)
-    already_potential_groups = groups.potential_owners.values()
-    overwritten = 0
-    already_owned = 0
-    new_assigned = 0
-    new_potential = 0
-    replaced_potential = 0
-
-    for (email, group_name) in extract_owner_data(text):
+def get_validated_users_by_email(root, emails):
+    """ Returns a dict with lowercase email -> user for all users with a validated email,
+        using a single catalog query.
+    """
+    emails = set(x.lower() for x in emails)
+    if not emails:
+        return {}
+    results = {}
+    num, docids = root.catalog.query(Eq('type_name', 'User') & Any('email', list(emails)))
+    for docid in docids:
+        user = find_resource(root, root.document_map.address_for_docid(docid))
+        email = user.email and user.email.lower()
+        if email in emails and user.email_validated:
+            results[email] = user
+    return results
+
+
+# Sortable fields of the group listing rows
+LISTING_SORT_FIELDS = ('title', 'name', 'category', 'base_votes', 'vote_power')
+
+
+def filter_listing_rows(rows, present_userids=(), category=None, present=None, has_owner=None, delegated=None):
+    """ Filter rows from Groups.get_listing_rows. None means don't filter on that. """
+    for row in rows:
+        if category is not None and row.category != category:
+            continue
+        if present is not None and (row.owner in present_userids) != present:
+            continue
+        if has_owner is not None and bool(row.owner) != has_owner:
+            continue
+        if delegated is not None and bool(row.delegate_to) != delegated:
+            continue
+        yield row
+
+
+def sort_listing_rows(rows, sort_on='title', reverse=False):
+    """ Returns a sorted list of listing rows. Titles sort case insensitive and ties are sorted on title. """
+    if sort_on not in LISTING_SORT_FIELDS:
+        raise ValueError("Can't sort on %s" % sort_on)
+    if sort_on == 'title':
+        key = lambda x: x.title.lower()
+    else:
+        key = lambda x: (getattr(x, sort_on), x.title.lower())
+    return sorted(rows, key=key, reverse=reverse)
+
+
+class OwnerImporter(object):
+    """ Applies rows of (row number, email, group name) to a groups folder in one pass.
+        Users are looked up in batches, so the rows may come from a stream of any size.
+
+        With validate, rows with errors are skipped and collected in errors.
+        Everything else is still applied, so the caller should doom the transaction if there are errors.
+    """
+    batch_size = 100
+    # Log progress every n:th row
+    progress_every = 500
+
+    def __init__(self, groups, clear_all_existing=False, overwrite_owner=False, validate=False):
+        assert IVGroups.providedBy(groups)
+        self.groups = groups
+        self.clear_all_existing = clear_all_existing
+        self.overwrite_owner = overwrite_owner
+        self.validate = validate
+        self.root = find_root(groups)
+        self.results = dict(overwritten=0, already_owned=0, new_assigned=0, new_potential=0, replaced_potential=0)
+        self.errors = []
+        self.rows = 0
+        self._emails = set()
+        self._group_names = set()
+
+    def __call__(self, rows):
+        """ Returns the results as a dict with how many groups got each kind of change,
+            and the number of seconds it took as elapsed.
+        """
+        start = time()
+        if self.clear_all_existing:
+            self.groups.clear_potential_owners()
+        batch = []
+        for (rownum, email, group_name) in rows:
+            email = email.strip()
+            if self.validate:
+                error = self.check_row(rownum, email, group_name)
+                if error:
+                    self.errors.append(error)
+                    continue
+            batch.append((email, group_name))
+            if len(batch) >= self.batch_size:
+                self._apply(batch)
+                batch = []
+        self._apply(batch)
+        results = dict(self.results)
+        results['elapsed'] = time() - start
+        return results
+
+    def check_row(self, rownum, email, group_name):
+        """ Returns an error message or None. """
+        if not _EMAIL_RE.match(email):
+            return "Rad %s har en ogiltig epostadress: %s" % (rownum, email)
+        if group_name not in self.groups:
+            return "Rad %s har ett gruppnamn som inte finns: %s" % (rownum, group_name)
+        if email in self._emails:
+            return "Rad %s försöker lägga till en epostadress som redan använts: %s" % (rownum, email)
+        self._emails.add(email)
+        if group_name in self._group_names:
+            return "Rad %s försöker lägga till ett gruppnamn som redan använts: %s" % (rownum, group_name)
+        self._group_names.add(group_name)
+
+    def _apply(self, batch):
+        if not batch:
+            return
+        users = get_validated_users_by_email(self.root, [email for (email, group_name) in batch])
+        for (email, group_name) in batch:
+            self._apply_row(email, group_name, users.get(email.lower(), None))
+        previous = self.rows
+        self.rows += len(batch)
+        if self.rows // self.progress_every > previous // self.progress_every:
+            logger.info("Owner import in %s: %s rows done", resource_path(self.groups), self.rows)
+
+    def _apply_row(self, email, group_name, user):
+        groups = self.groups
         group = groups[group_name]
 
         # Should we overwrite the owner if the group is already owned?
-        if group.owner and not overwrite_owner:
-            already_owned += 1
-            continue
+        if group.owner and not self.overwrite_owner:
+            self.results['already_owned'] += 1
+            return
 
         # Does the user already exist?
-        user = root.users.get_user_by_email(email, only_validated=True)
         if user is not None:
             if group.owner:
-                overwritten += 1
+                self.results['overwritten'] += 1
             else:
-                new_assigned += 1
+                self.results['new_assigned'] += 1
             group.owner = user.userid
-            continue
+            return
 
-        if group_name in already_potential_groups:
-            replaced_potential += 1
-            del group.potential_owner
+        if groups.get_potential_owner(group_name) is not None:
+            self.results['replaced_potential'] += 1
         else:
             # Not other action, so add the email as a potential
-            new_potential += 1
+            self.results['new_potential'] += 1
+        # Replaces the previous potential owner
         groups.add_potential_owner(email, group_name)
 
-    return dict(
-        overwritten=overwritten,
-        already_owned=already_owned,
-        new_assigned=new_assigned,
-        new_potential=new_potential,
-        replaced_potential=replaced_potential
-    )
+
+def assign_potential_from_csv(groups, text, clear_all_existing=False, overwrite_owner=False):
+    """ Assign owners from the text, or store them as potential owners if they don't exist.
+        See OwnerImporter.
+    """
+    # Note validation must be done before using this
+    rows = parse_owner_rows(text)
+    if rows.errors:
+        raise ValueError(rows.errors[0][1])
+    importer = OwnerImporter(groups, clear_all_existing=clear_all_existing, overwrite_owner=overwrite_owner)
+    return importer(rows)
 
 
 def includeme(config):
@@ -337,4 +605,7 @@ def includeme(config):
     config.registry.registerAdapter(RepresentativesAsVoters, name=RepresentativesAsVoters.name)
     config.add_subscriber(multiply_and_categorize_votes, [IVote, IObjectAddedEvent])
     config.add_subscriber(multiply_and_categorize_votes, [IVote, IObjectUpdatedEvent])
-    config.add_subscriber(maybe_assign_user_to_group, IEmailValidatedEvent)
\ No newline at end of file
+    config.add_subscriber(vote_removed_subscriber, [IVote, IObjectWillBeRemovedEvent])
+    config.add_subscriber(maybe_assign_user_to_group, IEmailValidatedEvent)
+    # Poll plugins from other packages need to be registered first
+    config.action('skl_owner_groups.wrap_poll_plugins', wrap_poll_plugins, args=(config.registry,), order=10)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+""" A search index of the participants in a meeting, used by the owner widget.
+    Anyone with a local role in the meeting counts as a participant.
+"""
+from __future__ import unicode_literals
+
+import re
+
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOSet
+from pyramid.traversal import find_root
+from voteit.core.models.interfaces import IMeeting
+
+from skl_owner_groups.interfaces import GROUPS_NAME
+
+
+_INDEX_ATTR = '_skl_participant_index'
+# Attribute on the site root with userid -> OOSet of names of the meetings where the user is indexed
+_USER_MEETINGS_ATTR = '_skl_participant_meetings'
+# Fields of a user that the title is built from
+_TITLE_FIELDS = frozenset(['first_name', 'last_name', 'title'])
+_WORD_SPLIT = re.compile(r'[\s\-_.@]+', re.UNICODE)
+
+
+def _words(text):
+    return set(x for x in _WORD_SPLIT.split(text.lower()) if x)
+
+
+class ParticipantIndex(object):
+    """ Prefix search on title and userid for the participants of a meeting.
+
+        It's stored on the meeting and kept up to date by the subscribers below.
+        It's built on first use, so meetings created before it existed will work too.
+
+        Storage:
+        - titles: userid -> user title at the time of indexing
+        - words: lowercase word from title or userid -> OOSet of userids
+        - user_meetings: True when the indexed users are in the map of meetings per user
+          on the site root, which tells user_updated_subscriber where to update titles
+    """
+
+    def __init__(self, context):
+        assert IMeeting.providedBy(context)
+        self.context = context
+
+    @property
+    def exists(self):
+        return getattr(self.context, _INDEX_ATTR, None) is not None
+
+    @property
+    def storage(self):
+        return getattr(self.context, _INDEX_ATTR)
+
+    def ensure(self):
+        if not self.exists:
+            self.rebuild()
+        elif 'user_meetings' not in self.storage:
+            # Indexes built before the map of meetings per user existed
+            for userid in self.storage['titles'].keys():
+                self._register_meeting(userid)
+            self.storage['user_meetings'] = True
+
+    def rebuild(self):
+        if self.exists:
+            for userid in self.storage['titles'].keys():
+                self._unregister_meeting(userid)
+        storage = OOBTree()
+        storage['titles'] = OOBTree()
+        storage['words'] = OOBTree()
+        storage['user_meetings'] = True
+        setattr(self.context, _INDEX_ATTR, storage)
+        self.sync()
+
+    def sync(self):
+        """ Add participants that aren't indexed and remove the ones that left.
+            Only new participants are loaded. Returns a tuple with (added, removed).
+            This reads every participant, use sync_user when you know who changed.
+        """
+        storage = self.storage
+        current = set(self.context.local_roles.keys())
+        indexed = set(storage['titles'].keys())
+        users = find_root(self.context)['users']
+        added = current - indexed
+        removed = indexed - current
+        for userid in removed:
+            self.remove(userid)
+        for userid in added:
+            user = users.get(userid, None)
+            self.add(userid, user is not None and user.title or '')
+        return added, removed
+
+    def sync_user(self, userid):
+        """ Add or remove one participant, depending on if they have a role in the meeting. """
+        indexed = userid in self.storage['titles']
+        if self.context.local_roles.get(userid, None):
+            if not indexed:
+                user = find_root(self.context)['users'].get(userid, None)
+                self.add(userid, user is not None and user.title or '')
+        elif indexed:
+            self.remove(userid)
+
+    def add(self, userid, title):
+        """ Index a participant, or update the title if they're already indexed. """
+        storage = self.storage
+        if storage['titles'].get(userid, None) == title:
+            return
+        if not self._unindex(userid):
+            self._register_meeting(userid)
+        storage['titles'][userid] = title
+        for word in _words(title) | _words(userid) | set([userid.lower()]):
+            if word not in storage['words']:
+                storage['words'][word] = OOSet()
+            storage['words'][word].add(userid)
+        self._owner_title_changed(userid)
+
+    def remove(self, userid):
+        if self._unindex(userid):
+            self._unregister_meeting(userid)
+            self._owner_title_changed(userid)
+
+    def _unindex(self, userid):
+        storage = self.storage
+        title = storage['titles'].pop(userid, None)
+        if title is None:
+            return False
+        for word in _words(title) | _words(userid) | set([userid.lower()]):
+            userids = storage['words'].get(word, None)
+            if userids is None:
+                continue
+            userids.discard(userid)
+            if not userids:
+                del storage['words'][word]
+        return True
+
+    def _register_meeting(self, userid):
+        root = find_root(self.context)
+        user_meetings = getattr(root, _USER_MEETINGS_ATTR, None)
+        if user_meetings is None:
+            user_meetings = OOBTree()
+            setattr(root, _USER_MEETINGS_ATTR, user_meetings)
+        if userid not in user_meetings:
+            user_meetings[userid] = OOSet()
+        user_meetings[userid].add(self.context.__name__)
+
+    def _unregister_meeting(self, userid):
+        user_meetings = getattr(find_root(self.context), _USER_MEETINGS_ATTR, None)
+        names = user_meetings is not None and user_meetings.get(userid, None) or None
+        if names is None:
+            return
+        names.discard(self.context.__name__)
+        if not names:
+            del user_meetings[userid]
+
+    def _owner_title_changed(self, userid):
+        """ The group listing rows contain the titles of the owners. """
+        groups = self.context.get(GROUPS_NAME, None)
+        if groups is not None and userid in groups.owner_index:
+            groups.invalidate_cache()
+
+    def get_title(self, userid, default=None):
+        self.ensure()
+        return self.storage['titles'].get(userid, default)
+
+    def search(self, text, limit=20):
+        """ Returns a list of (userid, title) where every word in text is the start of a word
+            in the title or userid. Sorted on title.
+        """
+        self.ensure()
+        words = _words(text)
+        if not words:
+            return []
+        storage = self.storage
+        found = None
+        for word in words:
+            matches = set()
+            for key in storage['words'].keys(min=word):
+                if not key.startswith(word):
+                    break
+                matches.update(storage['words'][key])
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        titles = storage['titles']
+        results = sorted(((userid, titles[userid]) for userid in found), key=lambda x: (x[1].lower(), x[0]))
+        return results[:limit]
+
+
+def participant_label(userid, title, owns=None):
+    """ How participants are shown in the owner widget. owns is the title of a group they're responsible for. """
+    label = "{} ({})".format(title, userid) if title else userid
+    if owns:
+        label += " - ansvarig för {}".format(owns)
+    return label
+
+
+def _changed_principals(event):
+    """ Principals that got their first role or lost their last one in the meeting,
+        or None if the event doesn't contain the local roles before and after the change.
+    """
+    old = getattr(event, 'old', None)
+    new = getattr(event, 'new', None)
+    if not (hasattr(old, 'keys') and hasattr(new, 'keys')):
+        return
+    return set(old.keys()) ^ set(new.keys())
+
+
+def participants_changed_subscriber(context, event):
+    """ Someone got or lost a role in the meeting. Only the participants the event
+        concerns are updated, so changing the roles of many users isn't quadratic.
+    """
+    index = ParticipantIndex(context)
+    if not index.exists:
+        return
+    userids = _changed_principals(event)
+    if userids is None:
+        index.sync()
+        return
+    for userid in userids:
+        index.sync_user(userid)
+
+
+def user_meeting_names(root, userid):
+    """ Names of the meetings where the user is in the participant index. """
+    user_meetings = getattr(root, _USER_MEETINGS_ATTR, None)
+    if user_meetings is None:
+        return ()
+    return tuple(user_meetings.get(userid, ()))
+
+
+def user_updated_subscriber(context, event):
+    """ Keep titles up to date in the meetings where the user is a participant.
+        The meetings are found through the map on the site root, so other meetings aren't loaded.
+    """
+    if event.changed is not None and not _TITLE_FIELDS & set(event.changed):
+        return
+    root = find_root(context)
+    userid = context.userid
+    for name in user_meeting_names(root, userid):
+        meeting = root.get(name, None)
+        if not IMeeting.providedBy(meeting):
+            continue
+        index = ParticipantIndex(meeting)
+        if index.exists and userid in index.storage['titles']:
+            index.add(userid, context.title or '')
+
+
+def includeme(config):
+    from arche.interfaces import ILocalRoleChanged
+    from arche.interfaces import IObjectUpdatedEvent
+    from arche.interfaces import IUser
+    config.add_subscriber(participants_changed_subscriber, [IMeeting, ILocalRoleChanged])
+    config.add_subscriber(user_updated_subscriber, [IUser, IObjectUpdatedEvent])
@@ -4,18 +4,25 @@ from __future__ import unicode_literals
 from decimal import Decimal
 
 from arche.portlets import get_portlet_manager
+from arche.views.base import BaseView
 from arche.interfaces import IObjectAddedEvent
 from arche.interfaces import IObjectUpdatedEvent
 from pyramid.httpexceptions import HTTPBadRequest
+from pyramid.decorator import reify
 from pyramid.traversal import find_interface
+from pyramid.traversal import resource_path
 from voteit.core import security
 from voteit.core.models.interfaces import IMeeting, IAgendaItem
 from voteit.core.portlets.agenda_item import PollsInline
 from voteit.core.portlets.agenda_item import PollsPortlet
 
+from skl_owner_groups.analyzers import can_analyze
+from skl_owner_groups.counters import category_counts
+from skl_owner_groups.counters import get_live_counts
 from skl_owner_groups.interfaces import IVGroups
 from skl_owner_groups.interfaces import GROUPS_NAME
 from skl_owner_groups.models import get_total_categorized_vote_power
+from skl_owner_groups.tally import VoteTally
 
 
 SKL_POLLS_PORTLET = 'ai_polls_skl'
@@ -28,35 +35,80 @@ class SKLPollsPortlet(PollsPortlet):
     view_name = SKL_POLLS_VIEW_NAME
 
 
+def get_poll_progress(poll, total_vote_power, registry=None, categories=False):
+    """ Returns a dict with added, total and percentage for a poll.
+        With categories, also categories with category -> added votes, but only if they
+        can be read from the live counters or the tally. It's left out otherwise,
+        since it would mean loading every vote in the poll.
+    """
+    live_counts = get_live_counts(poll, registry)
+    tally = VoteTally(poll)
+    if live_counts is not None:
+        added = live_counts.get('total', 0)
+    # With weighted votes, the number of vote objects isn't the number of votes
+    elif tally.exists:
+        added = tally.total
+    else:
+        added = len(poll)
+    response = {'added': added, 'total': total_vote_power}
+    if response['total'] != 0:
+        try:
+            response['percentage'] = int(
+                round(100 * Decimal(response['added']) / Decimal(response['total']), 0))
+        except ZeroDivisionError:
+            response['percentage'] = 0
+    else:
+        response['percentage'] = 0
+    if categories:
+        if live_counts is not None:
+            counts = dict(live_counts)
+            counts.pop('total', None)
+            response['categories'] = counts
+        elif tally.exists:
+            response['categories'] = dict(category_counts(poll))
+    return response
+
+
 class SKLPollsInline(PollsInline):
 
+    @reify
+    def total_vote_power(self):
+        try:
+            return get_total_categorized_vote_power(self.request.meeting[GROUPS_NAME])['total']
+        except HTTPBadRequest:
+            return 0
+
     def get_voted_estimate(self, poll):
         """ Returns an approx guess without doing expensive calculations.
             This method should rely on other things later on.
 
             Should only be called during ongoing or closed polls.
         """
-        response = {'added': len(poll), 'total': 0}
-        try:
-            vote_power = get_total_categorized_vote_power(self.request.meeting[GROUPS_NAME])
-            response['total'] = vote_power['total']
-        except HTTPBadRequest:
-            pass
-        if response['total'] != 0:
-            try:
-                response['percentage'] = int(
-                    round(100 * Decimal(response['added']) / Decimal(response['total']), 0))
-            except ZeroDivisionError:
-                response['percentage'] = 0
-        else:
-            response['percentage'] = 0
-        return response
+        return get_poll_progress(poll, self.total_vote_power, self.request.registry)
 
     def show_category_link(self, poll):
-        if poll.poll_plugin in ('combined_simple', 'majority_poll'):
+        if can_analyze(poll, self.request.registry):
             return poll.get_workflow_state() == 'closed'
 
 
+class SKLPollsProgress(BaseView):
+    """ Progress for the ongoing polls in an agenda item, polled by poll_progress.js
+        so the progress bars can be updated without rendering the polls portlet.
+    """
+
+    def __call__(self):
+        try:
+            total = get_total_categorized_vote_power(self.request.meeting[GROUPS_NAME])['total']
+        except HTTPBadRequest:
+            total = 0
+        polls = {}
+        for poll in self.catalog_search(resolve=True, path=resource_path(self.context),
+                                        type_name='Poll', workflow_state='ongoing'):
+            polls[poll.uid] = get_poll_progress(poll, total, self.request.registry, categories=True)
+        self.request.response.cache_control = 'no-cache'
+        return {'polls': polls}
+
+
 def adjust_poll_portlet(context, skl_version=True):
     """ Adjust poll portlet to this type"""
     PSLOT = 'agenda_item'
@@ -104,3 +156,8 @@ def includeme(config):
                     context=IAgendaItem,
                     permission=security.VIEW,
                     renderer='skl_owner_groups:templates/skl_polls_inline.pt')
+    config.add_view(SKLPollsProgress,
+                    name='_skl_poll_progress.json',
+                    context=IAgendaItem,
+                    permission=security.VIEW,
+                    renderer='json')
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+""" Reference data for kommuner and regioner.
+
+    The code lists are read from the data folder once per process. kommuner.csv and regioner.csv
+    are the current lists. When the lists change, add kommuner_<year>.csv and regioner_<year>.csv
+    with the lists that apply from that year. Meetings can then be created against the list
+    that was valid a given year.
+
+    python -m skl_owner_groups.refdata [year]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import re
+import sys
+from collections import OrderedDict
+from threading import Lock
+
+import unicodecsv as csv
+from pyramid.path import AssetResolver
+
+
+DATA_FOLDER = "skl_owner_groups:data"
+# Kommunen Gotland tas bort, eftersom regionen Gotland är ägare
+GOTLAND_KOMMUN = '0980'
+GOTLAND_REGION = 'I'
+
+_YEAR_FILE = re.compile(r'^kommuner_(\d{4})\.csv$')
+_cache = {}
+_lock = Lock()
+
+
+class ReferenceDataError(ValueError):
+    """ The code lists are broken. """
+
+
+class ReferenceData(object):
+    """ Kommuner and regioner for one year. year is None for the current lists. """
+
+    def __init__(self, regioner, kommuner, year=None):
+        self.year = year
+        self.regioner = _to_dict(regioner, 'regioner')
+        self.kommuner = _to_dict(kommuner, 'kommuner')
+        duplicates = set(self.regioner) & set(self.kommuner)
+        if duplicates:
+            raise ReferenceDataError("Koder finns både som kommun och region: %s" % ", ".join(sorted(duplicates)))
+        if GOTLAND_KOMMUN in self.kommuner and GOTLAND_REGION not in self.regioner:
+            raise ReferenceDataError("Gotlands kommun tas bort, så region %s måste finnas" % GOTLAND_REGION)
+        self._names = {}
+        for (code, title) in list(self.regioner.items()) + list(self.kommuner.items()):
+            self._names.setdefault(_normalize(title), code)
+
+    def get_title(self, code, default=None):
+        return self.regioner.get(code, self.kommuner.get(code, default))
+
+    def get_category(self, code, default=None):
+        if code in self.regioner:
+            return 'region'
+        if code in self.kommuner:
+            return 'kommun'
+        return default
+
+    def find_code(self, name, default=None):
+        """ Find the code by name, ignoring case and surrounding whitespace. """
+        return self._names.get(_normalize(name), default)
+
+    def iter_groups(self):
+        """ Yields (code, title, category) for all groups that should be created:
+            the regioner and then all kommuner except Gotland.
+        """
+        for (code, title) in self.regioner.items():
+            yield code, title, 'region'
+        for (code, title) in self.kommuner.items():
+            if code == GOTLAND_KOMMUN:
+                continue
+            yield code, title, 'kommun'
+
+
+def _normalize(name):
+    return name.strip().lower()
+
+
+def _to_dict(items, list_name):
+    results = OrderedDict()
+    names = set()
+    for (code, title) in items:
+        if code in results:
+            raise ReferenceDataError("Koden %s finns flera gånger i %s" % (code, list_name))
+        name = _normalize(title)
+        if name in names:
+            raise ReferenceDataError("Namnet %s finns flera gånger i %s" % (title, list_name))
+        names.add(name)
+        results[code] = title
+    return results
+
+
+def _data_path():
+    return AssetResolver().resolve(DATA_FOLDER).abspath()
+
+
+def _read_code_list(filename):
+    with open(os.path.join(_data_path(), filename), 'rb') as csvfile:
+        reader = csv.reader(csvfile, delimiter=str(';'))
+        for row in reader:
+            # Första kolumnen är tom...
+            if len(row) > 2 and row[1]:
+                yield row[1], row[2]
+
+
+def available_years():
+    """ Years that have their own lists, sorted. """
+    years = []
+    for filename in os.listdir(_data_path()):
+        match = _YEAR_FILE.match(filename)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def _resolve_year(year):
+    if year is None:
+        return None
+    candidates = [x for x in available_years() if x <= int(year)]
+    if candidates:
+        return max(candidates)
+
+
+def get_reference_data(year=None):
+    """ Returns the ReferenceData that applies to year, or the current lists if year is None
+        or older than all yearly lists. Each list is only loaded once per process.
+    """
+    key = _resolve_year(year)
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in _cache:
+            if key is None:
+                regioner, kommuner = 'regioner.csv', 'kommuner.csv'
+            else:
+                regioner, kommuner = 'regioner_%s.csv' % key, 'kommuner_%s.csv' % key
+            _cache[key] = ReferenceData(_read_code_list(regioner), _read_code_list(kommuner), year=key)
+        return _cache[key]
+
+
+def main(argv=sys.argv[1:]):
+    refdata = get_reference_data(argv[0] if argv else None)
+    print("=== Kommuner ===")
+    for (key, title) in refdata.kommuner.items():
+        print(key.ljust(10) + title)
+
+    print("=== Regioner ===")
+    for (key, title) in refdata.regioner.items():
+        print(key.ljust(10) + title)
+
+
+if __name__ == '__main__':
+    main()
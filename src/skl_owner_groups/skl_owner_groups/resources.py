@@ -1,20 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import logging
 from collections import Counter
+from collections import namedtuple
 
+from BTrees.Length import Length
 from BTrees.OOBTree import OOBTree
 from BTrees.OOBTree import OOSet
+from arche.interfaces import ILocalRoleChanged
+from arche.interfaces import IObjectUpdatedEvent
 from arche.resources import Base
 from arche.resources import Content
 from arche.resources import LocalRolesMixin
 from arche.security import ROLE_OWNER
+from pyramid.traversal import find_interface
+from pyramid.traversal import find_root
+from pyramid.traversal import quote_path_segment
+from pyramid.traversal import resource_path
+from voteit.core.models.interfaces import IMeeting
+from voteit.core.models.interfaces import ISiteRoot
+from zope.component.event import objectEventNotify
 from zope.interface import implementer
 from six import string_types
 
+from skl_owner_groups.events import GroupsAdded
 from skl_owner_groups.security import ADD_VGROUP
+from skl_owner_groups.interfaces import GROUPS_NAME
 from skl_owner_groups.interfaces import IVGroup
 from skl_owner_groups.interfaces import IVGroups
+from skl_owner_groups.participants import ParticipantIndex
+
+
+logger = logging.getLogger(__name__)
+
+# One row on the groups page, see Groups.get_listing_rows
+# owner_profile_path is the path of the owners user profile, from the site root
+GroupRow = namedtuple('GroupRow', ('name', 'uid', 'title', 'category', 'owner', 'owner_title',
+                                   'owner_profile_path', 'delegate_to', 'delegate_title',
+                                   'delegate_uid', 'base_votes', 'vote_power'))
+# Hits and misses for the vote power table, per process
+vote_power_cache_stats = Counter()
+# Attribute on the site root with email -> (meeting name, group name) for all potential owners
+_POTENTIAL_OWNER_INDEX_ATTR = '_skl_potential_owner_index'
 
 
 @implementer(IVGroup)
@@ -53,6 +81,8 @@ class Group(Base, LocalRolesMixin):
             use_event = self.__parent__ is not None
             self.local_roles.remove(curr_owner, ROLE_OWNER, event=False)
             self.local_roles.add(value, ROLE_OWNER, event=use_event)
+            if use_event:
+                self.__parent__.index_owner(self)
 
     @property
     def delegate_to(self):
@@ -68,25 +98,21 @@ class Group(Base, LocalRolesMixin):
     @property
     def potential_owner(self):
         groups = self.__parent__
-        # Lazy, so check if we need to bother with iteration
         if groups is None:
             raise Exception("Resource isn't attached to the resource tree")
-        if self.__name__ in groups.potential_owners.values():
-            for (k, v) in groups.potential_owners.items():
-                if self.__name__ == v:
-                    return k
+        return groups.get_potential_owner(self.__name__)
 
     @potential_owner.setter
     def potential_owner(self, value):
         groups = self.__parent__
-        groups.potential_owners[value] = self.__name__
+        groups.add_potential_owner(value, self.__name__)
 
     @potential_owner.deleter
     def potential_owner(self):
-        k = self.potential_owner
+        groups = self.__parent__
+        k = groups.get_potential_owner(self.__name__)
         if k is not None:
-            groups = self.__parent__
-            del groups.potential_owners[k]
+            groups.remove_potential_owner(k)
 
 
 @implementer(IVGroups)
@@ -102,12 +128,55 @@ class Groups(Content):
     search_visible = False
     enabled = True
     title = "Grupper"
+    weighted_votes = False
+    # Year of the kommun and region lists the groups were created from, None means the current lists
+    reference_year = None
+    # Created on first use for groups folders that were created before the index existed
+    _owner_index = None
+    _group_owners = None
+    # userid -> OOSet of group names, for users that own more than one group
+    _duplicate_owners = None
+    _potential_by_group = None
+    # Length that is bumped whenever something that cached data depends on changes.
+    # Old groups folders may have an int here until the cache is invalidated.
+    _cache_generation = 0
 
     def __init__(self, **kw):
         super(Groups, self).__init__(**kw)
         self._received_delegations = OOBTree()
         self._delegated_to = OOBTree()
         self.potential_owners = OOBTree()
+        self._owner_index = OOBTree()
+        self._group_owners = OOBTree()
+        self._potential_by_group = OOBTree()
+        self._cache_generation = Length()
+
+    def add(self, name, other, send_events=True, **kw):
+        name = super(Groups, self).add(name, other, send_events=send_events, **kw)
+        self.index_owner(other)
+        self.invalidate_cache()
+        return name
+
+    def add_groups(self, items):
+        """ Add several groups at once, items is an iterable with (name, group).
+            Instead of one added event per group, which would reindex and invalidate
+            the cache for each group, the groups are cataloged in one go and a single
+            GroupsAdded event is sent for this folder. Returns the added names.
+
+            No IObjectAddedEvent is sent for the groups, so subscribers for added groups,
+            including ones in other packages, won't run. Subscribe to IGroupsAdded or use add.
+        """
+        names = []
+        groups = []
+        for (name, group) in items:
+            names.append(super(Groups, self).add(name, group, send_events=False))
+            groups.append(group)
+        for group in groups:
+            self.index_owner(group)
+        _catalog_objects(self, groups)
+        self.invalidate_cache()
+        objectEventNotify(GroupsAdded(self, names))
+        return names
 
     def remove(self, name, send_events=True):
         """ Override removal of folders to make sure they clean up rerences.
@@ -115,7 +184,153 @@ class Groups(Content):
         """
         if self.has_delegated_to(name):
             self.remove_delegation(name)
-        return super(Groups, self).remove(name, send_events=send_events)
+        result = super(Groups, self).remove(name, send_events=send_events)
+        self._unindex_owner(name)
+        email = self.get_potential_owner(name)
+        if email is not None:
+            self.remove_potential_owner(email)
+        self.invalidate_cache()
+        return result
+
+    @property
+    def cache_generation(self):
+        generation = self._cache_generation
+        if isinstance(generation, Length):
+            return generation()
+        return generation
+
+    def cache_key(self):
+        """ Key for the volatile caches. The generation alone isn't enough: a connection may
+            invalidate the cache, fill it and then abort, while another transaction commits
+            the same generation. The serial of the object holding the generation tells them apart.
+        """
+        generation = self._cache_generation
+        if isinstance(generation, Length):
+            return (generation(), generation._p_serial)
+        return (generation, self._p_serial)
+
+    def invalidate_cache(self):
+        """ Mark all cached data as stale. Since the counter is persistent,
+            this invalidates the cache for all workers when the transaction is committed.
+            It's a Length, so concurrent invalidations resolve instead of causing a ConflictError.
+        """
+        if isinstance(self._cache_generation, Length):
+            self._cache_generation.change(1)
+        else:
+            self._cache_generation = Length(self._cache_generation + 1)
+
+    @property
+    def owner_index(self):
+        """ userid -> group name for all groups that have an owner.
+            Users that own more than one group are only mapped to one of them,
+            use get_owned_groups to get all of them.
+        """
+        self._ensure_owner_index()
+        return self._owner_index
+
+    def _ensure_owner_index(self):
+        if self._owner_index is None:
+            self.rebuild_owner_index()
+
+    def index_owner(self, group):
+        """ Update the owner index for a contained group.
+            Returns True if the index changed.
+        """
+        self._ensure_owner_index()
+        name = group.__name__
+        userid = group.owner or None
+        if self._group_owners.get(name, None) == userid:
+            return False
+        self._unindex_owner(name)
+        if userid:
+            indexed = self._owner_index.get(userid, None)
+            if indexed is None:
+                self._owner_index[userid] = name
+            else:
+                if self._duplicate_owners is None:
+                    self._duplicate_owners = OOBTree()
+                if userid not in self._duplicate_owners:
+                    self._duplicate_owners[userid] = OOSet([indexed])
+                self._duplicate_owners[userid].add(name)
+            self._group_owners[name] = userid
+        self.invalidate_cache()
+        return True
+
+    def _unindex_owner(self, name):
+        self._ensure_owner_index()
+        userid = self._group_owners.pop(name, None)
+        if userid is None:
+            return
+        names = self._duplicate_owners.get(userid, None) if self._duplicate_owners else None
+        if names is not None:
+            names.remove(name)
+            if self._owner_index.get(userid, None) == name:
+                self._owner_index[userid] = names.minKey()
+            if len(names) < 2:
+                del self._duplicate_owners[userid]
+        elif self._owner_index.get(userid, None) == name:
+            del self._owner_index[userid]
+
+    def get_owned_groups(self, userid):
+        """ Returns a tuple with the names of all groups this user owns. """
+        if self._duplicate_owners and userid in self._duplicate_owners:
+            return tuple(self._duplicate_owners[userid])
+        name = self.owner_index.get(userid, None)
+        return (name,) if name is not None else ()
+
+    @property
+    def duplicate_owners(self):
+        """ Returns a dict with userid -> tuple of group names, for users that own more than one group.
+            That isn't allowed, but it may happen through imports or changes to the local roles.
+        """
+        self._ensure_owner_index()
+        if not self._duplicate_owners:
+            return {}
+        return dict((userid, tuple(names)) for (userid, names) in self._duplicate_owners.items())
+
+    def rebuild_owner_index(self):
+        """ Rebuild the owner index from scratch. Use this to upgrade old databases
+            or if verify_owner_index reports problems.
+            Users that own more than one group are logged, and returned like duplicate_owners.
+        """
+        self._owner_index = OOBTree()
+        self._group_owners = OOBTree()
+        self._duplicate_owners = OOBTree()
+        for group in self.values():
+            self.index_owner(group)
+        duplicates = self.duplicate_owners
+        for (userid, names) in sorted(duplicates.items()):
+            logger.warning("%s owns more than one group in %s: %s", userid, resource_path(self), ", ".join(names))
+        return duplicates
+
+    def verify_owner_index(self):
+        """ Compare the owner index with the actual owners of all groups.
+            Returns a dict with userid as key and a tuple of (indexed group name, actual group name)
+            for all entries that differ. An empty dict means the index is correct.
+            For users that own more than one group, the names are sorted tuples.
+        """
+        expected = {}
+        for group in self.values():
+            userid = group.owner
+            if userid:
+                expected.setdefault(userid, set()).add(group.__name__)
+        indexed = set(self.owner_index.keys())
+        if self._duplicate_owners:
+            indexed.update(self._duplicate_owners.keys())
+
+        def _value(names):
+            names = sorted(names)
+            if len(names) > 1:
+                return tuple(names)
+            return names and names[0] or None
+
+        problems = {}
+        for userid in set(expected) | indexed:
+            indexed_names = _value(self.get_owned_groups(userid))
+            expected_names = _value(expected.get(userid, ()))
+            if indexed_names != expected_names:
+                problems[userid] = (indexed_names, expected_names)
+        return problems
 
     def get_sorted_values(self):
         """ Return all contained Group object sorted on title. """
@@ -130,6 +345,7 @@ class Groups(Content):
             self._received_delegations[to_group] = OOSet()
         self._received_delegations[to_group].add(from_group)
         self._delegated_to[from_group] = to_group
+        self.invalidate_cache()
 
     def has_delegated_to(self, group_name):
         return self._delegated_to.get(group_name, None)
@@ -146,6 +362,7 @@ class Groups(Content):
             return
         self._received_delegations[to_group].remove(group_name)
         del self._delegated_to[group_name]
+        self.invalidate_cache()
         return to_group
 
     def get_vote_power(self, group_name):
@@ -163,14 +380,98 @@ class Groups(Content):
         return votes
 
     def get_users_group(self, userid):
-        """ We don't need to use the catalog since we don't expect a lot of load here."""
+        """ Return the group this user is responsible for, if any. Uses the owner index. """
         assert isinstance(userid, string_types)
-        for x in self.values():
-            if x.owner == userid:
-                return x
+        name = self.owner_index.get(userid, None)
+        if name is not None:
+            return self.get(name, None)
 
     def get_categorized_vote_power(self, userid):
         """ All the kinds of vote power this user has. This doesn't check if a user is actually a voter."""
+        return Counter(self.get_vote_power_table().get(userid, ()))
+
+    def get_vote_power_table(self):
+        """ Returns a dict with userid as key and the categorized vote power as value, for all group owners.
+            The table is kept as a volatile attribute, so each worker computes it once
+            and then reuses it until invalidate_cache is called. Don't modify the result.
+        """
+        cache_key = self.cache_key()
+        cached = getattr(self, '_v_vote_power_table', None)
+        if cached is not None and cached[0] == cache_key:
+            vote_power_cache_stats['hits'] += 1
+            return cached[1]
+        vote_power_cache_stats['misses'] += 1
+        table = {}
+        for userid in self.owner_index.keys():
+            table[userid] = self._calculate_categorized_vote_power(userid)
+        self._v_vote_power_table = (cache_key, table)
+        return table
+
+    def get_eligible_voters(self):
+        """ Returns a frozenset of userids that own a group with vote power.
+            Derived from the vote power table and cached the same way.
+        """
+        cache_key = self.cache_key()
+        cached = getattr(self, '_v_eligible_voters', None)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        voters = frozenset(userid for (userid, counter) in self.get_vote_power_table().items()
+                           if sum(counter.values()))
+        self._v_eligible_voters = (cache_key, voters)
+        return voters
+
+    def get_listing_rows(self):
+        """ Returns a tuple of GroupRow for all groups, sorted on title.
+            Built in one pass and cached like the vote power table. Presence isn't part of the rows
+            since it changes without touching the groups.
+            Owner titles come from the participant index, which invalidates the cache
+            when the title of an owner changes.
+        """
+        meeting = find_interface(self, IMeeting)
+        index = None
+        if meeting is not None:
+            index = ParticipantIndex(meeting)
+            index.ensure()
+        cache_key = self.cache_key()
+        cached = getattr(self, '_v_listing_rows', None)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        groups = dict(self.items())
+        self._ensure_owner_index()
+        base_votes = dict((name, group.base_votes) for (name, group) in groups.items())
+        rows = []
+        for (name, group) in groups.items():
+            delegate_to = self._delegated_to.get(name, None)
+            delegate = groups.get(delegate_to, None)
+            if delegate_to is None:
+                vote_power = base_votes[name] + sum(base_votes[x] for x in self.is_delegate_for(name))
+            else:
+                vote_power = 0
+            owner = self._group_owners.get(name, None)
+            owner_title = owner_profile_path = None
+            if owner is not None:
+                owner_title = index is not None and index.get_title(owner, None) or owner
+                owner_profile_path = '/users/%s' % quote_path_segment(owner)
+            rows.append(GroupRow(
+                name=name,
+                uid=group.uid,
+                title=group.title,
+                category=group.category,
+                owner=owner,
+                owner_title=owner_title,
+                owner_profile_path=owner_profile_path,
+                delegate_to=delegate_to,
+                delegate_title=delegate is not None and delegate.title or '',
+                delegate_uid=delegate is not None and delegate.uid or '',
+                base_votes=base_votes[name],
+                vote_power=vote_power,
+            ))
+        rows.sort(key=lambda x: x.title.lower())
+        rows = tuple(rows)
+        self._v_listing_rows = (cache_key, rows)
+        return rows
+
+    def _calculate_categorized_vote_power(self, userid):
         counter = Counter()
         primary_group = self.get_users_group(userid)
         if primary_group is None or self.has_delegated_to(primary_group.__name__):
@@ -181,12 +482,128 @@ class Groups(Content):
             counter[group.category] += group.base_votes
         return counter
 
+    @property
+    def potential_by_group(self):
+        """ group name -> email, the reverse of potential_owners. """
+        self._ensure_potential_index()
+        return self._potential_by_group
+
+    def _ensure_potential_index(self):
+        if self._potential_by_group is None:
+            self.rebuild_potential_index()
+
+    def rebuild_potential_index(self):
+        """ Rebuild the group -> email index. Used to upgrade old databases.
+            If a group has several potential owners, the first email is kept.
+        """
+        self._potential_by_group = OOBTree()
+        for (email, group_name) in self.potential_owners.items():
+            self._potential_by_group.setdefault(group_name, email)
+
+    def get_potential_owner(self, group_name, default=None):
+        return self.potential_by_group.get(group_name, default)
+
     def add_potential_owner(self, email, group_name):
+        """ Each group has one potential owner, so this replaces any previous one.
+            An email that was a potential owner for another group moves to this group.
+        """
         if group_name not in self:
             raise ValueError("Ingen grupp med namnet '%s' finns" % group_name)
+        previous_email = self.get_potential_owner(group_name)
+        if previous_email is not None and previous_email != email:
+            self.remove_potential_owner(previous_email)
+        if email in self.potential_owners:
+            self.remove_potential_owner(email)
         self.potential_owners[email] = group_name
+        self.potential_by_group[group_name] = email
+        self._site_index_potential(email, group_name)
+
+    def remove_potential_owner(self, email):
+        """ Returns the group name the email was a potential owner for, or None. """
+        group_name = self.potential_owners.pop(email, None)
+        if group_name is not None:
+            if self.potential_by_group.get(group_name, None) == email:
+                del self._potential_by_group[group_name]
+            self._site_unindex_potential(email, group_name)
+        return group_name
+
+    def clear_potential_owners(self):
+        for (email, group_name) in tuple(self.potential_owners.items()):
+            self._site_unindex_potential(email, group_name)
+        self.potential_owners.clear()
+        self._potential_by_group = OOBTree()
+
+    def _site_index_potential(self, email, group_name):
+        root = find_interface(self, ISiteRoot)
+        if root is not None:
+            entries = get_potential_owner_index(root).setdefault(email, OOSet())
+            entries.add((self.__parent__.__name__, group_name))
+
+    def _site_unindex_potential(self, email, group_name):
+        root = find_interface(self, ISiteRoot)
+        if root is None:
+            return
+        index = get_potential_owner_index(root)
+        entries = index.get(email, None)
+        if entries is not None:
+            entries.discard((self.__parent__.__name__, group_name))
+            if not entries:
+                del index[email]
+
+
+def _catalog_objects(context, objs):
+    """ Catalog newly added objects in one batch. Does nothing if the site has no catalog. """
+    root = find_root(context)
+    catalog = getattr(root, 'catalog', None)
+    document_map = getattr(root, 'document_map', None)
+    if catalog is None or document_map is None:
+        return
+    for obj in objs:
+        path = resource_path(obj)
+        docid = document_map.docid_for_address(path)
+        if docid is None:
+            docid = document_map.add(path)
+        catalog.index_doc(docid, obj)
+
+
+def get_potential_owner_index(root):
+    """ Returns an OOBTree with email -> OOSet with (meeting name, group name) for all potential owners
+        on the site. It's built on first use.
+    """
+    index = getattr(root, _POTENTIAL_OWNER_INDEX_ATTR, None)
+    if index is None:
+        index = rebuild_potential_owner_index(root)
+    return index
+
+
+def rebuild_potential_owner_index(root):
+    """ Build the site index of potential owners from all meetings. Returns the index. """
+    index = OOBTree()
+    setattr(root, _POTENTIAL_OWNER_INDEX_ATTR, index)
+    for meeting in root.values():
+        if not IMeeting.providedBy(meeting) or GROUPS_NAME not in meeting:
+            continue
+        for (email, group_name) in meeting[GROUPS_NAME].potential_owners.items():
+            index.setdefault(email, OOSet()).add((meeting.__name__, group_name))
+    return index
+
+
+def group_updated_subscriber(context, event):
+    """ Base votes, category etc may have changed. """
+    groups = context.__parent__
+    if IVGroups.providedBy(groups):
+        groups.invalidate_cache()
+
+
+def owner_changed_subscriber(context, event):
+    """ Local roles may be changed without using the owner property, keep the owner index in sync. """
+    groups = context.__parent__
+    if IVGroups.providedBy(groups):
+        groups.index_owner(context)
 
 
 def includeme(config):
     config.add_content_factory(Group, addable_to='VGroups')
     config.add_content_factory(Groups)
+    config.add_subscriber(owner_changed_subscriber, [IVGroup, ILocalRoleChanged])
+    config.add_subscriber(group_updated_subscriber, [IVGroup, IObjectUpdatedEvent])
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+""" Categorized poll results, as shown in the Röstfördelning modal.
+    Once a poll is closed the result is stored on the poll, since it can't change.
+"""
+from __future__ import unicode_literals
+
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+
+from pyramid.httpexceptions import HTTPBadRequest
+from pyramid.traversal import find_interface
+from voteit.core.models.interfaces import IMeeting
+from webob.datetime_utils import UTC
+
+from skl_owner_groups.analyzers import get_category_analyzer
+from skl_owner_groups.analyzers import get_pairwise_analyzer
+from skl_owner_groups.interfaces import GROUPS_NAME
+from skl_owner_groups.interfaces import GRUPPKATEGORIER
+from skl_owner_groups.models import analyze_vote_distribution
+from skl_owner_groups.models import get_total_categorized_vote_power
+from skl_owner_groups.models import percentages_pass
+
+
+_RESULTS_ATTR = '_skl_category_results'
+
+
+def get_view_cats():
+    view_cats = list(GRUPPKATEGORIER)
+    # Ta bort ombud
+    view_cats.pop(-1)
+    # Lägg till total
+    view_cats.append(('total', 'Total'))
+    return view_cats
+
+
+def calc_perc(num, total):
+    if total:
+        return int(round(100 * Decimal(num) / Decimal(total), 0))
+    return 0
+
+
+def get_percentages(vote_count, total_vote_power, view_cats):
+    results = {}
+    for cat, title in view_cats:
+        results[cat] = calc_perc(vote_count[cat], total_vote_power[cat])
+    return results
+
+
+def get_colouring(percentages):
+    results = {}
+    results['skl'] = 'success'
+    if percentages_pass(percentages):
+        results['total'] = 'success'
+    else:
+        results['total'] = 'danger'
+    for cat in ('kommun', 'region'):
+        if percentages[cat] > 32:
+            results[cat] = 'success'
+        else:
+            results[cat] = 'danger'
+    return results
+
+
+def calculate_category_results(poll, registry=None):
+    """ Calculate the categorized result of a poll. The meeting presence check must be closed
+        and there must be an analyzer for the poll method.
+
+        Returns a dict with:
+        - view_cats: list of (category, title)
+        - total_vote_power: category -> votes
+        - results: proposal uid -> dict with count, percentages, colouring and passed
+        - pairwise: for ranked methods, (uid a, uid b) -> category -> votes preferring a over b.
+          results will be empty then, since the pass criteria don't apply.
+        - created: timezone aware datetime
+    """
+    analyzer = get_category_analyzer(poll, registry)
+    pairwise_analyzer = None
+    if analyzer is None:
+        pairwise_analyzer = get_pairwise_analyzer(poll, registry)
+        if pairwise_analyzer is None:
+            raise ValueError("No category analyzer for %s" % poll.poll_plugin)
+    meeting = find_interface(poll, IMeeting)
+    total_vote_power = get_total_categorized_vote_power(meeting[GROUPS_NAME])
+    hashed, categorized = analyze_vote_distribution(poll)
+    view_cats = get_view_cats()
+    results = {}
+    pairwise = None
+    if analyzer is not None:
+        counts = analyzer(hashed, categorized)
+        for uid in set(poll.proposals) | set(counts):
+            vote_count = counts.get(uid, Counter())
+            percentages = get_percentages(vote_count, total_vote_power, view_cats)
+            results[uid] = {
+                'count': dict(vote_count),
+                'percentages': percentages,
+                'colouring': get_colouring(percentages),
+                'passed': percentages_pass(percentages),
+            }
+    else:
+        pairwise = dict((pair, dict(counter)) for (pair, counter) in pairwise_analyzer(hashed, categorized).items())
+    return {
+        'view_cats': view_cats,
+        'total_vote_power': dict(total_vote_power),
+        'results': results,
+        'pairwise': pairwise,
+        'created': datetime.now(UTC).replace(microsecond=0),
+    }
+
+
+def get_category_results(poll):
+    """ Returns the stored result or None. """
+    return getattr(poll, _RESULTS_ATTR, None)
+
+
+def store_category_results(poll, registry=None):
+    """ Calculate and store the result. Returns it, or None if it can't be calculated right now. """
+    try:
+        results = calculate_category_results(poll, registry)
+    except (ValueError, HTTPBadRequest):
+        clear_category_results(poll)
+        return
+    setattr(poll, _RESULTS_ATTR, results)
+    return results
+
+
+def clear_category_results(poll):
+    if get_category_results(poll) is not None:
+        setattr(poll, _RESULTS_ATTR, None)
+
+
+def category_results_subscriber(obj, event):
+    """ Store the result when a poll closes, remove it if it's reopened. """
+    meeting = find_interface(obj, IMeeting)
+    if meeting is None or GROUPS_NAME not in meeting:
+        return
+    if obj.get_workflow_state() == 'closed':
+        store_category_results(obj)
+    else:
+        clear_category_results(obj)
+
+
+def includeme(config):
+    from arche.interfaces import IWorkflowAfterTransition
+    from voteit.core.models.interfaces import IPoll
+    config.add_subscriber(category_results_subscriber, [IPoll, IWorkflowAfterTransition])
@@ -10,7 +10,20 @@ from pyramid.traversal import resource_path
 from skl_owner_groups.interfaces import IVGroup
 from skl_owner_groups.interfaces import IVGroups
 from skl_owner_groups.interfaces import GRUPPKATEGORIER
-from skl_owner_groups.models import extract_owner_data
+from skl_owner_groups.models import OwnerImporter
+from skl_owner_groups.models import OwnerRows
+from skl_owner_groups.models import parse_owner_rows
+from skl_owner_groups.participants import ParticipantIndex
+from skl_owner_groups.participants import participant_label
+from skl_owner_groups.refdata import available_years
+from skl_owner_groups.widgets import ParticipantSearchWidget
+
+
+@colander.deferred
+def reference_year_widget(node, kw):
+    values = [('', "Nuvarande")]
+    values.extend([(str(x), str(x)) for x in reversed(available_years())])
+    return deform.widget.SelectWidget(values=values)
 
 
 class CreateSchema(colander.Schema):
@@ -20,6 +33,13 @@ class CreateSchema(colander.Schema):
         default=False,
         validator=colander.Function(lambda x: x == True, msg="Inte markerad")
     )
+    year = colander.SchemaNode(
+        colander.String(),
+        title="Lista över kommuner och regioner",
+        description="Välj året mötet gäller om listorna har ändrats sedan dess.",
+        missing="",
+        widget=reference_year_widget,
+    )
 
 
 class SettingsSchema(colander.Schema):
@@ -33,36 +53,51 @@ class SettingsSchema(colander.Schema):
         title="Titel",
         validator=colander.Length(min=3, max=15)
     )
+    weighted_votes = colander.SchemaNode(
+        colander.Bool(),
+        title="Viktade röster",
+        description="Användare med flera röster lägger en röst med vikt, istället för att rösten "
+                    "kopieras en gång per rösttal. Ändra inte under en pågående omröstning.",
+        default=False,
+    )
+
+
+class OwnerRowsType(colander.String):
+    """ Tab separated text, deserialized to OwnerRows. Problems are collected on the rows,
+        so the validator can report all of them at once.
+    """
+
+    def serialize(self, node, appstruct):
+        if isinstance(appstruct, OwnerRows):
+            appstruct = "\n".join("%s\t%s" % (email, group_name) for (rownum, email, group_name) in appstruct)
+        return super(OwnerRowsType, self).serialize(node, appstruct)
+
+    def deserialize(self, node, cstruct):
+        value = super(OwnerRowsType, self).deserialize(node, cstruct)
+        if value is colander.null:
+            return value
+        return parse_owner_rows(value)
 
 
 @colander.deferred
 class CSVTextValidator(object):
+    """ Checks all rows and reports every problem in one message. Accepts OwnerRows or text. """
 
     def __init__(self, node, kw):
         self.context = kw['context']
         assert IVGroups.providedBy(self.context)
 
     def __call__(self, node, value):
-        try:
-            potential_data = tuple(extract_owner_data(value))
-        except ValueError as exc:
-            raise colander.Invalid(node, exc.message)
-        counter = 1
-        processed_emails = set()
-        processed_names = set()
-        for (email, group_name) in potential_data:
-            email = email.strip()
-            email_validator = colander.Email("Rad %s har en ogiltig epostadress: %s" % (counter, email))
-            email_validator(node, email)
-            if group_name not in self.context:
-                raise colander.Invalid(node, "Rad %s har ett gruppnamn som inte finns: %s" % (counter, group_name))
-            if email in processed_emails:
-                raise colander.Invalid(node, "Rad %s försöker lägga till en epostadress som redan använts: %s" % (counter, email))
-            processed_emails.add(email)
-            if group_name in processed_names:
-                raise colander.Invalid(node, "Rad %s försöker lägga till ett gruppnamn som redan använts: %s" % (counter, group_name))
-            processed_names.add(group_name)
-            counter += 1
+        if not isinstance(value, OwnerRows):
+            value = parse_owner_rows(value)
+        errors = list(value.errors)
+        checker = OwnerImporter(self.context, validate=True)
+        for (rownum, email, group_name) in value:
+            error = checker.check_row(rownum, email, group_name)
+            if error:
+                errors.append((rownum, error))
+        if errors:
+            raise colander.Invalid(node, "\n".join(msg for (rownum, msg) in sorted(errors)))
 
 
 class AssignPotentialOwnersSchema(colander.Schema):
@@ -70,7 +105,7 @@ class AssignPotentialOwnersSchema(colander.Schema):
                   "Om en användare redan finns i systemet och har en matchande epostadress så " \
                   "knyts den personen som ansvarig direkt."
     csv_text = colander.SchemaNode(
-        colander.String(),
+        OwnerRowsType(),
         title = "Klistra in kolumner från excel eller dylikt",
         description="Ska ha formatet <epost>   <kommunkod> <kommunnamn>, ex namn.namnsson@nynashamn.se	0192 NYNÄSHAMN. "
                     "Notera att det är tab mellan epost och kommunkod - vilket det blir automatiskt om "
@@ -90,6 +125,43 @@ class AssignPotentialOwnersSchema(colander.Schema):
     )
 
 
+class RequestTmpStore(dict):
+    """ Uploads are imported in the same request, so they don't need to be kept in the session. """
+
+    def preview_url(self, uid):
+        return None
+
+
+@colander.deferred
+def upload_widget(node, kw):
+    """ A new tmpstore for each form, so uploads are dropped with the request
+        and never shared between users.
+    """
+    return deform.widget.FileUploadWidget(RequestTmpStore())
+
+
+class ImportOwnersFileSchema(colander.Schema):
+    description = "Importera ansvariga från en csv- eller xlsx-fil, t.ex. en export från medlemsregistret. " \
+                  "Första kolumnen ska vara epost och andra kolumnen kommunkod eller regionkod, " \
+                  "gärna följt av namnet. Övriga kolumner ignoreras. " \
+                  "Om någon rad har fel importeras ingenting."
+    upload = colander.SchemaNode(
+        deform.FileData(),
+        title="Fil",
+        widget=upload_widget,
+    )
+    clear_all_existing = colander.SchemaNode(
+        colander.Bool(),
+        title = "Radera alla nuvarande potentiella ansvariga?",
+        description="Påverkar inte grupper som redan har en ansvarig och inte bara en potentiell ansvarig."
+    )
+    overwrite_owner = colander.SchemaNode(
+        colander.Bool(),
+        title = "Byt ansvarig för kommuner som redan har en annan ansvarig person "
+                "om den nya ansvariga finns registrerad i systemet?",
+    )
+
+
 @colander.deferred
 class SingleGroupMembershipValidator(object):
 
@@ -97,14 +169,16 @@ class SingleGroupMembershipValidator(object):
         self.context = kw['context']  # The group here
 
     def __call__(self, node, value):
+        if not value:
+            return
         groups = find_interface(self.context, IVGroups)
-        for group in groups.values():
-            if group is self.context:
-                continue
-            if group.owner == value:
-                raise colander.Invalid(node,
-                                       "AnvändarID '{}' är redan ansvarig för '{}'".format(value, group.title)
-                                       )
+        # Existing data may have users that own several groups, so check all of them
+        names = [x for x in groups.get_owned_groups(value) if x in groups and groups[x] is not self.context]
+        if not names:
+            return
+        raise colander.Invalid(node,
+                               "AnvändarID '{}' är redan ansvarig för '{}'".format(value, groups[names[0]].title)
+                               )
 
 
 @colander.deferred
@@ -137,26 +211,37 @@ class UsableAsDelegationValidator(object):
 def meeting_users_widget(node, kw):
     """ We're simply going to guess that anyone with a local role within the meeting is an eligible candidate.
         It's okay to add things that the validator will block, since that at least explains why it won't work.
+
+        Participants are searched with AJAX, so only the current owner is loaded here.
     """
     request = kw['request']
-    meeting = request.meeting
-    root = request.root
+    context = kw['context']
+    groups = find_interface(context, IVGroups)
+    index = ParticipantIndex(request.meeting)
+
+    def _label(userid):
+        return participant_label(userid, index.get_title(userid, ''))
+
     values = [('', '(Ingen)')]
-    for userid in meeting.local_roles.keys():
-        user = root['users'].get(userid, None)
-        if user is None:
-            continue
-        values.append((userid, "{} ({})".format(user.title, userid)))
-    return deform.widget.Select2Widget(multiple=False, values=values)
+    if IVGroup.providedBy(context) and context.owner:
+        values.append((context.owner, _label(context.owner)))
+    return ParticipantSearchWidget(
+        values=values,
+        get_label=_label,
+        url=request.resource_url(groups, '_participants.json', query={'group': context.__name__}),
+    )
 
 
 def _get_categorized_groups(groups):
+    """ Returns a dict with category -> listing rows sorted on title.
+        The cached listing rows are used, so no group objects need to be loaded.
+    """
     assert IVGroups.providedBy(groups)
     results = {}
-    for group in groups.get_sorted_values():
-        assert group.category, "%s has no category" % group.title
-        found = results.setdefault(group.category, [])
-        found.append(group)
+    for row in groups.get_listing_rows():
+        assert row.category, "%s has no category" % row.title
+        found = results.setdefault(row.category, [])
+        found.append(row)
     return results
 
 
@@ -168,7 +253,7 @@ def delegation_widget(node, kw):
     values = [('', '(Ingen)')]
     for (category, items) in _get_categorized_groups(groups).items():
         title = titles.get(category, '(Okänd)')
-        cat_values = [(x.__name__, x.title) for x in items]
+        cat_values = [(x.name, x.title) for x in items]
         optgroup = deform.widget.OptGroup(title, *cat_values)
         values.append(optgroup)
     return deform.widget.Select2Widget(multiple=False, values=values)
@@ -228,5 +313,6 @@ def includeme(config):
     config.add_schema('VGroups', CreateSchema, 'create')
     config.add_schema('VGroups', SettingsSchema, 'edit')
     config.add_schema('VGroups', AssignPotentialOwnersSchema, 'assign')
+    config.add_schema('VGroups', ImportOwnersFileSchema, 'import_file')
     config.add_schema('VGroup', AddGroupSchema, 'add')
     config.add_schema('VGroup', GroupSchema, 'edit')
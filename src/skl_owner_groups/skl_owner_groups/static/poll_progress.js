@@ -0,0 +1,63 @@
+/* Update the progress bars of ongoing polls without reloading the polls portlet.
+ * Elements with data-skl-progress-url are refreshed from _skl_poll_progress.json.
+ */
+(function () {
+    'use strict';
+
+    var INTERVAL = 5000;
+
+    function progressElements() {
+        return document.querySelectorAll('[data-skl-progress-url]');
+    }
+
+    function update(elem, progress) {
+        var fields = elem.querySelectorAll('[data-skl-progress-field]');
+        for (var i = 0; i < fields.length; i++) {
+            var name = fields[i].getAttribute('data-skl-progress-field');
+            if (progress[name] !== undefined) {
+                fields[i].textContent = progress[name];
+            }
+        }
+        var bar = elem.querySelector('[data-skl-progress-bar]');
+        if (bar) {
+            bar.style.width = progress.percentage + '%';
+            bar.setAttribute('aria-valuenow', progress.percentage);
+        }
+    }
+
+    function refresh() {
+        var elems = progressElements();
+        var byUrl = {};
+        for (var i = 0; i < elems.length; i++) {
+            var url = elems[i].getAttribute('data-skl-progress-url');
+            (byUrl[url] = byUrl[url] || []).push(elems[i]);
+        }
+        Object.keys(byUrl).forEach(function (url) {
+            var xhr = new XMLHttpRequest();
+            xhr.open('GET', url);
+            xhr.setRequestHeader('Accept', 'application/json');
+            xhr.onload = function () {
+                if (xhr.status !== 200) {
+                    return;
+                }
+                var polls = JSON.parse(xhr.responseText).polls;
+                byUrl[url].forEach(function (elem) {
+                    var progress = polls[elem.getAttribute('data-skl-progress')];
+                    if (progress) {
+                        update(elem, progress);
+                    } else {
+                        // Not ongoing anymore
+                        elem.removeAttribute('data-skl-progress-url');
+                    }
+                });
+            };
+            xhr.send();
+        });
+    }
+
+    setInterval(function () {
+        if (!document.hidden) {
+            refresh();
+        }
+    }, INTERVAL);
+}());
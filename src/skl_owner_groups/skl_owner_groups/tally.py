@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+from hashlib import md5
+from json import dumps
+
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
+from six import string_types
+from voteit.core.models.interfaces import IVote
+
+
+_TALLY_ATTR = '_skl_vote_tally'
+# Bump this when the storage format changes. Tallies in another format are rebuilt when needed.
+_TALLY_VERSION = 2
+
+
+def vote_checksum(vote_content):
+    """ A checksum that is the same for identical ballots. """
+    if isinstance(vote_content, string_types):
+        hashable_content = vote_content
+    else:
+        hashable_content = dumps(vote_content, sort_keys=True)
+    if not isinstance(hashable_content, bytes):
+        hashable_content = hashable_content.encode('utf-8')
+    return md5(hashable_content).hexdigest()
+
+
+def get_vote_weights(vote):
+    """ Returns a dict with category -> number of votes this vote object represents.
+        Weighted votes carry the attribute 'weights', all other votes count as one vote
+        in their category.
+    """
+    weights = getattr(vote, 'weights', None)
+    if weights:
+        return dict(weights)
+    return {getattr(vote, 'category', ''): 1}
+
+
+def distribution_from_votes(poll):
+    """ Read every vote in the poll and return a tuple with:
+        - checksum -> vote data
+        - category -> Counter with checksum -> number of votes
+    """
+    hashed = {}
+    categorized = {}
+    for v in [x for x in poll.values() if IVote.providedBy(x)]:
+        vote_content = v.get_vote_data()
+        checksum = vote_checksum(vote_content)
+        if checksum not in hashed:
+            hashed[checksum] = vote_content
+        for (category, weight) in get_vote_weights(v).items():
+            counter = categorized.setdefault(category, Counter())
+            counter[checksum] += weight
+    return hashed, categorized
+
+
+def weighted_ballots(poll):
+    """ Ballots in the same format as voteit.core uses for poll.ballots,
+        a tuple of (vote data, count), where the count respects vote weights.
+    """
+    tally = VoteTally(poll)
+    if tally.exists:
+        hashed, categorized = tally.distribution()
+    else:
+        hashed, categorized = distribution_from_votes(poll)
+    counter = Counter()
+    for votemap in categorized.values():
+        counter.update(votemap)
+    return tuple((hashed[checksum], count) for (checksum, count) in counter.items())
+
+
+class VoteTally(object):
+    """ A running tally of the categorized votes in a poll, so the distribution can be read
+        without loading every vote object.
+
+        It's stored on the poll and kept up to date by the vote subscribers in models.
+        The counters are Length objects, since they resolve write conflicts when
+        several votes are added at the same time.
+
+        Storage:
+        - votes: vote name -> (checksum, ((category, weight), ...))
+        - hashed: checksum -> vote data
+        - counts: (category, checksum) -> Length
+        - total: Length with the total number of votes, including weights
+        - version: the format of the storage, tallies with an older format count as missing
+    """
+
+    def __init__(self, context):
+        self.context = context
+
+    @property
+    def exists(self):
+        storage = getattr(self.context, _TALLY_ATTR, None)
+        return storage is not None and storage.get('version', 1) == _TALLY_VERSION
+
+    @property
+    def storage(self):
+        return getattr(self.context, _TALLY_ATTR)
+
+    def ensure(self):
+        """ Create the tally if it doesn't exist or has an older format. Existing votes will be added. """
+        if not self.exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """ Recompute the tally from the votes in the poll. """
+        storage = OOBTree()
+        storage['votes'] = OOBTree()
+        storage['hashed'] = OOBTree()
+        storage['counts'] = OOBTree()
+        storage['total'] = Length()
+        storage['version'] = _TALLY_VERSION
+        setattr(self.context, _TALLY_ATTR, storage)
+        for vote in [x for x in self.context.values() if IVote.providedBy(x)]:
+            self.add(vote)
+
+    def discard(self):
+        """ Remove the tally. It will be rebuilt from the votes the next time it's needed. """
+        if getattr(self.context, _TALLY_ATTR, None) is not None:
+            setattr(self.context, _TALLY_ATTR, None)
+
+    def add(self, vote):
+        vote_content = vote.get_vote_data()
+        checksum = vote_checksum(vote_content)
+        weights = tuple(sorted(get_vote_weights(vote).items()))
+        storage = self.storage
+        if checksum not in storage['hashed']:
+            storage['hashed'][checksum] = vote_content
+        for (category, weight) in weights:
+            key = (category, checksum)
+            if key not in storage['counts']:
+                storage['counts'][key] = Length()
+            storage['counts'][key].change(weight)
+            storage['total'].change(weight)
+        storage['votes'][vote.__name__] = (checksum, weights)
+
+    def remove(self, name):
+        storage = self.storage
+        entry = storage['votes'].pop(name, None)
+        if entry is None:
+            return
+        (checksum, weights) = entry
+        for (category, weight) in weights:
+            storage['counts'][(category, checksum)].change(-weight)
+            storage['total'].change(-weight)
+
+    def update(self, vote):
+        self.remove(vote.__name__)
+        self.add(vote)
+
+    def vote_weights(self):
+        """ Returns a dict with vote name -> category -> votes for all tallied votes. """
+        return dict((name, dict(weights)) for (name, (checksum, weights)) in self.storage['votes'].items())
+
+    @property
+    def total(self):
+        """ Number of votes, including weights. """
+        return self.storage['total']()
+
+    def distribution(self):
+        """ Same format as distribution_from_votes. """
+        hashed = {}
+        categorized = {}
+        storage = self.storage
+        for ((category, checksum), length) in storage['counts'].items():
+            count = length()
+            if not count:
+                continue
+            counter = categorized.setdefault(category, Counter())
+            counter[checksum] += count
+            if checksum not in hashed:
+                hashed[checksum] = storage['hashed'][checksum]
+        return hashed, categorized
+
+    def check(self):
+        """ Compare the tally with the actual votes in the poll.
+            Returns a dict with (category, checksum) as key and a tuple of (tallied, actual)
+            as value for all counts that differ. An empty dict means the tally is correct.
+        """
+        tallied = {}
+        for (category, counter) in self.distribution()[1].items():
+            for (checksum, count) in counter.items():
+                tallied[(category, checksum)] = count
+        actual = {}
+        for (category, counter) in distribution_from_votes(self.context)[1].items():
+            for (checksum, count) in counter.items():
+                actual[(category, checksum)] = count
+        problems = {}
+        for key in set(tallied) | set(actual):
+            if tallied.get(key, 0) != actual.get(key, 0):
+                problems[key] = (tallied.get(key, 0), actual.get(key, 0))
+        return problems
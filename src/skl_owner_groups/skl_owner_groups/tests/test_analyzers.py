@@ -0,0 +1,125 @@
+from collections import Counter
+from unittest import TestCase
+
+from pyramid import testing
+from voteit.core.models.poll import Poll
+
+
+class CountSupportedTests(TestCase):
+
+    def _fixture(self):
+        hashed = {
+            'one': {'uid1': 'approve', 'uid2': 'deny'},
+            'two': {'uid1': 'approve', 'uid2': 'approve'},
+            'three': {'uid1': 'deny', 'uid2': 'deny'},
+        }
+        categorized = {
+            'kommun': Counter({'one': 3, 'two': 1}),
+            'region': Counter({'two': 2, 'three': 4}),
+        }
+        return hashed, categorized
+
+    @property
+    def _fut(self):
+        from skl_owner_groups.analyzers import count_supported
+        return count_supported
+
+    def test_count(self):
+        hashed, categorized = self._fixture()
+        supported = lambda x: [k for (k, v) in x.items() if v == 'approve']
+        results = self._fut(hashed, categorized, supported)
+        self.assertEqual(results['uid1'], {'kommun': 4, 'region': 2, 'total': 6})
+        self.assertEqual(results['uid2'], {'kommun': 1, 'region': 2, 'total': 3})
+
+    def test_ballot_weights(self):
+        from skl_owner_groups.analyzers import ballot_weights
+        hashed, categorized = self._fixture()
+        weights = ballot_weights(categorized)
+        self.assertEqual(weights['two'], {'kommun': 1, 'region': 2, 'total': 3})
+        self.assertEqual(weights['three'], {'region': 4, 'total': 4})
+
+
+class AnalyzersTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.include('skl_owner_groups.analyzers')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _analyzer(self, poll_plugin):
+        from skl_owner_groups.analyzers import get_category_analyzer
+        poll = Poll(poll_plugin=poll_plugin)
+        poll.proposals = ('uid1', 'uid2', 'uid3')
+        return get_category_analyzer(poll, self.config.registry)
+
+    def test_base_class_is_abstract(self):
+        from skl_owner_groups.analyzers import CategoryAnalyzer
+        self.assertRaises(TypeError, CategoryAnalyzer, Poll())
+
+    def test_unknown_method(self):
+        self.assertIsNone(self._analyzer('404'))
+
+    def test_combined_simple(self):
+        analyzer = self._analyzer('combined_simple')
+        hashed = {'one': {'uid1': 'approve', 'uid2': 'deny'}}
+        categorized = {'kommun': Counter({'one': 3})}
+        self.assertEqual(analyzer(hashed, categorized), {'uid1': {'kommun': 3, 'total': 3}})
+
+    def test_majority_poll(self):
+        analyzer = self._analyzer('majority_poll')
+        hashed = {'one': {'proposal': 'uid1'}, 'two': {'proposal': 'uid2'}}
+        categorized = {'skl': Counter({'one': 5}), 'kommun': Counter({'one': 1, 'two': 2})}
+        results = analyzer(hashed, categorized)
+        self.assertEqual(results['uid1'], {'skl': 5, 'kommun': 1, 'total': 6})
+        self.assertEqual(results['uid2'], {'kommun': 2, 'total': 2})
+
+    def test_dutt(self):
+        analyzer = self._analyzer('dutt')
+        hashed = {'one': {'proposals': ['uid1', 'uid3']}}
+        categorized = {'region': Counter({'one': 2})}
+        self.assertEqual(analyzer(hashed, categorized), {'uid1': {'region': 2, 'total': 2},
+                                                         'uid3': {'region': 2, 'total': 2}})
+
+    def _pairwise(self, poll_plugin):
+        from skl_owner_groups.analyzers import get_pairwise_analyzer
+        poll = Poll(poll_plugin=poll_plugin)
+        poll.proposals = ('uid1', 'uid2', 'uid3')
+        return get_pairwise_analyzer(poll, self.config.registry)
+
+    def test_ranked_methods_not_counted_per_proposal(self):
+        self.assertIsNone(self._analyzer('schulze'))
+        self.assertIsNone(self._analyzer('stv'))
+
+    def test_stv_pairwise(self):
+        analyzer = self._pairwise('stv')
+        hashed = {'one': {'proposals': ['uid2', 'uid1']}, 'two': {'proposals': ['uid1']}}
+        categorized = {'kommun': Counter({'one': 2, 'two': 1}), 'skl': Counter({'two': 3})}
+        matrix = analyzer(hashed, categorized)
+        self.assertEqual(matrix[('uid2', 'uid1')], {'kommun': 2, 'total': 2})
+        self.assertEqual(matrix[('uid1', 'uid2')], {'kommun': 1, 'skl': 3, 'total': 4})
+
+    def test_schulze_pairwise(self):
+        analyzer = self._pairwise('schulze')
+        hashed = {
+            'one': {'uid1': 3, 'uid2': 1, 'uid3': 1},
+            'two': {'uid1': 1, 'uid2': 2},
+        }
+        categorized = {'kommun': Counter({'one': 2}), 'region': Counter({'two': 1})}
+        matrix = analyzer(hashed, categorized)
+        self.assertEqual(matrix[('uid1', 'uid2')], {'kommun': 2, 'total': 2})
+        self.assertEqual(matrix[('uid2', 'uid1')], {'region': 1, 'total': 1})
+        # Unranked uid3 is worse than everything on ballot two
+        self.assertEqual(matrix[('uid2', 'uid3')], {'region': 1, 'total': 1})
+        # Tied on ballot one
+        self.assertNotIn(('uid3', 'uid2'), matrix)
+
+    def test_schulze_tied_top_counts(self):
+        analyzer = self._pairwise('schulze')
+        hashed = {'one': {'uid1': 5, 'uid2': 5, 'uid3': 1}}
+        categorized = {'kommun': Counter({'one': 2})}
+        matrix = analyzer(hashed, categorized)
+        self.assertEqual(matrix[('uid1', 'uid3')], {'kommun': 2, 'total': 2})
+        self.assertEqual(matrix[('uid2', 'uid3')], {'kommun': 2, 'total': 2})
+        self.assertNotIn(('uid1', 'uid2'), matrix)
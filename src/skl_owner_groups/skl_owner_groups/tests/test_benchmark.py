@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+
+class CompareTests(TestCase):
+
+    @property
+    def _fut(self):
+        from skl_owner_groups.benchmark import compare
+        return compare
+
+    def _result(self, ops_per_sec, loads):
+        return {'ops_per_sec': ops_per_sec, 'loads': loads, 'stores': 0, 'peak_memory_kb': 0}
+
+    def test_within_tolerance(self):
+        baseline = {'a': self._result(100, 100)}
+        results = {'a': self._result(90, 110)}
+        self.assertEqual(self._fut(results, baseline, tolerance=0.2), [])
+
+    def test_slower(self):
+        baseline = {'a': self._result(100, 100)}
+        results = {'a': self._result(50, 100)}
+        self.assertEqual(len(self._fut(results, baseline, tolerance=0.2)), 1)
+
+    def test_more_loads(self):
+        baseline = {'a': self._result(100, 100)}
+        results = {'a': self._result(100, 200)}
+        self.assertEqual(len(self._fut(results, baseline, tolerance=0.2)), 1)
+
+    def test_new_benchmark_ignored(self):
+        results = {'a': self._result(1, 1000)}
+        self.assertEqual(self._fut(results, {}), [])
+
+
+class VotingBenchmarkTests(TestCase):
+
+    def test_smoke(self):
+        from skl_owner_groups.benchmark import VotingBenchmark
+        results = VotingBenchmark(voters=5, repeat=1).run()
+        self.assertIn('multiply_and_categorize_votes (add)', results)
+        self.assertIn('create groups (add_groups)', results)
+        for result in results.values():
+            self.assertEqual(set(result), set(['ops_per_sec', 'loads', 'stores', 'peak_memory_kb']))
+            self.assertGreaterEqual(result['peak_memory_kb'], 0)
@@ -0,0 +1,219 @@
+from unittest import TestCase
+
+import transaction
+from pyramid import testing
+from voteit.core.models.poll import Poll
+from voteit.core.models.vote import Vote
+
+
+class _Pipeline(object):
+    """ Runs commands right away until multi is called, then buffers them like a transaction. """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = None
+
+    def multi(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if self.calls is None:
+            return method
+
+        def _call(*args, **kw):
+            self.calls.append((method, args, kw))
+        return _call
+
+    def execute(self):
+        for (method, args, kw) in self.calls:
+            method(*args, **kw)
+
+
+class _Redis(object):
+    """ The parts of the redis client the counters use. Writes bump version,
+        which is what watched keys are compared with.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.version = 0
+        self.transactions = 0
+
+    def transaction(self, func, *watches):
+        while True:
+            self.transactions += 1
+            version = self.version
+            pipe = _Pipeline(self)
+            func(pipe)
+            if self.version == version:
+                pipe.execute()
+                return
+
+    def hexists(self, key, field):
+        return field in self.data.get(key, {})
+
+    def hincrby(self, key, field, amount):
+        self.version += 1
+        values = self.data.setdefault(key, {})
+        values[field] = int(values.get(field, 0)) + amount
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hset(self, key, mapping):
+        self.version += 1
+        self.data.setdefault(key, {}).update(mapping)
+
+    def sismember(self, key, value):
+        return value in self.data.get(key, set())
+
+    def sadd(self, key, *values):
+        self.version += 1
+        self.data.setdefault(key, set()).update(values)
+
+    def srem(self, key, value):
+        self.version += 1
+        self.data.get(key, set()).discard(value)
+
+    def rpush(self, key, value):
+        self.version += 1
+        self.data.setdefault(key, []).append(value)
+
+    def lrange(self, key, start, end):
+        return list(self.data.get(key, []))
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, *keys):
+        self.version += 1
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class RedisVoteCountersTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        transaction.abort()
+        testing.tearDown()
+
+    def _fixture(self):
+        poll = Poll()
+        for (name, category) in (('a', 'kommun'), ('b', 'kommun'), ('c', 'region')):
+            vote = Vote()
+            vote.set_vote_data('Hello', notify=False)
+            vote.category = category
+            poll[name] = vote
+        return poll
+
+    def _mk_counters(self):
+        from skl_owner_groups.counters import RedisVoteCounters
+        from skl_owner_groups.interfaces import IVoteCounters
+        counters = RedisVoteCounters(_Redis())
+        self.config.registry.registerUtility(counters, IVoteCounters)
+        return counters
+
+    def test_category_counts(self):
+        from skl_owner_groups.counters import category_counts
+        self.assertEqual(category_counts(self._fixture()), {'kommun': 2, 'region': 1})
+
+    def test_read_vote_weights(self):
+        from skl_owner_groups.counters import read_vote_weights
+        self.assertEqual(read_vote_weights(self._fixture()),
+                         {'a': {'kommun': 1}, 'b': {'kommun': 1}, 'c': {'region': 1}})
+
+    def test_get_live_counts_doesnt_sync(self):
+        from skl_owner_groups.counters import get_live_counts
+        poll = self._fixture()
+        self._mk_counters()
+        self.assertIsNone(get_live_counts(poll))
+
+    def test_get_live_counts_without_redis(self):
+        from skl_owner_groups.counters import get_live_counts
+        self.assertIsNone(get_live_counts(self._fixture()))
+
+    def test_set(self):
+        counters = self._mk_counters()
+        counters.set('uid', lambda: {'a': {'kommun': 2}, 'b': {'region': 1}})
+        self.assertEqual(counters.get('uid'), {'kommun': 2, 'region': 1, 'total': 3})
+
+    def test_add_ignores_unsynced(self):
+        counters = self._mk_counters()
+        counters.add('uid', {'a': {'kommun': 1}})
+        self.assertIsNone(counters.get('uid'))
+
+    def test_pending_votes_applied_on_set(self):
+        counters = self._mk_counters()
+        # The poll started, but the counters haven't been set yet
+        snapshot = {'a': {'kommun': 1}}
+        counters.add('uid', {'b': {'region': 2}})
+        counters.remove('uid', {'a': {'kommun': 1}})
+        counters.add('uid', {'c': {'kommun': 1}})
+        counters.remove('uid', {'c': {'kommun': 1}})
+        counters.set('uid', lambda: snapshot)
+        self.assertEqual(counters.get('uid'), {'region': 2, 'total': 2})
+        self.assertEqual(snapshot, {'a': {'kommun': 1}})
+        # The pending votes are cleared by the sync
+        counters.set('uid', lambda: {})
+        self.assertEqual(counters.get('uid'), {'total': 0})
+
+    def test_poll_started_hook_keeps_later_votes(self):
+        from skl_owner_groups.counters import _poll_started_hook
+        counters = self._mk_counters()
+        # Vote b is committed after the poll started, but before the hook runs
+        counters.add('uid', {'b': {'kommun': 1}})
+        _poll_started_hook(True, counters, 'uid', {'a': {'kommun': 1}})
+        self.assertEqual(counters.get('uid'), {'kommun': 2, 'total': 2})
+
+    def test_add_and_remove_once(self):
+        counters = self._mk_counters()
+        counters.set('uid', lambda: {'a': {'kommun': 1}})
+        counters.add('uid', {'a': {'kommun': 1}, 'b': {'region': 2}})
+        self.assertEqual(counters.get('uid'), {'kommun': 1, 'region': 2, 'total': 3})
+        counters.remove('uid', {'b': {'region': 2}, 'c': {'kommun': 1}})
+        counters.remove('uid', {'b': {'region': 2}})
+        self.assertEqual(counters.get('uid'), {'kommun': 1, 'region': 0, 'total': 1})
+
+    def test_set_retried_when_votes_are_counted(self):
+        counters = self._mk_counters()
+        counters.set('uid', lambda: {})
+        snapshots = [{'a': {'kommun': 1}}, {'a': {'kommun': 1}, 'b': {'kommun': 1}}]
+
+        def _read():
+            votes = snapshots.pop(0)
+            if snapshots:
+                # Vote b is committed and counted while the first snapshot is read
+                counters.add('uid', {'b': {'kommun': 1}})
+            return votes
+
+        counters.set('uid', _read)
+        self.assertEqual(counters.get('uid'), {'kommun': 2, 'total': 2})
+        # The hook for vote a runs late, it's already counted
+        counters.add('uid', {'a': {'kommun': 1}})
+        self.assertEqual(counters.get('uid'), {'kommun': 2, 'total': 2})
+
+    def test_count_votes_after_commit(self):
+        from skl_owner_groups.counters import count_votes
+        poll = self._fixture()
+        counters = self._mk_counters()
+        counters.set(poll.uid, lambda: {'a': {'kommun': 1}})
+        count_votes(poll, {'b': {'kommun': 2}})
+        self.assertEqual(counters.get(poll.uid)['total'], 1)
+        transaction.commit()
+        self.assertEqual(counters.get(poll.uid), {'kommun': 3, 'total': 3})
+        count_votes(poll, {'a': {'kommun': 1}}, remove=True)
+        transaction.commit()
+        self.assertEqual(counters.get(poll.uid), {'kommun': 2, 'total': 2})
+
+    def test_count_votes_aborted(self):
+        from skl_owner_groups.counters import count_votes
+        poll = self._fixture()
+        counters = self._mk_counters()
+        counters.set(poll.uid, lambda: {})
+        count_votes(poll, {'a': {'kommun': 2}})
+        transaction.abort()
+        self.assertEqual(counters.get(poll.uid)['total'], 0)
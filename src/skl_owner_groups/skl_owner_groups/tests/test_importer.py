@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from io import BytesIO
+from unittest import TestCase
+
+from pyramid import testing
+from pyramid.request import apply_request_extensions
+from voteit.core.models.meeting import Meeting
+from voteit.core.testing_helpers import bootstrap_and_fixture
+
+from skl_owner_groups.interfaces import GROUPS_NAME
+
+
+class RowReaderTests(TestCase):
+
+    def test_csv_delimiter(self):
+        from skl_owner_groups.importer import iter_csv_rows
+        fp = BytesIO("a@b.se;0114 UPPLANDS VÄSBY;x\nc@d.se;AB\n".encode('utf-8'))
+        self.assertEqual(list(iter_csv_rows(fp)), [['a@b.se', '0114 UPPLANDS VÄSBY', 'x'], ['c@d.se', 'AB']])
+
+    def test_csv_tab_with_bom(self):
+        from skl_owner_groups.importer import iter_csv_rows
+        fp = BytesIO("﻿a@b.se\t0114\n".encode('utf-8'))
+        self.assertEqual(list(iter_csv_rows(fp)), [['a@b.se', '0114']])
+
+    def test_owner_rows(self):
+        from skl_owner_groups.importer import iter_owner_rows
+        rows = [['Epost', 'Kommun'], [], ['a@b.se', '0114 UPPLANDS VÄSBY'], ['c@d.se', 114.0], ['e@f.se', None]]
+        self.assertEqual(list(iter_owner_rows(rows)),
+                         [(3, 'a@b.se', '0114'), (4, 'c@d.se', '0114'), (5, 'e@f.se', '')])
+
+    def test_unsupported_file(self):
+        from skl_owner_groups.importer import get_row_reader
+        self.assertRaises(ValueError, get_row_reader, 'owners.pdf')
+
+
+class ImportOwnersFileTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.include('arche.testing')
+        self.config.include('arche.testing.catalog')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _fixture(self):
+        root = bootstrap_and_fixture(self.config)
+        self.config.include('skl_owner_groups.resources')
+        request = testing.DummyRequest()
+        apply_request_extensions(request)
+        self.config.begin(request)
+        request.root = root
+        root['m'] = meeting = Meeting()
+        root.users['adam'] = request.content_factories['User'](email='adam@email.org', email_validated=True)
+        groups = meeting[GROUPS_NAME] = request.content_factories['VGroups']()
+        gfact = request.content_factories['VGroup']
+        groups['0114'] = gfact(title='Upplands Väsby')
+        groups['AB'] = gfact(title='Region Stockholm')
+        return groups
+
+    @property
+    def _fut(self):
+        from skl_owner_groups.importer import import_owners_file
+        return import_owners_file
+
+    def test_import(self):
+        groups = self._fixture()
+        fp = BytesIO("epost;kod\nadam@email.org;0114 UPPLANDS VÄSBY\nnew@email.org;AB\n".encode('utf-8'))
+        importer, results = self._fut(groups, fp, 'owners.csv')
+        self.assertEqual(importer.errors, [])
+        self.assertEqual(importer.rows, 2)
+        self.assertEqual(groups['0114'].owner, 'adam')
+        self.assertEqual(groups['AB'].potential_owner, 'new@email.org')
+        self.assertEqual(results['new_assigned'], 1)
+        self.assertEqual(results['new_potential'], 1)
+
+    def test_all_errors_reported(self):
+        groups = self._fixture()
+        fp = BytesIO("bad;0114\nnew@email.org;404\nnew@email.org;AB\nother@email.org;AB\n".encode('utf-8'))
+        importer, results = self._fut(groups, fp, 'owners.csv')
+        self.assertEqual(len(importer.errors), 3)
+        self.assertIn("Rad 1", importer.errors[0])
+        self.assertIn("Rad 2", importer.errors[1])
+        self.assertIn("Rad 4", importer.errors[2])
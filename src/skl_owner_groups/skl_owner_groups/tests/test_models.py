@@ -85,6 +85,40 @@ class RepresentativesAsVotersTests(TestCase):
         generator = obj.get_voters()
         self.assertRaises(HTTPBadRequest, list, generator)
 
+    def test_diff_voters(self):
+        from skl_owner_groups.models import diff_voters
+        from voteit.core.security import ROLE_VOTER
+        groups, request, presence = self._fixture()
+        meeting = groups.__parent__
+        meeting.local_roles.add('adam', ROLE_VOTER)
+        meeting.local_roles.add('cina', ROLE_VOTER)
+        presence.start_check()
+        presence.add('adam')
+        presence.add('berit')
+        presence.end_check()
+        diff = diff_voters(meeting)
+        self.assertEqual(diff['added'], ['berit'])
+        self.assertEqual(diff['removed'], ['cina'])
+        self.assertEqual(diff['unchanged'], 1)
+        self.assertEqual(diff['vote_power'], {'adam': 1, 'berit': 1})
+        # Dry run
+        self.assertNotIn(ROLE_VOTER, meeting.local_roles.get('berit', ()))
+
+    def test_apply_voters_diff(self):
+        from skl_owner_groups.models import apply_voters_diff
+        from skl_owner_groups.models import diff_voters
+        from voteit.core.security import ROLE_VOTER
+        groups, request, presence = self._fixture()
+        meeting = groups.__parent__
+        meeting.local_roles.add('cina', ROLE_VOTER)
+        presence.start_check()
+        presence.add('adam')
+        presence.end_check()
+        apply_voters_diff(meeting, diff_voters(meeting))
+        self.assertIn(ROLE_VOTER, meeting.local_roles['adam'])
+        self.assertNotIn(ROLE_VOTER, meeting.local_roles.get('cina', ()))
+        self.assertEqual(diff_voters(meeting)['added'], [])
+
 
 class SKLVotePowerTests(TestCase):
 
@@ -225,6 +259,19 @@ class TotalCategorizedVotePowerTests(TestCase):
         groups.delegate_vote_to('c', 'skl')
         self.assertEqual(self._fut(groups), {'skl': 8, 'kommun': 1, 'region': 4, 'total': 13})
 
+    def test_cached_result_follows_presence(self):
+        groups, request, presence = self._fixture()
+        self._present(presence, 'adam', 'teresa')
+        self.assertEqual(self._fut(groups), {'skl': 8, 'kommun': 1, 'total': 9})
+        self._present(presence, 'adam', 'berit')
+        self.assertEqual(self._fut(groups), {'kommun': 3, 'total': 3})
+
+    def test_cached_result_not_modified_by_caller(self):
+        groups, request, presence = self._fixture()
+        self._present(presence, 'adam', 'teresa')
+        self._fut(groups)['total'] = 100
+        self.assertEqual(self._fut(groups)['total'], 9)
+
 
 class MultiplyVotesSubscriberIntegrationTests(TestCase):
 
@@ -334,6 +381,141 @@ class MultiplyVotesSubscriberIntegrationTests(TestCase):
         for v in poll.values():
             self.assertEqual(v.get_vote_data(), 'Bye world')
 
+    def _teresa_voted_fixture(self):
+        meeting = self._poll_fixture()
+        groups = self._groups_fixture(meeting)
+        groups.delegate_vote_to('a', 'skl')
+        groups.delegate_vote_to('b', 'skl')
+        self._mk_request(meeting, 'teresa')
+        self._mk_present(meeting, 'teresa')
+        self._mk_vote_power(groups)  # Presence check and delegation will cause SKL to have 4 votes
+        poll = meeting['ai']['poll']
+        vote = Vote(creators=['teresa'])
+        vote.set_vote_data('Hello world', notify=False)
+        poll['teresa'] = vote
+        return poll
+
+    def test_extra_vote_names_recorded(self):
+        from skl_owner_groups.models import get_extra_vote_names
+        poll = self._teresa_voted_fixture()
+        names = get_extra_vote_names(poll, 'teresa')
+        self.assertEqual(len(names), 4)
+        self.assertEqual(set(names), set(poll.keys()) - {'teresa'})
+
+    def test_extra_vote_names_for_old_polls(self):
+        from skl_owner_groups.models import get_extra_vote_names
+        poll = self._teresa_voted_fixture()
+        poll._skl_extra_votes = None
+        self.assertEqual(set(get_extra_vote_names(poll, 'teresa')), set(poll.keys()) - {'teresa'})
+
+    def test_remove_extra_vote(self):
+        from skl_owner_groups.models import get_extra_vote_names
+        from skl_owner_groups.tally import VoteTally
+        poll = self._teresa_voted_fixture()
+        name = get_extra_vote_names(poll, 'teresa')[0]
+        del poll[name]
+        self.assertNotIn(name, get_extra_vote_names(poll, 'teresa'))
+        self.assertEqual(VoteTally(poll).check(), {})
+
+    def test_remove_initial_vote_removes_copies(self):
+        from skl_owner_groups.tally import VoteTally
+        poll = self._teresa_voted_fixture()
+        self.assertEqual(len(poll), 5)
+        del poll['teresa']
+        self.assertEqual(len(poll), 0)
+        self.assertEqual(VoteTally(poll).total, 0)
+
+    def test_update_sends_one_event(self):
+        from voteit.core.models.interfaces import IVote
+        from skl_owner_groups.interfaces import IExtraVotesUpdated
+        from skl_owner_groups.models import get_extra_vote_names
+        poll = self._teresa_voted_fixture()
+        events = []
+        self.config.add_subscriber(lambda obj, event: events.append(event), [IVote, IExtraVotesUpdated])
+        poll['teresa'].set_vote_data('Bye world')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(set(events[0].names), set(get_extra_vote_names(poll, 'teresa')))
+        self.assertIs(events[0].object, poll['teresa'])
+
+    def test_tally_follows_votes(self):
+        from skl_owner_groups.models import analyze_vote_distribution
+        from skl_owner_groups.tally import VoteTally
+        meeting = self._poll_fixture()
+        groups = self._groups_fixture(meeting)
+        groups.delegate_vote_to('a', 'skl')
+        self._mk_request(meeting, 'teresa')
+        self._mk_present(meeting, 'teresa')
+        self._mk_vote_power(groups)
+        poll = meeting['ai']['poll']
+        vote = Vote()
+        vote.set_vote_data('Hello world', notify=False)
+        poll['teresa'] = vote
+        tally = VoteTally(poll)
+        self.assertTrue(tally.exists)
+        self.assertEqual(tally.check(), {})
+        vote.set_vote_data('Bye world', notify=True)
+        self.assertEqual(tally.check(), {})
+        hashed, categorized = analyze_vote_distribution(poll)
+        self.assertEqual(list(hashed.values()), ['Bye world'])
+        self.assertEqual(sum(categorized['skl'].values()), groups['skl'].base_votes)
+
+    def test_weighted_votes(self):
+        from skl_owner_groups.models import analyze_vote_distribution
+        from skl_owner_groups.tally import weighted_ballots
+        meeting = self._poll_fixture()
+        groups = self._groups_fixture(meeting)
+        groups.weighted_votes = True
+        groups.delegate_vote_to('a', 'skl')
+        groups.delegate_vote_to('c', 'skl')
+        self._mk_request(meeting, 'teresa')
+        self._mk_present(meeting, 'teresa')
+        self._mk_vote_power(groups)
+        poll = meeting['ai']['poll']
+        vote = Vote()
+        vote.set_vote_data('Hello world', notify=False)
+        poll['teresa'] = vote
+        self.assertEqual(len(poll), 1)
+        self.assertEqual(vote.category, 'skl')
+        self.assertEqual(vote.weights, {'skl': 4, 'kommun': 1, 'region': 4})
+        hashed, categorized = analyze_vote_distribution(poll)
+        self.assertEqual(dict((k, sum(v.values())) for (k, v) in categorized.items()),
+                         {'skl': 4, 'kommun': 1, 'region': 4})
+        self.assertEqual(weighted_ballots(poll), (('Hello world', 9),))
+
+    def test_weighted_ballots_on_close(self):
+        from skl_owner_groups.models import WeightedPollPlugin
+        meeting = self._poll_fixture()
+        groups = self._groups_fixture(meeting)
+        groups.weighted_votes = True
+        groups.delegate_vote_to('a', 'skl')
+        groups.delegate_vote_to('c', 'skl')
+        self._mk_request(meeting, 'teresa')
+        self._mk_present(meeting, 'teresa')
+        self._mk_vote_power(groups)
+        poll = meeting['ai']['poll']
+        vote = Vote()
+        vote.set_vote_data('Hello world', notify=False)
+        poll['teresa'] = vote
+        self.assertIsInstance(poll.get_poll_plugin(), WeightedPollPlugin)
+        closed = []
+
+        class _DummyPlugin(object):
+            name = 'dummy'
+            context = poll
+
+            def handle_close(self):
+                closed.append(self.context.ballots)
+
+        poll.ballots = (('Hello world', 1),)
+        plugin = WeightedPollPlugin(_DummyPlugin())
+        self.assertEqual(plugin.name, 'dummy')
+        plugin.handle_close()
+        self.assertEqual(closed, [(('Hello world', 9),)])
+        groups.weighted_votes = False
+        poll.ballots = (('Hello world', 1),)
+        plugin.handle_close()
+        self.assertEqual(closed[-1], (('Hello world', 1),))
+
     def test_inactive_groups_cancel_subscriber(self):
         meeting = self._poll_fixture()
         groups = self._groups_fixture(meeting)
@@ -458,3 +640,121 @@ class MaybeAssignUserToGroupTests(TestCase):
         group.owner = 'jane'
         request.root.users['adam'].email_validated = True
         self.assertEqual(group.owner, 'jane')
+
+    def test_site_index(self):
+        from skl_owner_groups.resources import get_potential_owner_index
+        groups, request = self._fixture()
+        index = get_potential_owner_index(request.root)
+        self.assertEqual(list(index['adamski@email.org']), [('m', 'a')])
+        request.root.users['adam'].email_validated = True
+        self.assertNotIn('adamski@email.org', index)
+
+    def test_site_index_created_for_old_sites(self):
+        groups, request = self._fixture()
+        del request.root._skl_potential_owner_index
+        request.root.users['adam'].email_validated = True
+        self.assertEqual(groups['a'].owner, 'adam')
+
+
+class AssignPotentialFromCSVTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.config.include('arche.testing')
+        self.config.include('arche.testing.catalog')
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _fixture(self):
+        root = bootstrap_and_fixture(self.config)
+        self.config.include('skl_owner_groups.resources')
+        request = testing.DummyRequest()
+        apply_request_extensions(request)
+        self.config.begin(request)
+        request.root = root
+        root['m'] = meeting = Meeting()
+        root.users['adam'] = request.content_factories['User'](email='Adam@email.org', email_validated=True)
+        root.users['berit'] = request.content_factories['User'](email='berit@email.org')
+        groups = meeting[GROUPS_NAME] = request.content_factories['VGroups']()
+        gfact = request.content_factories['VGroup']
+        groups['a'] = gfact(title='A')
+        groups['b'] = gfact(title='B')
+        groups['c'] = gfact(title='C', owner='cina')
+        groups['d'] = gfact(title='D')
+        groups['d'].potential_owner = 'old@email.org'
+        return groups, request
+
+    @property
+    def _fut(self):
+        from skl_owner_groups.models import assign_potential_from_csv
+        return assign_potential_from_csv
+
+    def test_get_validated_users_by_email(self):
+        from skl_owner_groups.models import get_validated_users_by_email
+        groups, request = self._fixture()
+        users = get_validated_users_by_email(request.root, ['adam@email.org', 'berit@email.org', 'x@email.org'])
+        self.assertEqual(list(users), ['adam@email.org'])
+        self.assertEqual(users['adam@email.org'].userid, 'adam')
+
+    def test_import(self):
+        groups, request = self._fixture()
+        text = "adam@email.org\ta A\nberit@email.org\tb B\nnew@email.org\tc C\nnew2@email.org\td D"
+        results = self._fut(groups, text)
+        self.assertEqual(groups['a'].owner, 'adam')
+        self.assertEqual(groups['b'].owner, None)
+        self.assertEqual(groups['c'].owner, 'cina')
+        self.assertEqual(dict(groups.potential_owners), {'berit@email.org': 'b', 'new2@email.org': 'd'})
+        self.assertIn('elapsed', results)
+        del results['elapsed']
+        self.assertEqual(results, dict(overwritten=0, already_owned=1, new_assigned=1,
+                                       new_potential=1, replaced_potential=1))
+
+    def test_import_overwrite_owner(self):
+        groups, request = self._fixture()
+        results = self._fut(groups, "adam@email.org\tc C", overwrite_owner=True)
+        self.assertEqual(groups['c'].owner, 'adam')
+        self.assertEqual(results['overwritten'], 1)
+
+    def test_email_moves_between_groups(self):
+        groups, request = self._fixture()
+        self._fut(groups, "old@email.org\ta A\nother@email.org\td D")
+        self.assertEqual(dict(groups.potential_owners), {'old@email.org': 'a', 'other@email.org': 'd'})
+
+
+class ListingRowsTests(TestCase):
+
+    def _rows(self):
+        from skl_owner_groups.resources import GroupRow
+        def _row(name, title, category, owner=None, delegate_to=None, base_votes=1):
+            return GroupRow(name=name, uid=name, title=title, category=category, owner=owner,
+                            owner_title=owner, owner_profile_path=owner and '/users/%s' % owner,
+                            delegate_to=delegate_to, delegate_title='', delegate_uid='',
+                            base_votes=base_votes, vote_power=delegate_to and 0 or base_votes)
+        return (
+            _row('a', 'Alingsås', 'kommun', owner='adam'),
+            _row('b', 'bjuv', 'kommun', owner='berit', delegate_to='c'),
+            _row('c', 'Skåne', 'region', owner='cina', base_votes=3),
+            _row('d', 'Dals-Ed', 'kommun'),
+        )
+
+    def _filter(self, **kw):
+        from skl_owner_groups.models import filter_listing_rows
+        return [x.name for x in filter_listing_rows(self._rows(), present_userids={'adam', 'cina'}, **kw)]
+
+    def test_filters(self):
+        self.assertEqual(self._filter(), ['a', 'b', 'c', 'd'])
+        self.assertEqual(self._filter(category='region'), ['c'])
+        self.assertEqual(self._filter(present=True), ['a', 'c'])
+        self.assertEqual(self._filter(present=False), ['b', 'd'])
+        self.assertEqual(self._filter(has_owner=False), ['d'])
+        self.assertEqual(self._filter(delegated=True), ['b'])
+        self.assertEqual(self._filter(category='kommun', present=True), ['a'])
+
+    def test_sort(self):
+        from skl_owner_groups.models import sort_listing_rows
+        rows = self._rows()
+        self.assertEqual([x.name for x in sort_listing_rows(rows)], ['a', 'b', 'd', 'c'])
+        self.assertEqual([x.name for x in sort_listing_rows(rows, 'vote_power', reverse=True)],
+                         ['c', 'd', 'a', 'b'])
+        self.assertRaises(ValueError, sort_listing_rows, rows, 'owner')
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+
+from pyramid import testing
+from pyramid.request import apply_request_extensions
+from voteit.core.models.meeting import Meeting
+from voteit.core.security import ROLE_VIEWER
+from voteit.core.testing_helpers import bootstrap_and_fixture
+
+
+class ParticipantIndexTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _fixture(self):
+        root = bootstrap_and_fixture(self.config)
+        self.config.include('skl_owner_groups.participants')
+        request = testing.DummyRequest()
+        apply_request_extensions(request)
+        self.config.begin(request)
+        request.root = root
+        factory = request.content_factories['User']
+        root['users']['anna'] = factory(first_name='Anna', last_name='Andersson')
+        root['users']['bengt'] = factory(first_name='Bengt', last_name='Karlsson-Berg')
+        root['users']['cecilia'] = factory(first_name='Cecilia', last_name='Berg')
+        root['m'] = meeting = Meeting()
+        for userid in ('anna', 'bengt'):
+            meeting.local_roles.add(userid, ROLE_VIEWER)
+        return meeting
+
+    def _cut(self, meeting):
+        from skl_owner_groups.participants import ParticipantIndex
+        return ParticipantIndex(meeting)
+
+    def test_search(self):
+        index = self._cut(self._fixture())
+        self.assertEqual(index.search('an'), [('anna', 'Anna Andersson')])
+        self.assertEqual(index.search('berg'), [('bengt', 'Bengt Karlsson-Berg')])
+        self.assertEqual(index.search('bengt karl'), [('bengt', 'Bengt Karlsson-Berg')])
+        self.assertEqual(index.search('anna karl'), [])
+        self.assertEqual(index.search(''), [])
+
+    def test_follows_local_roles(self):
+        meeting = self._fixture()
+        index = self._cut(meeting)
+        index.ensure()
+        meeting.local_roles.add('cecilia', ROLE_VIEWER)
+        self.assertEqual([x[0] for x in index.search('berg')], ['bengt', 'cecilia'])
+        meeting.local_roles.remove('bengt', ROLE_VIEWER)
+        self.assertEqual([x[0] for x in index.search('berg')], ['cecilia'])
+
+    def test_sync_user(self):
+        meeting = self._fixture()
+        index = self._cut(meeting)
+        index.ensure()
+        index.remove('anna')
+        index.add('zed', 'Zed')
+        index.sync_user('anna')
+        self.assertEqual(index.get_title('anna'), 'Anna Andersson')
+        # Only the user given is updated
+        self.assertEqual(index.get_title('zed'), 'Zed')
+        index.sync_user('zed')
+        self.assertEqual(index.get_title('zed'), None)
+
+    def test_subscriber_only_syncs_changed_principals(self):
+        from skl_owner_groups.participants import participants_changed_subscriber
+        meeting = self._fixture()
+        index = self._cut(meeting)
+        index.ensure()
+        index.remove('anna')
+        index.add('zed', 'Zed')
+
+        class _Event(object):
+            old = {'bengt': set([ROLE_VIEWER])}
+            new = {'anna': set([ROLE_VIEWER]), 'bengt': set([ROLE_VIEWER])}
+
+        participants_changed_subscriber(meeting, _Event())
+        self.assertEqual(index.get_title('anna'), 'Anna Andersson')
+        self.assertEqual(index.get_title('zed'), 'Zed')
+
+    def test_title_updated(self):
+        meeting = self._fixture()
+        index = self._cut(meeting)
+        index.ensure()
+        meeting.__parent__['users']['anna'].update(last_name='Svensson')
+        self.assertEqual(index.search('andersson'), [])
+        self.assertEqual(index.search('sven'), [('anna', 'Anna Svensson')])
+
+    def test_owner_titles_in_listing_rows(self):
+        from skl_owner_groups.interfaces import GROUPS_NAME
+        from skl_owner_groups.resources import Group
+        from skl_owner_groups.resources import Groups
+        meeting = self._fixture()
+        self.config.include('skl_owner_groups.resources')
+        groups = meeting[GROUPS_NAME] = Groups()
+        groups['a'] = Group(owner='anna', title='A', category='kommun')
+        rows = groups.get_listing_rows()
+        self.assertEqual(rows[0].owner_title, 'Anna Andersson')
+        meeting.__parent__['users']['anna'].update(last_name='Svensson')
+        rows = groups.get_listing_rows()
+        self.assertEqual(rows[0].owner_title, 'Anna Svensson')
+
+    def test_user_meetings(self):
+        from skl_owner_groups.participants import user_meeting_names
+        meeting = self._fixture()
+        root = meeting.__parent__
+        index = self._cut(meeting)
+        index.ensure()
+        self.assertEqual(user_meeting_names(root, 'anna'), ('m',))
+        self.assertEqual(user_meeting_names(root, 'cecilia'), ())
+        index.remove('anna')
+        self.assertEqual(user_meeting_names(root, 'anna'), ())
+
+    def test_title_not_updated_for_other_fields(self):
+        from skl_owner_groups.participants import user_updated_subscriber
+        meeting = self._fixture()
+        index = self._cut(meeting)
+        index.ensure()
+        user = meeting.__parent__['users']['anna']
+        user.last_name = 'Svensson'
+
+        class _Event(object):
+            changed = set(['email'])
+
+        user_updated_subscriber(user, _Event())
+        self.assertEqual(index.get_title('anna'), 'Anna Andersson')
+        _Event.changed = set(['last_name'])
+        user_updated_subscriber(user, _Event())
+        self.assertEqual(index.get_title('anna'), 'Anna Svensson')
+
+    def test_label(self):
+        from skl_owner_groups.participants import participant_label
+        self.assertEqual(participant_label('anna', 'Anna'), 'Anna (anna)')
+        self.assertEqual(participant_label('anna', ''), 'anna')
+        self.assertEqual(participant_label('anna', 'Anna', 'Ale'), 'Anna (anna) - ansvarig för Ale')
@@ -58,3 +58,46 @@ class PortletSubscriberIntegrationTests(TestCase):
         groups.update(enabled=True)
         self.failUnless(manager.get_portlets('agenda_item', SKL_POLLS_PORTLET))
         self.failIf(manager.get_portlets('agenda_item', DEFAULT_POLLS_PORTLET))
+
+
+class GetPollProgressTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _fixture(self):
+        from voteit.core.models.poll import Poll
+        from voteit.core.models.vote import Vote
+        poll = Poll()
+        for (name, category) in (('a', 'kommun'), ('b', 'kommun'), ('c', 'region')):
+            vote = Vote()
+            vote.set_vote_data('Hello', notify=False)
+            vote.category = category
+            poll[name] = vote
+        return poll
+
+    @property
+    def _fut(self):
+        from skl_owner_groups.portlet import get_poll_progress
+        return get_poll_progress
+
+    def test_progress(self):
+        self.assertEqual(self._fut(self._fixture(), 4),
+                         {'added': 3, 'total': 4, 'percentage': 75})
+
+    def test_no_vote_power(self):
+        self.assertEqual(self._fut(self._fixture(), 0)['percentage'], 0)
+
+    def test_categories(self):
+        from skl_owner_groups.tally import VoteTally
+        poll = self._fixture()
+        VoteTally(poll).ensure()
+        progress = self._fut(poll, 4, categories=True)
+        self.assertEqual(progress['categories'], {'kommun': 2, 'region': 1})
+
+    def test_categories_without_tally(self):
+        progress = self._fut(self._fixture(), 4, categories=True)
+        self.assertEqual(progress, {'added': 3, 'total': 4, 'percentage': 75})
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+
+
+class ReferenceDataTests(TestCase):
+
+    @property
+    def _cut(self):
+        from skl_owner_groups.refdata import ReferenceData
+        return ReferenceData
+
+    def _mk(self, regioner=None, kommuner=None):
+        if regioner is None:
+            regioner = [('AB', 'Region Stockholm'), ('I', 'Region Gotland')]
+        if kommuner is None:
+            kommuner = [('0114', 'UPPLANDS VÄSBY'), ('0980', 'GOTLAND')]
+        return self._cut(regioner, kommuner)
+
+    def test_gotland_not_created(self):
+        refdata = self._mk()
+        self.assertEqual(list(refdata.iter_groups()),
+                         [('AB', 'Region Stockholm', 'region'),
+                          ('I', 'Region Gotland', 'region'),
+                          ('0114', 'UPPLANDS VÄSBY', 'kommun')])
+
+    def test_gotland_needs_region(self):
+        from skl_owner_groups.refdata import ReferenceDataError
+        self.assertRaises(ReferenceDataError, self._mk, regioner=[('AB', 'Region Stockholm')])
+
+    def test_duplicate_code(self):
+        from skl_owner_groups.refdata import ReferenceDataError
+        self.assertRaises(ReferenceDataError, self._mk, kommuner=[('0114', 'A'), ('0114', 'B')])
+
+    def test_duplicate_name(self):
+        from skl_owner_groups.refdata import ReferenceDataError
+        self.assertRaises(ReferenceDataError, self._mk, kommuner=[('0114', 'A'), ('0115', 'a ')])
+
+    def test_lookups(self):
+        refdata = self._mk()
+        self.assertEqual(refdata.get_title('0114'), 'UPPLANDS VÄSBY')
+        self.assertEqual(refdata.get_category('AB'), 'region')
+        self.assertEqual(refdata.find_code(' upplands väsby'), '0114')
+        self.assertIsNone(refdata.find_code('404'))
+
+
+class GetReferenceDataTests(TestCase):
+
+    @property
+    def _fut(self):
+        from skl_owner_groups.refdata import get_reference_data
+        return get_reference_data
+
+    def test_current_lists(self):
+        refdata = self._fut()
+        self.assertEqual(refdata.get_title('0980'), 'GOTLAND')
+        self.assertEqual(refdata.get_category('I'), 'region')
+        self.assertNotIn('0980', [x[0] for x in refdata.iter_groups()])
+
+    def test_loaded_once(self):
+        self.assertIs(self._fut(), self._fut())
+
+    def test_year_before_all_lists(self):
+        self.assertIs(self._fut(1900), self._fut())
@@ -116,6 +116,169 @@ class GroupsTests(TestCase):
         self.assertEqual(groups.get_categorized_vote_power('adam'), {})
         self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 2, 'skl': 3})
 
+    def test_get_users_group(self):
+        groups, request = self._fixture()
+        self.assertEqual(groups.get_users_group('berit'), groups['b'])
+        self.assertEqual(groups.get_users_group('404'), None)
+
+    def test_owner_index_follows_owner(self):
+        groups, request = self._fixture()
+        groups['a'].owner = 'diana'
+        self.assertEqual(groups.get_users_group('diana'), groups['a'])
+        self.assertEqual(groups.get_users_group('adam'), None)
+        self.assertEqual(dict(groups.owner_index), {'diana': 'a', 'berit': 'b', 'cina': 'c'})
+
+    def test_owner_index_local_roles_changed(self):
+        from arche.security import ROLE_OWNER
+        groups, request = self._fixture()
+        groups['a'].local_roles.remove('adam', ROLE_OWNER)
+        self.assertEqual(groups.get_users_group('adam'), None)
+        groups['a'].local_roles.add('diana', ROLE_OWNER)
+        self.assertEqual(groups.get_users_group('diana'), groups['a'])
+
+    def test_owner_index_on_remove(self):
+        groups, request = self._fixture()
+        del groups['a']
+        self.assertEqual(groups.get_users_group('adam'), None)
+        self.assertNotIn('adam', groups.owner_index)
+
+    def test_verify_and_rebuild_owner_index(self):
+        groups, request = self._fixture()
+        self.assertEqual(groups.verify_owner_index(), {})
+        del groups._owner_index['adam']
+        groups._owner_index['zed'] = 'c'
+        self.assertEqual(groups.verify_owner_index(), {'adam': (None, 'a'), 'zed': ('c', None)})
+        groups.rebuild_owner_index()
+        self.assertEqual(groups.verify_owner_index(), {})
+
+    def test_owner_index_duplicate_owners(self):
+        groups, request = self._fixture()
+        groups['b'].owner = 'adam'
+        self.assertEqual(sorted(groups.get_owned_groups('adam')), ['a', 'b'])
+        self.assertEqual(groups.duplicate_owners, {'adam': ('a', 'b')})
+        self.assertEqual(groups.verify_owner_index(), {})
+        self.assertEqual(groups.rebuild_owner_index(), {'adam': ('a', 'b')})
+        groups['a'].owner = 'diana'
+        self.assertEqual(groups.get_owned_groups('adam'), ('b',))
+        self.assertEqual(groups.get_users_group('adam'), groups['b'])
+        self.assertEqual(groups.duplicate_owners, {})
+        self.assertEqual(groups.verify_owner_index(), {})
+
+    def test_vote_power_table_cached(self):
+        from skl_owner_groups.resources import vote_power_cache_stats
+        groups, request = self._fixture()
+        table = groups.get_vote_power_table()
+        self.assertEqual(table['berit'], {'kommun': 1})
+        hits = vote_power_cache_stats['hits']
+        self.assertIs(groups.get_vote_power_table(), table)
+        self.assertEqual(vote_power_cache_stats['hits'], hits + 1)
+
+    def test_vote_power_table_invalidated_on_delegation(self):
+        groups, request = self._fixture()
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 1})
+        groups.delegate_vote_to('a', 'b')
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 1, 'skl': 1})
+        groups.remove_delegation('a')
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 1})
+
+    def test_vote_power_table_invalidated_on_owner_change(self):
+        groups, request = self._fixture()
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 1})
+        groups['b'].owner = 'diana'
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {})
+        self.assertEqual(groups.get_categorized_vote_power('diana'), {'kommun': 1})
+
+    def test_vote_power_table_invalidated_on_update(self):
+        groups, request = self._fixture()
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 1})
+        groups['b'].update(base_votes=3)
+        self.assertEqual(groups.get_categorized_vote_power('berit'), {'kommun': 3})
+
+    def test_eligible_voters(self):
+        groups, request = self._fixture()
+        voters = groups.get_eligible_voters()
+        self.assertIn('berit', voters)
+        groups.delegate_vote_to('b', 'a')
+        self.assertNotIn('berit', groups.get_eligible_voters())
+
+    def test_add_groups_cataloged(self):
+        from pyramid.traversal import resource_path
+        from repoze.catalog.query import Eq
+        self.config.include('arche.testing.catalog')
+        groups, request = self._fixture()
+        gfact = request.content_factories['VGroup']
+        groups.add_groups([('d', gfact(title='D', category='region'))])
+        query = Eq('path', resource_path(groups)) & Eq('type_name', 'VGroup')
+        docids = request.root.catalog.query(query)[1]
+        paths = [request.root.document_map.address_for_docid(x) for x in docids]
+        self.assertIn(resource_path(groups['d']), paths)
+
+    def test_add_groups(self):
+        from skl_owner_groups.interfaces import IGroupsAdded
+        from skl_owner_groups.interfaces import IVGroups
+        groups, request = self._fixture()
+        events = []
+        self.config.add_subscriber(lambda obj, event: events.append((obj, event)), [IVGroups, IGroupsAdded])
+        gfact = request.content_factories['VGroup']
+        generation = groups.cache_generation
+        names = groups.add_groups([('d', gfact(owner='diana', title='D', category='kommun')),
+                                   ('e', gfact(title='E', category='region'))])
+        self.assertEqual(names, ['d', 'e'])
+        self.assertEqual(groups['d'].__parent__, groups)
+        self.assertEqual(groups.get_users_group('diana'), groups['d'])
+        self.assertGreater(groups.cache_generation, generation)
+        self.assertEqual(len(events), 1)
+        obj, event = events[0]
+        self.assertEqual(obj, groups)
+        self.assertEqual(event.names, ('d', 'e'))
+
+    def test_listing_rows(self):
+        groups, request = self._fixture()
+        groups.delegate_vote_to('a', 'b')
+        rows = groups.get_listing_rows()
+        self.assertEqual([x.name for x in rows], ['a', 'b', 'c'])
+        self.assertEqual(rows[0].owner, 'adam')
+        # Not in a meeting, so there's no participant index with titles
+        self.assertEqual(rows[0].owner_title, 'adam')
+        self.assertEqual(rows[0].owner_profile_path, '/users/adam')
+        self.assertEqual(rows[0].delegate_title, 'B')
+        self.assertEqual(rows[0].delegate_uid, groups['b'].uid)
+        self.assertEqual(rows[0].vote_power, 0)
+        self.assertEqual(rows[1].vote_power, 2)
+        self.assertIs(groups.get_listing_rows(), rows)
+
+    def test_listing_rows_invalidated(self):
+        groups, request = self._fixture()
+        rows = groups.get_listing_rows()
+        groups['c'].owner = 'diana'
+        groups['a'].update(title='X')
+        rows = groups.get_listing_rows()
+        self.assertEqual([x.name for x in rows], ['b', 'c', 'a'])
+        self.assertEqual(rows[1].owner, 'diana')
+
+    def test_cache_generation_for_old_objects(self):
+        from BTrees.Length import Length
+        groups, request = self._fixture()
+        groups._cache_generation = 3
+        self.assertEqual(groups.cache_generation, 3)
+        groups.invalidate_cache()
+        self.assertIsInstance(groups._cache_generation, Length)
+        self.assertEqual(groups.cache_generation, 4)
+
+    def test_cache_keyed_on_serial(self):
+        groups, request = self._fixture()
+        table = groups.get_vote_power_table()
+        self.assertIs(groups.get_vote_power_table(), table)
+        # Another transaction committed the same generation
+        groups._cache_generation._p_serial = b'\x00' * 7 + b'\x01'
+        self.assertIsNot(groups.get_vote_power_table(), table)
+
+    def test_owner_index_created_for_old_objects(self):
+        groups, request = self._fixture()
+        groups._owner_index = None
+        groups._group_owners = None
+        self.assertEqual(groups.get_users_group('cina'), groups['c'])
+
 
 class GroupTest(TestCase):
 
@@ -157,3 +320,38 @@ class GroupTest(TestCase):
         group.potential_owner = email
         self.assertEqual(group.potential_owner, email)
         self.assertEqual(groups.potential_owners[email], 'a')
+
+    def test_replace_potential(self):
+        groups, request = self._fixture()
+        groups['a'].potential_owner = 'one@world.org'
+        groups['a'].potential_owner = 'two@world.org'
+        self.assertEqual(dict(groups.potential_owners), {'two@world.org': 'a'})
+        self.assertEqual(dict(groups.potential_by_group), {'a': 'two@world.org'})
+
+    def test_potential_moves_between_groups(self):
+        groups, request = self._fixture()
+        groups.add_potential_owner('one@world.org', 'a')
+        groups.add_potential_owner('one@world.org', 'b')
+        self.assertEqual(groups['a'].potential_owner, None)
+        self.assertEqual(groups['b'].potential_owner, 'one@world.org')
+
+    def test_delete_potential(self):
+        groups, request = self._fixture()
+        group = groups['a']
+        group.potential_owner = 'hello@world.org'
+        del group.potential_owner
+        self.assertEqual(group.potential_owner, None)
+        self.assertNotIn('hello@world.org', groups.potential_owners)
+
+    def test_remove_group_removes_potential(self):
+        groups, request = self._fixture()
+        groups['c'].potential_owner = 'hello@world.org'
+        del groups['c']
+        self.assertNotIn('hello@world.org', groups.potential_owners)
+        self.assertNotIn('c', groups.potential_by_group)
+
+    def test_potential_index_created_for_old_objects(self):
+        groups, request = self._fixture()
+        groups.potential_owners['hello@world.org'] = 'b'
+        groups._potential_by_group = None
+        self.assertEqual(groups['b'].potential_owner, 'hello@world.org')
@@ -0,0 +1,23 @@
+from unittest import TestCase
+
+from pyramid import testing
+
+
+class ResultsTests(TestCase):
+
+    def test_calc_perc(self):
+        from skl_owner_groups.results import calc_perc
+        self.assertEqual(calc_perc(1, 3), 33)
+        self.assertEqual(calc_perc(1, 0), 0)
+
+    def test_colouring(self):
+        from skl_owner_groups.results import get_colouring
+        colouring = get_colouring({'kommun': 33, 'region': 10, 'total': 50})
+        self.assertEqual(colouring, {'skl': 'success', 'kommun': 'success',
+                                     'region': 'danger', 'total': 'danger'})
+
+    def test_view_cats(self):
+        from skl_owner_groups.results import get_view_cats
+        cats = [x[0] for x in get_view_cats()]
+        self.assertNotIn('ombud', cats)
+        self.assertEqual(cats[-1], 'total')
@@ -89,3 +89,114 @@ class CSVTextValidatorTests(TestCase):
         validator = self._mk_validator()
         txt = _TYPICAL_ASSIGNMENT_TXT + "annan@email.com\ta Hejhej"
         self.assertRaises(Invalid, validator, None, txt)
+
+    def test_all_errors_at_once(self):
+        validator = self._mk_validator()
+        txt = _TYPICAL_ASSIGNMENT_TXT + "xxxx\nannan@email.com\t404 Hejhej\nkallespostat.com\tc bka"
+        try:
+            validator(None, txt)
+            self.fail("Invalid not raised")
+        except Invalid as exc:
+            self.assertEqual(exc.msg.splitlines(),
+                             ["Rad 4 verkar inte innehålla något tabtecken",
+                              "Rad 5 har ett gruppnamn som inte finns: 404",
+                              "Rad 6 har en ogiltig epostadress: kallespostat.com"])
+
+    def test_parsed_rows(self):
+        from skl_owner_groups.models import parse_owner_rows
+        validator = self._mk_validator()
+        self.assertIsNone(validator(None, parse_owner_rows(_TYPICAL_ASSIGNMENT_TXT)))
+
+
+class OwnerRowsTypeTests(TestCase):
+
+    @property
+    def _cut(self):
+        from skl_owner_groups.schemas import OwnerRowsType
+        return OwnerRowsType
+
+    def test_deserialize(self):
+        rows = self._cut().deserialize(None, _TYPICAL_ASSIGNMENT_TXT + "xxxx")
+        self.assertEqual(list(rows), [(2, 'hej@email.com', 'a'), (3, 'kalas@email.com', 'b')])
+        self.assertEqual(rows.errors, ((4, "Rad 4 verkar inte innehålla något tabtecken"),))
+
+    def test_serialize(self):
+        from skl_owner_groups.models import parse_owner_rows
+        rows = parse_owner_rows(_TYPICAL_ASSIGNMENT_TXT)
+        self.assertEqual(self._cut().serialize(None, rows), "hej@email.com\ta\nkalas@email.com\tb")
+
+
+class SingleGroupMembershipValidatorTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _fixture(self):
+        root = bootstrap_and_fixture(self.config)
+        self.config.include('skl_owner_groups.resources')
+        request = testing.DummyRequest()
+        apply_request_extensions(request)
+        self.config.begin(request)
+        root['m'] = meeting = Meeting()
+        groups = meeting[GROUPS_NAME] = request.content_factories['VGroups']()
+        gfact = request.content_factories['VGroup']
+        groups['a'] = gfact(owner='adam', title='A', category='kommun')
+        groups['b'] = gfact(title='B', category='kommun')
+        return groups
+
+    def _validator(self, context):
+        from skl_owner_groups.schemas import SingleGroupMembershipValidator
+        return SingleGroupMembershipValidator(None, {'context': context})
+
+    def test_owns_other_group(self):
+        groups = self._fixture()
+        self.assertRaises(Invalid, self._validator(groups['b']), None, 'adam')
+
+    def test_own_group(self):
+        groups = self._fixture()
+        self.assertIsNone(self._validator(groups['a'])(None, 'adam'))
+
+    def test_add_form(self):
+        groups = self._fixture()
+        self.assertRaises(Invalid, self._validator(groups), None, 'adam')
+        self.assertIsNone(self._validator(groups)(None, 'berit'))
+
+    def test_owns_several_groups(self):
+        groups = self._fixture()
+        # Local roles can be changed without the validator, so existing data may have duplicates
+        groups['b'].owner = 'adam'
+        self.assertRaises(Invalid, self._validator(groups['a']), None, 'adam')
+        self.assertRaises(Invalid, self._validator(groups['b']), None, 'adam')
+
+
+class GetCategorizedGroupsTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_from_listing_rows(self):
+        from skl_owner_groups.resources import Group
+        from skl_owner_groups.resources import Groups
+        from skl_owner_groups.schemas import _get_categorized_groups
+        groups = Groups()
+        groups['a'] = Group(title='Ale', category='kommun')
+        groups['b'] = Group(title='Borås', category='kommun')
+        groups['c'] = Group(title='Skåne', category='region')
+        result = _get_categorized_groups(groups)
+        self.assertEqual(dict((k, [x.name for x in v]) for (k, v) in result.items()),
+                         {'kommun': ['a', 'b'], 'region': ['c']})
+
+
+class ImportOwnersFileSchemaTests(TestCase):
+
+    def test_tmpstore_per_bind(self):
+        from skl_owner_groups.schemas import ImportOwnersFileSchema
+        one = ImportOwnersFileSchema().bind(request=testing.DummyRequest())
+        two = ImportOwnersFileSchema().bind(request=testing.DummyRequest())
+        self.assertIsNot(one['upload'].widget.tmpstore, two['upload'].widget.tmpstore)
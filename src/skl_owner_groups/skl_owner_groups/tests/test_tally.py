@@ -0,0 +1,123 @@
+from unittest import TestCase
+
+from pyramid import testing
+from voteit.core.models.poll import Poll
+from voteit.core.models.vote import Vote
+
+
+class VoteTallyTests(TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _mk_vote(self, poll, name, data, category):
+        vote = Vote()
+        vote.set_vote_data(data, notify=False)
+        vote.category = category
+        poll[name] = vote
+        return vote
+
+    def _fixture(self):
+        poll = Poll()
+        self._mk_vote(poll, 'a', 'Hello', 'A')
+        self._mk_vote(poll, 'b', 'Hello', 'B')
+        self._mk_vote(poll, 'c', 'Bye', 'A')
+        return poll
+
+    @property
+    def _cut(self):
+        from skl_owner_groups.tally import VoteTally
+        return VoteTally
+
+    def test_ensure_reads_existing(self):
+        poll = self._fixture()
+        tally = self._cut(poll)
+        self.assertFalse(tally.exists)
+        tally.ensure()
+        self.assertTrue(tally.exists)
+        hashes, categories = tally.distribution()
+        self.assertEqual(hashes, {'8b1a9953c4611296a827abf8c47804d7': 'Hello', 'b665d826e919381052ec23b9eaec3b62': 'Bye'})
+        self.assertEqual(categories['A'], {'8b1a9953c4611296a827abf8c47804d7': 1, 'b665d826e919381052ec23b9eaec3b62': 1})
+        self.assertEqual(categories['B'], {'8b1a9953c4611296a827abf8c47804d7': 1})
+
+    def test_add_and_remove(self):
+        poll = self._fixture()
+        tally = self._cut(poll)
+        tally.ensure()
+        vote = self._mk_vote(poll, 'd', 'Bye', 'B')
+        tally.add(vote)
+        self.assertEqual(tally.distribution()[1]['B'], {'8b1a9953c4611296a827abf8c47804d7': 1,
+                                                        'b665d826e919381052ec23b9eaec3b62': 1})
+        tally.remove('b')
+        self.assertEqual(tally.distribution()[1]['B'], {'b665d826e919381052ec23b9eaec3b62': 1})
+
+    def test_update(self):
+        poll = self._fixture()
+        tally = self._cut(poll)
+        tally.ensure()
+        poll['a'].set_vote_data('Bye', notify=False)
+        tally.update(poll['a'])
+        hashes, categories = tally.distribution()
+        self.assertEqual(categories['A'], {'b665d826e919381052ec23b9eaec3b62': 2})
+
+    def test_check_and_rebuild(self):
+        poll = self._fixture()
+        tally = self._cut(poll)
+        tally.ensure()
+        self.assertEqual(tally.check(), {})
+        self._mk_vote(poll, 'd', 'Bye', 'B')
+        self.assertEqual(tally.check(), {('B', 'b665d826e919381052ec23b9eaec3b62'): (0, 1)})
+        tally.rebuild()
+        self.assertEqual(tally.check(), {})
+
+    def test_discard(self):
+        poll = self._fixture()
+        tally = self._cut(poll)
+        tally.ensure()
+        tally.discard()
+        self.assertFalse(tally.exists)
+
+    def test_old_format_rebuilt(self):
+        from BTrees.OOBTree import OOBTree
+        poll = self._fixture()
+        # Format without version, total and weights
+        storage = OOBTree()
+        storage['votes'] = OOBTree({'a': '8b1a9953c4611296a827abf8c47804d7'})
+        storage['hashed'] = OOBTree()
+        storage['counts'] = OOBTree()
+        poll._skl_vote_tally = storage
+        tally = self._cut(poll)
+        self.assertFalse(tally.exists)
+        tally.ensure()
+        self.assertTrue(tally.exists)
+        self.assertEqual(tally.total, 3)
+        tally.remove('a')
+        self.assertEqual(tally.total, 2)
+
+    def test_weighted_vote(self):
+        poll = self._fixture()
+        tally = self._cut(poll)
+        tally.ensure()
+        vote = self._mk_vote(poll, 'd', 'Bye', 'B')
+        vote.weights = {'A': 2, 'B': 3}
+        tally.add(vote)
+        self.assertEqual(tally.total, 8)
+        hashes, categories = tally.distribution()
+        self.assertEqual(categories['A'], {'8b1a9953c4611296a827abf8c47804d7': 1, 'b665d826e919381052ec23b9eaec3b62': 3})
+        self.assertEqual(categories['B'], {'8b1a9953c4611296a827abf8c47804d7': 1, 'b665d826e919381052ec23b9eaec3b62': 3})
+        self.assertEqual(tally.check(), {})
+        tally.remove('d')
+        self.assertEqual(tally.total, 3)
+
+    def test_weighted_ballots(self):
+        from skl_owner_groups.tally import weighted_ballots
+        poll = self._fixture()
+        poll['c'].weights = {'A': 2, 'B': 3}
+        self.assertEqual(sorted(weighted_ballots(poll)), [('Bye', 5), ('Hello', 2)])
+
+    def test_checksum_ignores_key_order(self):
+        from skl_owner_groups.tally import vote_checksum
+        self.assertEqual(vote_checksum({'a': 1, 'b': 2}), vote_checksum({'b': 2, 'a': 1}))
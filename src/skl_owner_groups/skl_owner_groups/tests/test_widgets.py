@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+
+
+class _DummyField(object):
+    oid = 'owner'
+    name = 'owner'
+
+    @staticmethod
+    def renderer(template, **kw):
+        return kw
+
+
+class ParticipantSearchWidgetTests(TestCase):
+
+    def _cut(self, **kw):
+        from skl_owner_groups.widgets import ParticipantSearchWidget
+        return ParticipantSearchWidget(values=[('', '(Ingen)'), ('adam', 'Adam (adam)')], **kw)
+
+    def test_current_value(self):
+        widget = self._cut()
+        rendered = widget.serialize(_DummyField(), 'adam')
+        self.assertEqual([x[0] for x in rendered['values']], ['', 'adam'])
+
+    def test_submitted_value_kept(self):
+        widget = self._cut(get_label=lambda userid: userid.title())
+        rendered = widget.serialize(_DummyField(), 'berit')
+        self.assertEqual(rendered['values'][-1], ('berit', 'Berit'))
+        self.assertEqual(rendered['cstruct'], 'berit')
@@ -5,3 +5,4 @@ def includeme(config):
     config.include('.group')
     config.include('.groups')
     config.include('.settings')
+    config.include('.site')
@@ -1,103 +1,127 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from calendar import timegm
 from collections import Counter
-from decimal import Decimal
 
 from arche.views.base import BaseView
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.session import check_csrf_token
 from pyramid.view import view_config
-from skl_owner_groups.interfaces import GROUPS_NAME, GRUPPKATEGORIER
 from voteit.core.models.interfaces import IPoll
+from voteit.core.security import MODERATE_MEETING
 from voteit.core.security import VIEW
 from voteit.irl.models.interfaces import IMeetingPresence
+from webob.datetime_utils import parse_date
+from webob.etag import ETagMatcher
 
-from skl_owner_groups.models import analyze_vote_distribution
+from skl_owner_groups.analyzers import can_analyze
 from skl_owner_groups.models import groups_exist
-from skl_owner_groups.models import percentages_pass
-from skl_owner_groups.models import get_total_categorized_vote_power
+from skl_owner_groups.results import calc_perc
+from skl_owner_groups.results import calculate_category_results
+from skl_owner_groups.results import clear_category_results
+from skl_owner_groups.results import get_category_results
+from skl_owner_groups.results import get_colouring
+from skl_owner_groups.results import get_percentages
+from skl_owner_groups.results import store_category_results
+from skl_owner_groups.tally import VoteTally
 
 
 @view_config(context=IPoll, name="_cat_votes_modal", permission=VIEW,
              renderer="skl_owner_groups:templates/cat_votes_modal.pt")
 class CategoryVotes(BaseView):
+    """ Closed polls are served from the result stored when the poll closed,
+        with ETag and Last-Modified so clients can reuse what they already have.
+    """
 
     def __call__(self):
         if not groups_exist(self.context, self.request):
             return {'error': "Inga grupper existerar i mötet."}
-        presence = IMeetingPresence(self.request.meeting)
-        if presence.open:
-            return {'error': "Närvarokontrollen är öppen, den här vyn fungerar inte korrekt då. "
-                                    "Avsluta kontrollen först."}
-        if not hasattr(self, 'method_%s' % self.context.poll_plugin):
-            return {'error': "Omröstningsmetoden kan inte analyseras med detta verktyg. "
-                             "(metoden %s saknas)" % self.context.poll_plugin}
-        self.total_vote_power = get_total_categorized_vote_power(self.request.meeting[GROUPS_NAME])
-        self.hashed_votes, self.categorized_votes = analyze_vote_distribution(self.context)
-        view_cats = list(GRUPPKATEGORIER)
-        # Ta bort ombud
-        view_cats.pop(-1)
-        # Lägg till total
-        view_cats.append(('total', 'Total'))
-        self.view_cats = view_cats
+        self.category_results = get_category_results(self.context)
+        if self.category_results is None:
+            presence = IMeetingPresence(self.request.meeting)
+            if presence.open:
+                return {'error': "Närvarokontrollen är öppen, den här vyn fungerar inte korrekt då. "
+                                 "Avsluta kontrollen först."}
+            if not can_analyze(self.context, self.request.registry):
+                return {'error': "Omröstningsmetoden kan inte analyseras med detta verktyg. "
+                                 "(metoden %s saknas)" % self.context.poll_plugin}
+            self.category_results = calculate_category_results(self.context, self.request.registry)
+        else:
+            response = self.request.response
+            response.etag = "%s-%s" % (self.context.uid, timegm(self.category_results['created'].utctimetuple()))
+            response.last_modified = self.category_results['created']
+            if self.not_modified(response.etag, self.category_results['created']):
+                return HTTPNotModified(headers={'ETag': response.headers['ETag'],
+                                                'Last-Modified': response.headers['Last-Modified']})
+        self.total_vote_power = Counter(self.category_results['total_vote_power'])
+        self.view_cats = self.category_results['view_cats']
         return {
-            'view_cats': view_cats,
+            'view_cats': self.view_cats,
+            'ranked': self.category_results.get('pairwise', None) is not None,
         }
 
+    def not_modified(self, etag, last_modified):
+        if_none_match = self.request.headers.get('If-None-Match', None)
+        if if_none_match:
+            return etag in ETagMatcher.parse(if_none_match)
+        if_modified_since = parse_date(self.request.headers.get('If-Modified-Since', None))
+        return if_modified_since is not None and if_modified_since >= last_modified
+
+    def result(self, uid):
+        """ Returns a dict with count, percentages, colouring and passed for a proposal. """
+        result = self.category_results['results'].get(uid, None)
+        if result is None:
+            vote_count = Counter()
+            percentages = self.percentages(vote_count)
+            return {'count': vote_count, 'percentages': percentages,
+                    'colouring': self.colouring(percentages), 'passed': False}
+        result = dict(result)
+        result['count'] = Counter(result['count'])
+        return result
+
+    def pairwise_count(self, a, b):
+        """ Categorized votes that prefer proposal a over b, for ranked methods. """
+        return Counter(self.category_results['pairwise'].get((a, b), {}))
+
     def vote_count(self, uid):
-        return getattr(self, "method_%s" % self.context.poll_plugin)(uid)
-
-    def method_combined_simple(self, uid):
-        matching_hashes = set()
-        for (hash, vote_data) in self.hashed_votes.items():
-            if vote_data.get(uid, None) == 'approve':
-                matching_hashes.add(hash)
-        # Hash may not match anything, but a little iteration won't matter :P
-        counter = Counter()
-        for (cat, votemap) in self.categorized_votes.items():
-            for hash in matching_hashes:
-                if hash in votemap:
-                    counter[cat] += votemap[hash]
-                    counter['total'] += votemap[hash]
-        return counter
-
-    def method_majority_poll(self, uid):
-        use_hash = None
-        for (hash, vote_data) in self.hashed_votes.items():
-            if vote_data == {'proposal': uid}:
-                use_hash = hash
-                break
-        # Hash may not match anything
-        counter = Counter()
-        for (cat, votemap) in self.categorized_votes.items():
-            if use_hash in votemap:
-                counter[cat] += votemap[use_hash]
-                counter['total'] += votemap[use_hash]
-        return counter
+        return self.result(uid)['count']
 
     def calc_perc(self, num, total):
-        if total:
-            return int(round(100 * Decimal(num) / Decimal(total), 0))
-        return 0
+        return calc_perc(num, total)
 
     def percentages(self, vote_count):
-        results = {}
-        for cat, title in self.view_cats:
-            results[cat] = self.calc_perc(vote_count[cat], self.total_vote_power[cat])
-        return results
+        return get_percentages(vote_count, self.total_vote_power, self.view_cats)
 
     def colouring(self, percentages):
-        results = {}
-        results['skl'] = 'success'
-        if percentages_pass(percentages):
-            results['total'] = 'success'
-        else:
-            results['total'] = 'danger'
-        for cat in ('kommun', 'region'):
-            if percentages[cat] > 32:
-                results[cat] = 'success'
-            else:
-                results[cat] = 'danger'
-        return results
+        return get_colouring(percentages)
+
+
+@view_config(context=IPoll, name="_check_vote_tally.json", permission=MODERATE_MEETING, renderer="json")
+class CheckVoteTally(BaseView):
+    """ Compare the tally with the votes in the poll. POST to rebuild the tally if there are problems.
+        The POST needs the CSRF token, as the header X-CSRF-Token or the parameter csrf_token.
+    """
+
+    def __call__(self):
+        if self.request.method == 'POST':
+            check_csrf_token(self.request)
+        tally = VoteTally(self.context)
+        if not tally.exists:
+            return {'exists': False, 'problems': [], 'rebuilt': False}
+        problems = []
+        for ((category, checksum), (tallied, actual)) in tally.check().items():
+            problems.append({'category': category, 'checksum': checksum, 'tallied': tallied, 'actual': actual})
+        rebuilt = False
+        if problems and self.request.method == 'POST':
+            tally.rebuild()
+            rebuilt = True
+            if get_category_results(self.context) is not None:
+                if self.context.get_workflow_state() == 'closed':
+                    store_category_results(self.context, self.request.registry)
+                else:
+                    clear_category_results(self.context)
+        return {'exists': True, 'problems': problems, 'rebuilt': rebuilt}
 
 
 def includeme(config):
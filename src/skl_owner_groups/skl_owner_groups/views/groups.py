@@ -1,16 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import transaction
 from arche.views.base import DefaultEditForm
 from arche.views.base import BaseView
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPFound
+from pyramid.session import check_csrf_token
+from pyramid.traversal import resource_path
 from voteit.core.security import MODERATE_MEETING
 from voteit.core.security import VIEW
 from voteit.irl.models.interfaces import IMeetingPresence
 
+from skl_owner_groups.importer import import_owners_file
+from skl_owner_groups.interfaces import GRUPPKATEGORIER
 from skl_owner_groups.interfaces import IVGroups
-from skl_owner_groups.models import assign_potential_from_csv
+from skl_owner_groups.models import apply_voters_diff
+from skl_owner_groups.models import OwnerImporter
+from skl_owner_groups.models import LISTING_SORT_FIELDS
+from skl_owner_groups.models import diff_voters
+from skl_owner_groups.models import filter_listing_rows
+from skl_owner_groups.models import sort_listing_rows
 from skl_owner_groups.models import update_skl_vote_power
+from skl_owner_groups.participants import ParticipantIndex
+from skl_owner_groups.participants import participant_label
+from skl_owner_groups.resources import vote_power_cache_stats
 from skl_owner_groups.security import ADD_VGROUP
 
 
@@ -18,11 +32,101 @@ class GroupsView(BaseView):
 
     def __call__(self):
         presence = IMeetingPresence(self.request.meeting)
+        rows = self.context.get_listing_rows()
         return {'here_url': self.request.resource_url(self.context),
                 'can_add': self.request.has_permission(ADD_VGROUP),
-                'users': self.request.root['users'],
+                'rows': rows,
                 'presence_check_open': presence.open,
-                'present_userids': presence.present_userids}
+                'present_userids': frozenset(presence.present_userids)}
+
+
+class GroupsJSON(BaseView):
+    """ The groups listing as JSON.
+
+        Filters: category, present, has_owner, delegated (1 or 0)
+        Sorting: sort_on (one of LISTING_SORT_FIELDS), reverse
+        Pagination: start, limit
+    """
+    default_limit = 100
+    max_limit = 500
+
+    def __call__(self):
+        params = self.request.GET
+        category = params.get('category', None) or None
+        if category is not None and category not in dict(GRUPPKATEGORIER):
+            raise HTTPBadRequest("Okänd kategori: %s" % category)
+        sort_on = params.get('sort_on', 'title')
+        if sort_on not in LISTING_SORT_FIELDS:
+            raise HTTPBadRequest("Kan inte sortera på %s" % sort_on)
+        start = self._int_param('start', 0)
+        limit = min(self._int_param('limit', self.default_limit), self.max_limit)
+        presence = IMeetingPresence(self.request.meeting)
+        present_userids = frozenset(presence.present_userids)
+        rows = filter_listing_rows(
+            self.context.get_listing_rows(),
+            present_userids=present_userids,
+            category=category,
+            present=self._bool_param('present'),
+            has_owner=self._bool_param('has_owner'),
+            delegated=self._bool_param('delegated'),
+        )
+        rows = sort_listing_rows(rows, sort_on=sort_on, reverse=bool(self._bool_param('reverse')))
+        items = []
+        for row in rows[start:start + limit]:
+            item = row._asdict()
+            item['present'] = row.owner in present_userids
+            items.append(item)
+        return {'total': len(rows),
+                'start': start,
+                'limit': limit,
+                'presence_check_open': presence.open,
+                'items': items}
+
+    def _int_param(self, name, default):
+        value = self.request.GET.get(name, '')
+        if not value:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise HTTPBadRequest("%s måste vara ett heltal" % name)
+        if value < 0:
+            raise HTTPBadRequest("%s får inte vara negativt" % name)
+        return value
+
+    def _bool_param(self, name):
+        value = self.request.GET.get(name, '').lower()
+        if not value:
+            return None
+        if value in ('1', 'true'):
+            return True
+        if value in ('0', 'false'):
+            return False
+        raise HTTPBadRequest("%s måste vara 1 eller 0" % name)
+
+
+class ParticipantsSearch(BaseView):
+    """ Search meeting participants for the owner widget. q is the search text and group the name
+        of the group being edited. Users who own another group are marked.
+    """
+    limit = 20
+
+    def __call__(self):
+        query = self.request.GET.get('q', '')
+        current = self.request.GET.get('group', None)
+        found = ParticipantIndex(self.request.meeting).search(query, limit=self.limit)
+        owner_index = self.context.owner_index
+        titles = None
+        results = []
+        for (userid, title) in found:
+            owns = None
+            name = owner_index.get(userid, None)
+            if name is not None and name != current:
+                if titles is None:
+                    titles = dict((x.name, x.title) for x in self.context.get_listing_rows())
+                owns = titles.get(name, name)
+            results.append({'id': userid, 'text': participant_label(userid, title, owns)})
+        return {'results': results}
 
 
 class UpdateVotes(BaseView):
@@ -36,35 +140,106 @@ class UpdateVotes(BaseView):
         return HTTPFound(location=self.request.resource_url(self.context))
 
 
+class VotePowerCacheStats(BaseView):
+    """ Hits and misses for the vote power table in this process. """
+
+    def __call__(self):
+        return {'hits': vote_power_cache_stats['hits'],
+                'misses': vote_power_cache_stats['misses'],
+                'generation': self.context.cache_generation}
+
+
+class VotersPreview(BaseView):
+    """ Shows who will get or lose the voter role. POST to apply the changes. """
+
+    def __call__(self):
+        presence = IMeetingPresence(self.request.meeting)
+        if presence.open:
+            self.flash_messages.add("Stäng närvarokontrollen först", type='danger')
+            return HTTPFound(location=self.request.resource_url(self.context))
+        diff = diff_voters(self.request.meeting)
+        ongoing_polls = self.ongoing_polls()
+        if self.request.method == 'POST':
+            check_csrf_token(self.request)
+            if ongoing_polls:
+                # Changing voters during a poll would make the vote power of the poll inconsistent
+                self.flash_messages.add("Röstberättigade kan inte ändras medan omröstningar pågår", type='danger')
+                return HTTPFound(location=self.request.resource_url(self.context, '_voters_preview'))
+            apply_voters_diff(self.request.meeting, diff)
+            self.flash_messages.add("%s fick rösträtt och %s förlorade rösträtt" % (
+                len(diff['added']), len(diff['removed'])))
+            return HTTPFound(location=self.request.resource_url(self.context))
+        return {'diff': diff,
+                'ongoing_polls': ongoing_polls,
+                'total_vote_power': sum(diff['vote_power'].values())}
+
+    def ongoing_polls(self):
+        return tuple(self.catalog_search(resolve=True, path=resource_path(self.request.meeting),
+                                         type_name='Poll', workflow_state='ongoing'))
+
+
 class PotentialOwnersView(BaseView):
 
     def __call__(self):
         return {}
 
 
+def format_import_results(results):
+    out = "Resultat: \n"
+    overwritten = results['overwritten']
+    already_owned = results['already_owned']
+    new_assigned = results['new_assigned']
+    new_potential = results['new_potential']
+    replaced_potential = results['replaced_potential']
+    if overwritten:
+        out += "%s fått ny ansvarig. \n" % overwritten
+    if already_owned:
+        out += "%s ändrades inte eftersom de redan hade en ansvarig. \n" % already_owned
+    if new_assigned:
+        out += "%s fick en ny ägare. \n" % new_assigned
+    if new_potential:
+        out += "%s hittades inte i VoteIT men väntar på registrering. " % new_potential
+    if replaced_potential:
+        out += "%s fick sin potentiellt ansvarige ersatt av ny. " % replaced_potential
+    out += "\nImporten tog %.2f sekunder." % results['elapsed']
+    return out
+
+
 class AssignPotentialOwnersForm(DefaultEditForm):
     schema_name = 'assign'
     title = "Knyt ansvariga via epost"
 
     def save_success(self, appstruct):
-        csv_text = appstruct.pop('csv_text')
-        results = assign_potential_from_csv(self.context, csv_text, **appstruct)
-        out = "Resultat: \n"
-        overwritten = results['overwritten']
-        already_owned = results['already_owned']
-        new_assigned = results['new_assigned']
-        new_potential = results['new_potential']
-        replaced_potential = results['replaced_potential']
-        if overwritten:
-            out += "%s fått ny ansvarig. \n" % overwritten
-        if already_owned:
-            out += "%s ändrades inte eftersom de redan hade en ansvarig. \n" % already_owned
-        if new_assigned:
-            out += "%s fick en ny ägare. \n" % new_assigned
-        if new_potential:
-            out += "%s hittades inte i VoteIT men väntar på registrering. " % new_potential
-        if replaced_potential:
-            out += "%s fick sin potentiellt ansvarige ersatt av ny. " % replaced_potential
+        # Already parsed and validated by the schema
+        rows = appstruct.pop('csv_text')
+        results = OwnerImporter(self.context, **appstruct)(rows)
+        self.flash_messages.add(format_import_results(results), auto_destruct=False)
+        return HTTPFound(location=self.request.resource_url(self.context))
+
+
+class ImportOwnersFileForm(DefaultEditForm):
+    schema_name = 'import_file'
+    title = "Importera ansvariga från fil"
+    # Don't list more errors than this
+    max_errors = 20
+
+    def save_success(self, appstruct):
+        upload = appstruct.pop('upload')
+        try:
+            importer, results = import_owners_file(self.context, upload['fp'], upload['filename'], **appstruct)
+        except ValueError as exc:
+            self.flash_messages.add("%s" % exc, type='danger', require_commit=False)
+            return HTTPFound(location=self.request.resource_url(self.context, '_import_owners_file'))
+        if importer.errors:
+            # Rows were applied while reading, so make sure nothing is stored
+            transaction.doom()
+            out = "Ingenting importerades, %s rader har fel: \n" % len(importer.errors)
+            out += "\n".join(importer.errors[:self.max_errors])
+            if len(importer.errors) > self.max_errors:
+                out += "\n..."
+            self.flash_messages.add(out, type='danger', auto_destruct=False, require_commit=False)
+            return HTTPFound(location=self.request.resource_url(self.context, '_import_owners_file'))
+        out = "%s rader importerades. " % importer.rows + format_import_results(results)
         self.flash_messages.add(out, auto_destruct=False)
         return HTTPFound(location=self.request.resource_url(self.context))
 
@@ -74,9 +249,24 @@ def includeme(config):
         GroupsView, context=IVGroups, permission=VIEW,
         renderer="skl_owner_groups:templates/groups.pt"
     )
+    config.add_view(
+        GroupsJSON, context=IVGroups, permission=VIEW, name='_groups.json', renderer='json'
+    )
+    config.add_view(
+        ParticipantsSearch, context=IVGroups, permission=MODERATE_MEETING, name='_participants.json',
+        renderer='json'
+    )
     config.add_view(
         UpdateVotes, context=IVGroups, permission=MODERATE_MEETING, name='_update_skl_vote_power'
     )
+    config.add_view(
+        VotePowerCacheStats, context=IVGroups, permission=MODERATE_MEETING, name='_vote_power_cache.json',
+        renderer='json'
+    )
+    config.add_view(
+        VotersPreview, context=IVGroups, permission=MODERATE_MEETING, name='_voters_preview',
+        renderer="skl_owner_groups:templates/voters_preview.pt"
+    )
     config.add_view(
         PotentialOwnersView, context=IVGroups, permission=MODERATE_MEETING, name='_potential_owners',
         renderer="skl_owner_groups:templates/potential_owners.pt"
@@ -85,3 +275,7 @@ def includeme(config):
         AssignPotentialOwnersForm, context=IVGroups, permission=MODERATE_MEETING, name='_import_potential_owners',
         renderer="arche:templates/form.pt"
     )
+    config.add_view(
+        ImportOwnersFileForm, context=IVGroups, permission=MODERATE_MEETING, name='_import_owners_file',
+        renderer="arche:templates/form.pt"
+    )
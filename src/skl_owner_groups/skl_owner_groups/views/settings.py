@@ -63,7 +63,7 @@ class CreateForm(BaseForm):
             self.flash_messages.add("Röstgrupperna finns redan", type="warning", require_commit=False)
             raise HTTPFound(location = self.request.resource_url(self.context, GROUPS_NAME))
         self.context[GROUPS_NAME] = vgroups = self.request.content_factories['VGroups']()
-        create_groups(vgroups, self.request)
+        create_groups(vgroups, self.request, year=appstruct.get('year') or None)
         return HTTPFound(location = self.request.resource_url(self.context, GROUPS_NAME))
 
     def cancel_failure(self, *args):
@@ -106,6 +106,12 @@ def includeme(config):
         title="Importera ansvariga",
         view_name="_import_potential_owners",
     )
+    config.add_view_action(
+        groups_context_cpanel,
+        'control_panel_vgroups', 'import_file',
+        title="Importera ansvariga från fil",
+        view_name="_import_owners_file",
+    )
     config.add_view_action(
         groups_context_cpanel,
         'control_panel_vgroups', 'list_potential',
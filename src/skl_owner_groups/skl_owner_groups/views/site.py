@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from arche.views.base import BaseView
+from pyramid.session import check_csrf_token
+from pyramid.view import view_config
+from voteit.core.models.interfaces import ISiteRoot
+from voteit.core.security import MANAGE_SERVER
+
+from skl_owner_groups.resources import get_potential_owner_index
+from skl_owner_groups.resources import rebuild_potential_owner_index
+
+
+@view_config(context=ISiteRoot, name="_potential_owner_index.json", permission=MANAGE_SERVER, renderer="json")
+class PotentialOwnerIndexView(BaseView):
+    """ Size of the site index of potential owners. POST to rebuild it from all meetings.
+        The POST needs the CSRF token, as the header X-CSRF-Token or the parameter csrf_token.
+    """
+
+    def __call__(self):
+        rebuilt = False
+        if self.request.method == 'POST':
+            check_csrf_token(self.request)
+            index = rebuild_potential_owner_index(self.context)
+            rebuilt = True
+        else:
+            index = get_potential_owner_index(self.context)
+        return {'emails': len(index),
+                'entries': sum(len(x) for x in index.values()),
+                'rebuilt': rebuilt}
+
+
+def includeme(config):
+    config.scan(__name__)
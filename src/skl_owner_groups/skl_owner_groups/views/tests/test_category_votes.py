@@ -24,6 +24,8 @@ class CategoryVotesViewsTests(TestCase):
         self.config.include('voteit.core.plugins.majority_poll')
         self.config.include('voteit.irl.models.meeting_presence')
         self.config.include('skl_owner_groups.resources')
+        self.config.include('skl_owner_groups.analyzers')
+        self.config.include('skl_owner_groups.results')
 
     def tearDown(self):
         testing.tearDown()
@@ -158,3 +160,61 @@ class CategoryVotesViewsTests(TestCase):
         view = get_view(poll, request, '_cat_votes_modal')
         response = view(poll, request)
         self.assertEqual(response.status_int, 200)
+
+    def test_closed_poll_uses_stored_results(self):
+        from skl_owner_groups.results import get_category_results
+        from skl_owner_groups.results import store_category_results
+        poll = self._majority_poll_fixture()
+        request = self._mk_request(poll)
+        store_category_results(poll, request.registry)
+        self.assertIsNotNone(get_category_results(poll))
+        # Votes added after close shouldn't be counted
+        vote = Vote()
+        vote.set_vote_data({'proposal': 'uid2'}, notify=False)
+        vote.category = 'kommun'
+        poll['late'] = vote
+        view = self._cut(poll, request)
+        view()
+        self.assertEqual(view.vote_count('uid2'), {'kommun': 4, 'region': 1, 'total': 5})
+        self.assertTrue(request.response.etag)
+        self.assertTrue(request.response.last_modified)
+
+    def test_closed_poll_not_modified(self):
+        from skl_owner_groups.results import store_category_results
+        poll = self._majority_poll_fixture()
+        request = self._mk_request(poll)
+        store_category_results(poll, request.registry)
+        view = self._cut(poll, request)
+        view()
+        etag = request.response.etag
+        request = self._mk_request(poll)
+        request.headers['If-None-Match'] = '"%s"' % etag
+        response = self._cut(poll, request)()
+        self.assertEqual(response.status_int, 304)
+
+    def test_clear_stored_results(self):
+        from skl_owner_groups.results import clear_category_results
+        from skl_owner_groups.results import get_category_results
+        from skl_owner_groups.results import store_category_results
+        poll = self._majority_poll_fixture()
+        request = self._mk_request(poll)
+        store_category_results(poll, request.registry)
+        clear_category_results(poll)
+        self.assertIsNone(get_category_results(poll))
+
+    def test_check_vote_tally_rebuild_needs_csrf(self):
+        from pyramid.exceptions import BadCSRFToken
+        from skl_owner_groups.tally import VoteTally
+        from skl_owner_groups.views.category_votes import CheckVoteTally
+        poll = self._majority_poll_fixture()
+        tally = VoteTally(poll)
+        tally.ensure()
+        tally.remove('1')
+        request = self._mk_request(poll)
+        request.method = 'POST'
+        self.assertRaises(BadCSRFToken, CheckVoteTally(poll, request))
+        self.assertTrue(tally.check())
+        request.headers['X-CSRF-Token'] = request.session.get_csrf_token()
+        response = CheckVoteTally(poll, request)()
+        self.assertTrue(response['rebuilt'])
+        self.assertEqual(tally.check(), {})
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import deform
+from six import string_types
+
+
+class ParticipantSearchWidget(deform.widget.Select2Widget):
+    """ Select2 that searches for meeting participants with AJAX instead of listing all of them.
+        values only needs to contain the empty choice and the current value.
+        A submitted value that isn't in values is added when the form is rendered again,
+        so a choice the validator rejected is still shown.
+
+        url: JSON view that accepts q and returns {'results': [{'id': ..., 'text': ...}]}
+        get_label: callable that returns the label for a userid, used for submitted values
+    """
+    template = 'skl_owner_groups:templates/widgets/participant_search'
+    url = None
+    min_length = 2
+    placeholder = "Sök på namn eller användarID"
+    get_label = None
+
+    def serialize(self, field, cstruct, **kw):
+        values = list(kw.get('values', self.values))
+        if cstruct and isinstance(cstruct, string_types) and cstruct not in dict(values):
+            values.append((cstruct, self.get_label(cstruct) if self.get_label else cstruct))
+            kw['values'] = values
+        return super(ParticipantSearchWidget, self).serialize(field, cstruct, **kw)